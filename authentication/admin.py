@@ -234,8 +234,8 @@ class UserPaymentMethodAdmin(admin.ModelAdmin):
 
 @admin.register(BasePaymentGateWay)
 class BasePaymentGateWayAdmin(admin.ModelAdmin):
-    list_display = ("id", "method", "method_uuid", "base_url", "callback_base_url", "created_at", "updated_at")
-    list_filter = ("method", "created_at")
+    list_display = ("id", "method", "method_uuid", "base_url", "callback_base_url", "weight", "is_active", "created_at", "updated_at")
+    list_filter = ("method", "is_active", "created_at")
     search_fields = ("method", "method_uuid", "base_url", "callback_base_url")
     ordering = ("-created_at",)
     readonly_fields = ("method_uuid", "created_at", "updated_at")
@@ -0,0 +1,158 @@
+from django.core.cache import cache
+from django.conf import settings
+from collections import OrderedDict
+from .models import APIKey, Merchant
+import hashlib, hmac, threading, time
+
+
+# Merchant fields kept with a credential: the ones the payment API, fee_policy
+# and the checkout session read. Anything else is loaded on first access.
+MERCHANT_FIELDS = ('id', 'merchant_id', 'is_active', 'brand_name', 'brand_logo', 'fees_type', 'deposit_fees', 'payout_fees', 'withdraw_fees',
+                   'rate_limit_per_minute', 'rate_limit_burst')
+# Cached in place of a credential for an unknown API-KEY, so guessing keys
+# doesn't cost a query per request. Keys are random, so a new key is never
+# hidden by it.
+UNKNOWN = False
+
+
+class LocalTTLCache:
+    """Small thread-safe LRU whose entries also expire after ttl seconds."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalTTLCache(settings.API_CREDENTIAL_LOCAL_SIZE, settings.API_CREDENTIAL_LOCAL_TTL)
+
+
+def _digest(secret):
+    return hashlib.sha256((secret or '').encode()).hexdigest()
+
+
+def _credential_key(api_key):
+    return f"api-credential:{_digest(api_key)}"
+
+
+def _merchant_key(merchant_pk):
+    return f"api-credential-of:{merchant_pk}"
+
+
+# ========================================Credential Resolver Start===================================
+def _load_credential(api_key):
+    row = (APIKey.objects
+           .filter(api_key=api_key)
+           .values('secret_key', 'is_active', *(f"merchant__{name}" for name in MERCHANT_FIELDS))
+           .first())
+    if row is None:
+        return None
+    return {
+        'secret_digest': _digest(row['secret_key']),
+        'is_active': row['is_active'],
+        'merchant': {name: row[f"merchant__{name}"] for name in MERCHANT_FIELDS},
+    }
+
+
+def _cached_credential(key):
+    """The cached credential, UNKNOWN, or None when neither cache has the key."""
+    credential = _local.get(key)
+    if credential is None:
+        credential = cache.get(key)
+        if credential is not None:
+            _local.set(key, credential)
+    return credential
+
+
+def _credential(api_key):
+    key = _credential_key(api_key)
+    credential = _cached_credential(key)
+    if credential is None:
+        credential = _load_credential(api_key)
+        if credential is None:
+            credential = UNKNOWN
+            cache.set(key, credential, settings.API_CREDENTIAL_LOCAL_TTL)
+        else:
+            cache.set(key, credential, settings.API_CREDENTIAL_CACHE_TTL)
+            cache.set(_merchant_key(credential['merchant']['id']), key, settings.API_CREDENTIAL_CACHE_TTL)
+        _local.set(key, credential)
+    return credential or None
+
+
+def resolve_merchant(api_key, secret_key):
+    """
+    Merchant for an API-KEY / SECRET-KEY pair, or None. Served from the
+    in-process LRU, then the shared cache, then the database; a warm call
+    runs no queries. The Merchant is built from the cached fields and loads
+    any other field lazily.
+    """
+    if not api_key or not secret_key:
+        return None
+    credential = _credential(api_key)
+    if credential is None or not credential['is_active']:
+        return None
+    if not hmac.compare_digest(credential['secret_digest'], _digest(secret_key)):
+        return None
+    fields = credential['merchant']
+    # from_db expects the loaded values in model field order.
+    names = [f.attname for f in Merchant._meta.concrete_fields if f.attname in fields]
+    return Merchant.from_db('default', names, [fields[name] for name in names])
+
+
+def api_rate_limit(api_key):
+    """
+    (requests per minute, burst) of the merchant owning api_key, read from
+    the credential caches only; None when the key is unknown or not cached
+    yet, so deciding never runs a query.
+    """
+    credential = _cached_credential(_credential_key(api_key)) if api_key else None
+    if not credential:
+        return None
+    merchant = credential['merchant']
+    return (merchant.get('rate_limit_per_minute') or settings.API_RATE_LIMIT_PER_MINUTE,
+            merchant.get('rate_limit_burst') or settings.API_RATE_LIMIT_BURST)
+
+
+def forget_merchant_credentials(merchant_pk, api_key=None):
+    """
+    Drops the cached credentials of a merchant: the key it was last cached
+    under, api_key and its current key. Other processes keep their local
+    copy for at most API_CREDENTIAL_LOCAL_TTL seconds.
+    """
+    keys = {cache.get(_merchant_key(merchant_pk))}
+    for value in [api_key, *APIKey.objects.filter(merchant_id=merchant_pk).values_list('api_key', flat=True)]:
+        if value:
+            keys.add(_credential_key(value))
+    keys.discard(None)
+    for key in keys:
+        _local.delete(key)
+    cache.delete_many([*keys, _merchant_key(merchant_pk)])
+
+# ========================================Credential Resolver End===================================
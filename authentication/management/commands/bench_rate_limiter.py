@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from authentication.throttling import take_token, rate_limit_window
+import math, statistics, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the token-bucket rate limiter against the configured cache (Redis when REDIS_URL is set). "
+            "Reports the overhead per request and checks that concurrent takers never exceed the bucket.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=20000, help="Calls per thread.")
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 8])
+        parser.add_argument('--per-minute', type=int, default=600)
+        parser.add_argument('--burst', type=int, default=100)
+
+    def _worker(self, key, calls, per_minute, burst):
+        allowed = 0
+        latencies = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            ok, _ = take_token(key, per_minute, burst)
+            latencies.append(time.perf_counter() - started)
+            allowed += ok
+        return allowed, latencies
+
+    def handle(self, *args, **options):
+        per_minute, burst = options['per_minute'], options['burst']
+        self.stdout.write(f"cache={settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1]}")
+        for threads in options['threads']:
+            key = f"bench-{uuid.uuid4().hex[:12]}"
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                futures = [pool.submit(self._worker, key, options['calls'], per_minute, burst) for _ in range(threads)]
+                results = [f.result() for f in futures]
+            elapsed = time.perf_counter() - started
+
+            allowed = sum(a for a, _ in results)
+            latencies = sorted(l for _, ls in results for l in ls)
+            # Every window the run touched, the first and last possibly in part.
+            ceiling = burst * (math.floor(elapsed / rate_limit_window(per_minute, burst)) + 2)
+            p50 = statistics.median(latencies) * 1e6
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+            self.stdout.write(
+                f"threads={threads:<3} calls={len(latencies):<7} calls/sec={len(latencies) / elapsed:,.0f} "
+                f"p50={p50:.1f}us p99={p99:.1f}us allowed={allowed} ceiling={ceiling:.0f} "
+                f"over_limit={'YES' if allowed > ceiling else 'no'}"
+            )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0007_alter_merchant_deposit_fees_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchantwallet',
+            name='storage_mode',
+            field=models.CharField(choices=[('row', 'Row'), ('ledger', 'Ledger')], default='row', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_merchantwallet_storage_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchantwallet',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=8),
+        ),
+        migrations.AlterField(
+            model_name='merchantwallet',
+            name='storage_mode',
+            field=models.CharField(choices=[('row', 'Row'), ('ledger', 'Ledger'), ('sharded', 'Sharded')], default='row', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_merchantwallet_shard_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchant',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:26
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_merchant_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basepaymentgateway',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+    ]
@@ -1,9 +1,10 @@
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from datetime import datetime
 from django.db import models
+from django.core.validators import MaxValueValidator
 import uuid, secrets, random, string, re
 
 
@@ -72,6 +73,9 @@ class Merchant(models.Model):
     payout_fees = models.DecimalField(max_digits=4, decimal_places=2)
     withdraw_fees = models.DecimalField(max_digits=4, decimal_places=2)
     is_active = models.BooleanField(default=True)
+    # Payment API token bucket; empty means API_RATE_LIMIT_PER_MINUTE / API_RATE_LIMIT_BURST.
+    rate_limit_per_minute = models.PositiveIntegerField(blank=True, null=True)
+    rate_limit_burst = models.PositiveIntegerField(blank=True, null=True)
     
     def genereate_merchant_id(self):
         # unique = False
@@ -116,15 +120,27 @@ class APIKey(models.Model):
         return f'API credential for {self.merchant.brand_name}'
 
 class MerchantWallet(models.Model):
+    STORAGE_MODE = (('row', 'Row'), ('ledger', 'Ledger'), ('sharded', 'Sharded'))
     merchant = models.OneToOneField(Merchant, on_delete=models.CASCADE, related_name='merchant_wallet')
     wallet_id = models.CharField(max_length=250, editable=False, unique=True)
     balance = models.DecimalField(max_digits=9, decimal_places=2, default=0)
     withdraw_processing = models.DecimalField(max_digits=9, decimal_places=2, default=0)
     total_withdraw = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    # row: every transaction rewrites the columns above.
+    # ledger: transactions append WalletLedgerEntry rows and the columns above
+    # are the last snapshot, advanced only by the compact_wallet_ledger command.
+    # sharded: credits land on one of shard_count MerchantWalletShard rows,
+    # debits and holds still go to the columns above.
+    storage_mode = models.CharField(max_length=10, choices=STORAGE_MODE, default='row')
+    shard_count = models.PositiveSmallIntegerField(default=8)
+    
+    def get_totals(self):
+        from core.wallet import wallet_totals
+        return wallet_totals(self)
     
     @property
     def available_balance(self):
-        return (self.balance or 0) - (self.withdraw_processing or 0)
+        return self.get_totals().available_balance
     
     def save(self, *args, **kwargs):
         if not self.wallet_id:
@@ -143,6 +159,18 @@ def create_api_key_and_wallet_for_merchant(sender, instance, created, **kwargs):
             MerchantWallet.objects.create(merchant=instance)
 
 
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+def forget_cached_api_credentials(sender, instance, **kwargs):
+    from .credentials import forget_merchant_credentials
+    if sender is APIKey:
+        forget_merchant_credentials(instance.merchant_id, api_key=instance.api_key)
+    else:
+        forget_merchant_credentials(instance.pk)
+
+
 class UserPaymentMethod(models.Model):
     METHOD_TYPE = (
         ('bkash', 'Bkash'),
@@ -212,6 +240,8 @@ class BasePaymentGateWay(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     is_active = models.BooleanField(default=True)
+    # Share of checkouts in rotation relative to the other gateways of the method; 0 takes it out.
+    weight = models.PositiveSmallIntegerField(default=1, validators=[MaxValueValidator(100)])
     
     def save(self, *args, **kwargs):
         if not self.method_uuid:
@@ -222,6 +252,13 @@ class BasePaymentGateWay(models.Model):
         return f"{self.method} - {self.method_uuid} | {self.details_json}"
 
 
+@receiver(post_save, sender=BasePaymentGateWay)
+@receiver(post_delete, sender=BasePaymentGateWay)
+def reload_gateway_registry(sender, instance, **kwargs):
+    from core.payment.registry import invalidate_gateways
+    invalidate_gateways()
+
+
 class SmsDeviceKey(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, related_name="staff_device_key", blank=True, null=True)
     device_name = models.CharField(max_length=50)
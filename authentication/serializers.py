@@ -4,6 +4,7 @@ from .utils import CustomLoginSerializer
 from rest_framework import serializers
 from django.db import transaction
 from rest_framework.exceptions import ValidationError
+from core.payment.breaker import circuit_status
 
 
 # ========================Authentication Token Serializer Start================================
@@ -167,6 +168,15 @@ class MerchantWalletSerializer(serializers.ModelSerializer):
     class Meta:
         model = MerchantWallet
         fields = ['balance', 'withdraw_processing', 'total_withdraw']
+    
+    def to_representation(self, instance):
+        totals = instance.get_totals()
+        return super().to_representation(MerchantWallet(
+            pk=instance.pk,
+            balance=totals.balance,
+            withdraw_processing=totals.withdraw_processing,
+            total_withdraw=totals.total_withdraw,
+        ))
 
 class UserIdSerializer(serializers.ModelSerializer):
     class Meta:
@@ -192,10 +202,14 @@ class APIKeySerializer(serializers.ModelSerializer):
 # ======================================================================================================
 # ========================================User Merchant Model Start================================
 class BasePaymentGateWaySerializer(serializers.ModelSerializer):
+    circuit = serializers.SerializerMethodField()
     class Meta:
         model = BasePaymentGateWay
         fields = "__all__"
         read_only_fields = ['method_uuid', 'created_at', 'updated_at']
+    
+    def get_circuit(self, obj):
+        return circuit_status(obj.method_uuid) if obj.method_uuid else None
 
 
 class StorePaymentMessageSerializer(serializers.ModelSerializer):
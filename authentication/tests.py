@@ -1,3 +1,134 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from core.testing import MerchantFixtureMixin
+from .models import APIKey
+from .credentials import resolve_merchant, _local
+from .throttling import take_token
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+
+# ========================================Credential Resolver Start===================================
+class CredentialResolverTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.merchant = self.create_merchant()
+        self.credential = APIKey.objects.get(merchant=self.merchant)
+
+    def resolve(self):
+        return resolve_merchant(self.credential.api_key, self.credential.secret_key)
+
+    def test_warm_lookup_runs_no_queries(self):
+        self.assertEqual(self.resolve().pk, self.merchant.pk)
+        with self.assertNumQueries(0):
+            merchant = self.resolve()
+            self.assertEqual(merchant.merchant_id, self.merchant.merchant_id)
+            self.assertEqual(merchant.deposit_fees, Decimal('2'))
+
+    def test_wrong_secret_is_rejected(self):
+        self.resolve()
+        self.assertIsNone(resolve_merchant(self.credential.api_key, 'wrong'))
+
+    def test_deactivating_key_invalidates_cache(self):
+        self.resolve()
+        self.credential.is_active = False
+        self.credential.save()
+        self.assertIsNone(self.resolve())
+
+    def test_merchant_save_refreshes_cached_fields(self):
+        self.resolve()
+        self.merchant.deposit_fees = Decimal('3')
+        self.merchant.save()
+        self.assertEqual(self.resolve().deposit_fees, Decimal('3'))
+
+# ========================================Credential Resolver End===================================
+
+
+# ========================================Rate Limit Start===================================
+@override_settings(ALLOWED_HOSTS=['*'], DEVICE_RATE_LIMIT_PER_MINUTE=60, DEVICE_RATE_LIMIT_BURST=1)
+class RateLimitTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.merchant = self.create_merchant(rate_limit_per_minute=60, rate_limit_burst=2)
+        self.credential = APIKey.objects.get(merchant=self.merchant)
+
+    def _create(self, api_key=None):
+        return self.client.post(
+            reverse('create-payment'), {}, content_type='application/json',
+            HTTP_API_KEY=api_key or self.credential.api_key, HTTP_SECRET_KEY=self.credential.secret_key,
+        )
+
+    def test_merchant_limit_rejects_without_queries(self):
+        resolve_merchant(self.credential.api_key, self.credential.secret_key)
+        with self._at(3000.5):  # 1.5 seconds before the merchant's 2 second window ends
+            self._create()
+            self._create()
+            with self.assertNumQueries(0):
+                response = self._create()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertFalse(response.json()['status'])
+
+    def test_buckets_are_per_key(self):
+        for _ in range(3):
+            self._create()
+        other = self._create(api_key='unknown-key')
+        self.assertNotEqual(other.status_code, 429)
+
+    @override_settings(API_RATE_LIMIT_PER_MINUTE=60, API_RATE_LIMIT_BURST=2)
+    def test_unknown_keys_share_a_bucket_per_ip(self):
+        self._create(api_key='junk-1')
+        self._create(api_key='junk-2')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._create(api_key='junk-3').status_code, 429)
+            self.assertEqual(self._create(api_key='junk-1').status_code, 429)
+        self.assertNotEqual(
+            self.client.post(reverse('create-payment'), {}, content_type='application/json',
+                             HTTP_API_KEY='junk-4', REMOTE_ADDR='10.0.0.2').status_code,
+            429,
+        )
+
+    def test_uncached_merchant_key_starts_in_the_ip_bucket(self):
+        # Its first request resolves and caches the credential; later ones use the merchant's bucket.
+        for _ in range(3):
+            self.assertNotEqual(self._create().status_code, 429)
+        self.assertEqual(self._create().status_code, 429)
+
+    @override_settings(API_RATE_LIMIT_PER_MINUTE=60, API_RATE_LIMIT_BURST=1)
+    def test_verify_is_not_limited_as_payout(self):
+        for _ in range(3):
+            verify = self.client.get(reverse('payment-verify'), {'invoice_payment_id': "x", 'status': 'check'}, HTTP_API_KEY='junk')
+            self.assertNotEqual(verify.status_code, 429)
+        payouts = [self.client.post(reverse('payment-payout'), {}, HTTP_API_KEY='junk').status_code for _ in range(2)]
+        self.assertEqual(payouts[1], 429)
+
+    def test_device_key_has_its_own_limit(self):
+        headers = {'HTTP_X_DEVICE_KEY': 'device-1', 'HTTP_X_DEVICE_PIN': '0000'}
+        self.assertNotEqual(self.client.post(reverse('store-payment-message-create'), {}, **headers).status_code, 429)
+        self.assertEqual(self.client.post(reverse('store-payment-message-create'), {}, **headers).status_code, 429)
+
+    def _at(self, now):
+        return mock.patch('authentication.throttling.time.time', return_value=now)
+
+    def test_bucket_refills(self):
+        with self._at(1000.25):
+            self.assertEqual(take_token('refill', 60, 1), (True, 0))
+            self.assertEqual(take_token('refill', 60, 1), (False, 1))
+        with self._at(1001.25):
+            self.assertEqual(take_token('refill', 60, 1), (True, 0))
+
+    def test_full_bucket_is_not_reset_by_concurrent_takers(self):
+        # 10 tokens per 10 second window: however the takers interleave, one count is shared.
+        with self._at(2000.0):
+            results = [take_token('shared', 60, 10) for _ in range(15)]
+        self.assertEqual(sum(allowed for allowed, _ in results), 10)
+        self.assertEqual(results[-1], (False, 10))
+        with self._at(2009.5):
+            self.assertEqual(take_token('shared', 60, 10), (False, 1))
+        with self._at(2010.0):
+            self.assertEqual(take_token('shared', 60, 10), (True, 0))
+
+# ========================================Rate Limit End===================================
@@ -0,0 +1,106 @@
+from django.core.cache import cache
+from django.conf import settings
+from django.http import JsonResponse
+from .credentials import api_rate_limit
+import hashlib, math, time
+
+
+# ========================================Token Bucket Start===================================
+def rate_limit_window(per_minute, burst):
+    """Seconds a full bucket takes to refill at per_minute."""
+    return burst * 60 / per_minute
+
+
+def take_token(key, per_minute, burst):
+    """
+    Takes one token from the bucket named key, which holds up to burst
+    tokens and refills at per_minute. Returns (allowed, retry_after_seconds).
+
+    The bucket is refilled a window (rate_limit_window) at a time: each
+    window is one cache counter, taken from with an atomic incr and created
+    with add, so concurrent requests in all processes share one count and
+    none can reset another's. At most burst pass per window, twice that
+    across a window boundary, and per_minute on average.
+    """
+    window = rate_limit_window(per_minute, burst)
+    now = time.time()
+    window_no = int(now // window)
+    count_key = f"rate-limit:{key}:{window_no}"
+    try:
+        taken = cache.incr(count_key)
+    except ValueError:
+        cache.add(count_key, 0, math.ceil(window) + 1)
+        taken = cache.incr(count_key)
+    if taken <= burst:
+        return True, 0
+    return False, max(1, math.ceil((window_no + 1) * window - now))
+
+# ========================================Token Bucket End===================================
+
+
+
+# ========================================Rate Limit Middleware Start===================================
+def _key_digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket limits for the machine-to-machine endpoints, applied before
+    the view runs so a rejected request never reaches the database:
+
+    - payment API views (API_RATE_LIMITED_VIEWS), one bucket per API-KEY with
+      the owning merchant's limits, read from the credential cache. Keys that
+      are unknown or not cached yet share one bucket per client IP with the
+      default limits, so a flood of made-up keys is rejected before the view
+      looks any of them up;
+    - device views (DEVICE_RATE_LIMITED_VIEWS), one bucket per X-Device-Key
+      with DEVICE_RATE_LIMIT_PER_MINUTE / DEVICE_RATE_LIMIT_BURST.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def _rule(self, request):
+        match = request.resolver_match
+        name = match.url_name if match else None
+        if name in settings.API_RATE_LIMITED_VIEWS:
+            api_key = request.headers.get("API-KEY")
+            limits = api_rate_limit(api_key)
+            if limits is not None:
+                return f"api:{_key_digest(api_key)}", *limits
+            return f"api-ip:{_key_digest(_client_ip(request))}", settings.API_RATE_LIMIT_PER_MINUTE, settings.API_RATE_LIMIT_BURST
+        elif name in settings.DEVICE_RATE_LIMITED_VIEWS:
+            device_key = request.headers.get("X-Device-Key")
+            if device_key:
+                return f"device:{_key_digest(device_key)}", settings.DEVICE_RATE_LIMIT_PER_MINUTE, settings.DEVICE_RATE_LIMIT_BURST
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.API_RATE_LIMIT_ENABLED:
+            return None
+        rule = self._rule(request)
+        if rule is None:
+            return None
+        allowed, retry_after = take_token(*rule)
+        if allowed:
+            return None
+        response = JsonResponse(
+            {
+                'status': False,
+                'message': f"Too many requests. Try again in {retry_after} seconds."
+            }, status=429
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+# ========================================Rate Limit Middleware End===================================
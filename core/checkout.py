@@ -0,0 +1,238 @@
+from django.core.cache import cache
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.urls import reverse
+from django.utils.http import parse_etags
+from .utils import logo_path
+import hashlib, uuid
+
+
+TERMINAL_PAY_STATUS = ('paid', 'failed', 'cancelled')
+# A terminal invoice never changes what the status endpoints return.
+TERMINAL_CACHE_CONTROL = "private, max-age=31536000, immutable"
+OPEN_CACHE_CONTROL = "private, no-cache"
+# (method, url name, query) of every method offered on the checkout page, in display order.
+CHECKOUT_METHODS = (
+    ('bkash', 'get-payment-bkash', "?invoice_payment_id={id}&redirect=1"),
+    ('bkash-personal', 'bkash-manual-payment', "?method=bkash-personal&invoice_payment_id={id}"),
+    ('bkash-agent', 'bkash-manual-payment', "?method=bkash-agent&invoice_payment_id={id}"),
+    ('nagad-personal', 'nagad-manual-payment', "?method=nagad-personal&invoice_payment_id={id}"),
+    ('nagad-agent', 'nagad-manual-payment', "?method=nagad-agent&invoice_payment_id={id}"),
+    ('rocket-personal', 'rocket-manual-payment', "?method=rocket-personal&invoice_payment_id={id}"),
+    ('rocket-agent', 'rocket-manual-payment', "?method=rocket-agent&invoice_payment_id={id}"),
+)
+
+
+def checkout_session_key(invoice_payment_id):
+    return f"checkout-session:{invoice_payment_id}"
+
+
+def invoice_status_key(invoice_payment_id):
+    return f"invoice-status:{invoice_payment_id}"
+
+
+def checkout_version_key(invoice_payment_id):
+    return f"checkout-version:{invoice_payment_id}"
+
+
+# ========================================Checkout Version Start===================================
+# Every cached checkout session and status entry carries the invoice's
+# version token as it was before the invoice was read, and is only served
+# while the token is unchanged. Invoice.save replaces the token after commit,
+# so a reader that loaded the invoice before a concurrent save committed, and
+# caches it after the save dropped the old entries, leaves entries nobody serves.
+# A missing token (never set, expired or evicted) serves nothing; a reader
+# claims one only once it has loaded the invoice, so polling unknown ids
+# writes nothing to the cache.
+def new_checkout_version():
+    return uuid.uuid4().hex
+
+
+def checkout_version_ttl():
+    """Tokens outlive every entry stamped with them."""
+    return max(settings.CHECKOUT_SESSION_TTL, settings.CHECKOUT_TERMINAL_TTL)
+
+
+def _claim_version(invoice_payment_id, version):
+    """
+    The token to stamp a loaded invoice's entries with: version when one was
+    read, else a fresh token if none has been set since, else None (a save
+    replaced it meanwhile, so the entries must not be stored).
+    """
+    if version is not None:
+        return version
+    version = new_checkout_version()
+    if cache.add(checkout_version_key(invoice_payment_id), version, checkout_version_ttl()):
+        return version
+    return None
+
+
+def _current(value, version):
+    """The cached payload when it was stamped with version, else None."""
+    if value is None or version is None or value.get('version') != version:
+        return None
+    return value['data']
+
+
+def _stamped(data, version):
+    return {'version': version, 'data': data}
+
+# ========================================Checkout Version End===================================
+
+
+# ========================================Checkout Session Start===================================
+def checkout_methods(invoice_payment_id):
+    return [
+        {'method': method, 'url': reverse(name) + query.format(id=invoice_payment_id)}
+        for method, name, query in CHECKOUT_METHODS
+    ] + [{"method": "bank", "url": "Bank"}]
+
+
+def build_checkout_session(invoice, merchant=None):
+    """
+    Everything the checkout page shows for an invoice. URLs are kept without
+    the host, so one session serves whichever host the page is opened on.
+    """
+    merchant = merchant if merchant is not None else invoice.merchant
+    return {
+        'amount': f"{invoice.customer_amount}",
+        'brand_name': merchant.brand_name if merchant else None,
+        'brand_logo': logo_path(getattr(merchant, 'brand_logo', None)),
+        'payment_methods': checkout_methods(invoice.invoice_payment_id),
+    }
+
+
+def store_checkout_sessions(invoices, merchant=None, version=None, created=False):
+    """
+    Caches the checkout sessions (and statuses) of open invoices once the
+    surrounding transaction commits, so a rolled back invoice never gets one.
+    Created invoices each get a fresh token; otherwise version is the token
+    read before a single existing invoice was loaded (None when it had none).
+    Returns the sessions by checkout_session_key.
+    """
+    sessions, entries, versions = {}, {}, {}
+    for invoice in invoices:
+        if not is_terminal(invoice.pay_status):
+            session = build_checkout_session(invoice, merchant)
+            sessions[checkout_session_key(invoice.invoice_payment_id)] = session
+            if created:
+                stamp = versions[checkout_version_key(invoice.invoice_payment_id)] = new_checkout_version()
+            else:
+                stamp = _claim_version(invoice.invoice_payment_id, version)
+                if stamp is None:
+                    continue
+            entries[checkout_session_key(invoice.invoice_payment_id)] = _stamped(session, stamp)
+            entries[invoice_status_key(invoice.invoice_payment_id)] = _stamped(invoice_status(invoice), stamp)
+
+    def store():
+        if versions:
+            cache.set_many(versions, checkout_version_ttl())
+        cache.set_many(entries, settings.CHECKOUT_SESSION_TTL)
+
+    if entries:
+        transaction.on_commit(store)
+    return sessions
+
+
+def get_checkout_state(invoice_payment_id):
+    """
+    The cached (checkout session, status entry) of an invoice and its current
+    version token (None when unset), in one cache read.
+    """
+    keys = checkout_session_key(invoice_payment_id), invoice_status_key(invoice_payment_id), checkout_version_key(invoice_payment_id)
+    found = cache.get_many(keys)
+    version = found.get(keys[2])
+    return _current(found.get(keys[0]), version), _current(found.get(keys[1]), version), version
+
+
+async def aget_checkout_state(invoice_payment_id):
+    keys = checkout_session_key(invoice_payment_id), invoice_status_key(invoice_payment_id), checkout_version_key(invoice_payment_id)
+    found = await cache.aget_many(keys)
+    version = found.get(keys[2])
+    return _current(found.get(keys[0]), version), _current(found.get(keys[1]), version), version
+
+
+def forget_checkout_session(invoice_payment_id):
+    """
+    Replaces the invoice's version token once the change commits, so no
+    entry cached from an earlier read is served again, and drops the entries.
+    """
+    keys = [checkout_session_key(invoice_payment_id), invoice_status_key(invoice_payment_id)]
+
+    def forget():
+        cache.set(checkout_version_key(invoice_payment_id), new_checkout_version(), checkout_version_ttl())
+        cache.delete_many(keys)
+
+    transaction.on_commit(forget)
+
+# ========================================Checkout Session End===================================
+
+
+
+# ========================================Invoice Status Start===================================
+def is_terminal(pay_status):
+    return (pay_status or '').lower() in TERMINAL_PAY_STATUS
+
+
+def invoice_etag(invoice):
+    """
+    ETag of everything the status endpoints show that can change: the
+    pay_status, transaction_id and, while the invoice is open, the amount.
+    """
+    state = f"{invoice.invoice_payment_id}:{invoice.pay_status}:{invoice.transaction_id or ''}:{invoice.customer_amount}"
+    return f'"{hashlib.sha1(state.encode()).hexdigest()[:24]}"'
+
+
+def invoice_status(invoice):
+    return {'etag': invoice_etag(invoice), 'pay_status': invoice.pay_status}
+
+
+def get_invoice_status(invoice_payment_id):
+    """The cached status entry of an invoice (or None) and its current version token (None when unset)."""
+    keys = invoice_status_key(invoice_payment_id), checkout_version_key(invoice_payment_id)
+    found = cache.get_many(keys)
+    version = found.get(keys[1])
+    return _current(found.get(keys[0]), version), version
+
+
+async def aget_invoice_status(invoice_payment_id):
+    keys = invoice_status_key(invoice_payment_id), checkout_version_key(invoice_payment_id)
+    found = await cache.aget_many(keys)
+    version = found.get(keys[1])
+    return _current(found.get(keys[0]), version), version
+
+
+def store_invoice_status(invoice, version):
+    """
+    Caches the invoice's status entry under version, the token read before
+    the invoice was loaded (None when it had none); for CHECKOUT_TERMINAL_TTL
+    once it is terminal. Returns the entry.
+    """
+    entry = invoice_status(invoice)
+    version = _claim_version(invoice.invoice_payment_id, version)
+    if version is None:
+        return entry
+    timeout = settings.CHECKOUT_TERMINAL_TTL if is_terminal(invoice.pay_status) else settings.CHECKOUT_SESSION_TTL
+    transaction.on_commit(lambda: cache.set(invoice_status_key(invoice.invoice_payment_id), _stamped(entry, version), timeout))
+    return entry
+
+
+def etag_matches(request, entry):
+    if entry is None:
+        return False
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or entry['etag'] in etags
+
+
+def with_status_headers(response, entry):
+    if entry is not None and response.status_code in (200, 304):
+        response['ETag'] = entry['etag']
+        response['Cache-Control'] = TERMINAL_CACHE_CONTROL if is_terminal(entry['pay_status']) else OPEN_CACHE_CONTROL
+    return response
+
+
+def not_modified(entry):
+    return with_status_headers(HttpResponseNotModified(), entry)
+
+# ========================================Invoice Status End===================================
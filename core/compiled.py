@@ -0,0 +1,114 @@
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+import functools
+
+
+# Fields whose representation of a database value is the value itself.
+IDENTITY_FIELDS = (
+    serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.BooleanField, serializers.ReadOnlyField, PrimaryKeyRelatedField,
+)
+
+
+# ========================================Compiled Serializer Start===================================
+class CompiledPlan:
+    """
+    A read serializer flattened to one values_list() lookup and converter
+    per output field, so list endpoints turn row tuples into dicts without
+    building model instances or calling the serializer per row.
+    """
+    def __init__(self, names, lookups, converters):
+        self.names = names
+        self.lookups = lookups
+        self.steps = tuple(enumerate(converters))
+
+    def values(self, queryset):
+        return queryset.values_list(*self.lookups)
+
+    def rows(self, rows):
+        names, steps = self.names, self.steps
+        return [
+            dict(zip(names, [row[i] if convert is None else convert(row[i]) for i, convert in steps]))
+            for row in rows
+        ]
+
+    def data(self, queryset):
+        return self.rows(self.values(queryset))
+
+
+def skip_none(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+def field_converter(field):
+    """(False, None) when the field can not be read from a plain column value."""
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not (field.localize or field.normalize_output or field.rounding) and field.decimal_places is not None:
+            spec = f'.{field.decimal_places}f'
+            return True, skip_none(lambda value: format(value, spec))
+        return True, skip_none(field.to_representation)
+    if isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.TimeField)):
+        return True, skip_none(field.to_representation)
+    if isinstance(field, serializers.JSONField):
+        return (False, None) if field.binary else (True, None)
+    if isinstance(field, serializers.ChoiceField):
+        # Only plain string choices come back unchanged from the database.
+        if all(isinstance(key, str) for key in field.choices):
+            return True, None
+        return False, None
+    if isinstance(field, IDENTITY_FIELDS) and not isinstance(field, serializers.FileField):
+        return True, None
+    return False, None
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_plan(serializer_class):
+    """
+    The CompiledPlan of a read serializer, built once per class, or None when
+    one of its fields needs the instance (files, nested or hyperlinked
+    relations, method fields without a compiled_sources entry).
+    compiled_sources maps a SerializerMethodField to (lookup, converter).
+    """
+    sources = getattr(serializer_class, 'compiled_sources', {})
+    names, lookups, converters = [], [], []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in sources:
+                return None
+            lookup, convert = sources[name]
+        else:
+            if field.source == '*':
+                return None
+            supported, convert = field_converter(field)
+            if not supported:
+                return None
+            lookup = '__'.join(field.source_attrs)
+        names.append(name)
+        lookups.append(lookup)
+        converters.append(convert)
+    return CompiledPlan(tuple(names), tuple(lookups), tuple(converters))
+
+
+class CompiledListMixin:
+    """
+    For list() of the payment viewsets: list_rows() swaps the queryset for
+    values_list() rows when the serializer compiles, list_data() turns a
+    page of either kind into the serializer's output.
+    """
+    list_plan = None
+
+    def list_rows(self, queryset):
+        self.list_plan = compiled_plan(self.get_serializer_class()) if settings.COMPILED_LIST_SERIALIZERS else None
+        return queryset if self.list_plan is None else self.list_plan.values(queryset)
+
+    def list_data(self, rows):
+        if self.list_plan is None:
+            return self.get_serializer(rows, many=True).data
+        return self.list_plan.rows(rows)
+
+# ========================================Compiled Serializer End===================================
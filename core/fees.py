@@ -0,0 +1,113 @@
+from authentication.models import Merchant
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from decimal import Decimal
+from array import array
+
+
+FEE_BUCKETS = ('deposit', 'payout', 'withdraw', 'other')
+DEFAULT_RATE = Decimal('10')  # fallback percentage when fees_type is unknown
+OTHER_FEE = Decimal('5')  # debits that are neither a payout nor a withdrawal
+
+
+def to_cents(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value or '0'))
+    return int(value.scaleb(2).to_integral_value())
+
+
+def _round_div(numerator, denominator):
+    """Integer division rounded half-even, the same rounding DecimalField uses when saving."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+# ========================================Fee Policy Start===================================
+class FeePolicy:
+    """
+    A merchant's fee settings parsed once. Fees are worked out in integer
+    cents, so the scalar and batch APIs give identical, exact results.
+
+    Deposits take the fee out of the paid amount (net = amount - fee); payouts
+    and withdrawals add it on top of the requested amount (total = amount + fee).
+    """
+    __slots__ = ('source', 'is_percentage', 'rates')
+
+    def __init__(self, fees_type, deposit_fees, payout_fees, withdraw_fees):
+        self.source = (fees_type, deposit_fees, payout_fees, withdraw_fees)
+        kind = (fees_type or '').lower()
+        self.is_percentage = kind != 'flat'
+        if kind in ('percentage', 'parcentage', 'flat'):
+            values = (deposit_fees, payout_fees, withdraw_fees, OTHER_FEE)
+        else:
+            values = (DEFAULT_RATE,) * 4
+        # Percentages are kept in hundredths of a percent, flat fees in cents.
+        self.rates = dict(zip(FEE_BUCKETS, (to_cents(v) for v in values)))
+
+    @classmethod
+    def from_merchant(cls, merchant):
+        return cls(merchant.fees_type, merchant.deposit_fees, merchant.payout_fees, merchant.withdraw_fees)
+
+    def fee_cents(self, bucket, amount_cents):
+        rate = self.rates[bucket]
+        if not self.is_percentage:
+            return rate
+        return _round_div(amount_cents * rate, 10000)
+
+    # ------- scalar -------
+    def fee(self, bucket, amount):
+        return Decimal(self.fee_cents(bucket, to_cents(amount))).scaleb(-2)
+
+    def deposit(self, amount):
+        """Returns (fee, net_amount) for a paid amount."""
+        fee = self.fee('deposit', amount)
+        return fee, Decimal(str(amount)) - fee
+
+    def debit(self, bucket, net_amount):
+        """Returns (fee, amount) where amount is what leaves the wallet."""
+        fee = self.fee(bucket, net_amount)
+        return fee, Decimal(str(net_amount)) + fee
+
+    # ------- batch -------
+    def fee_cents_many(self, bucket, amount_cents):
+        """Fees in cents for an iterable of amounts in cents, as an array('q')."""
+        rate = self.rates[bucket]
+        if not self.is_percentage:
+            return array('q', [rate]) * len(amount_cents)
+        return array('q', [_round_div(cents * rate, 10000) for cents in amount_cents])
+
+    def fees(self, bucket, amounts):
+        """Fees for many Decimal amounts; exact to the cent."""
+        cents = array('q', [to_cents(a) for a in amounts])
+        return [Decimal(fee).scaleb(-2) for fee in self.fee_cents_many(bucket, cents)]
+
+
+_policies = {}
+
+
+def fee_policy(merchant):
+    """
+    Cached FeePolicy for a merchant. The cache is cleared on Merchant save, and
+    an entry built from other field values (e.g. saved by another process) is
+    rebuilt on sight.
+    """
+    if merchant is None:
+        return None
+    source = (merchant.fees_type, merchant.deposit_fees, merchant.payout_fees, merchant.withdraw_fees)
+    policy = _policies.get(merchant.pk)
+    if policy is None or policy.source != source:
+        policy = FeePolicy(*source)
+        if merchant.pk:
+            _policies[merchant.pk] = policy
+    return policy
+
+
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+def clear_fee_policy(sender, instance, **kwargs):
+    _policies.pop(instance.pk, None)
+
+# ========================================Fee Policy End===================================
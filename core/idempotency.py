@@ -0,0 +1,115 @@
+from rest_framework.response import Response
+from rest_framework import status
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+import datetime, hashlib, json
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _hash(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return _hash(json.dumps([request.method, request.path, data], sort_keys=True, default=str))
+
+
+def _replay(row):
+    response = Response(row.response_body, status=row.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _mismatch():
+    return Response(
+        {
+            'status': False,
+            'message': f"This {IDEMPOTENCY_HEADER} was already used with a different request."
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY
+    )
+
+
+def _storable(response):
+    # Failed calls are not stored, so the client can retry them with the same key.
+    if response.status_code >= 400 or not isinstance(response.data, dict):
+        return False
+    return response.data.get('status', True) is not False
+
+
+# ========================================Idempotent Request Start===================================
+def idempotent(request, merchant, handler):
+    """
+    Runs handler() once per (merchant, Idempotency-Key) and replays the stored
+    response for any repeat within IDEMPOTENCY_KEY_TTL. Requests without the
+    header just run handler().
+
+    A replay is one indexed read. Otherwise the key row is inserted up front
+    in the handler's transaction, so a concurrent duplicate blocks on the
+    unique index until the first request commits (and then replays it) or
+    rolls back (and then runs itself).
+    """
+    from .models import IdempotencyKey
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {
+                'status': False,
+                'message': f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."
+            }, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    lookup = {'merchant_id': merchant.pk, 'key_hash': _hash(key)}
+    fingerprint = request_fingerprint(request)
+    now = timezone.now()
+
+    stored = IdempotencyKey.objects.filter(**lookup, expires_at__gt=now).first()
+    if stored is not None and stored.response_body is not None:
+        return _replay(stored) if stored.request_hash == fingerprint else _mismatch()
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                row = IdempotencyKey.objects.create(
+                    **lookup, request_hash=fingerprint,
+                    expires_at=now + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+        except IntegrityError:
+            row = IdempotencyKey.objects.select_for_update().get(**lookup)
+            if row.expires_at > now and row.response_body is not None:
+                return _replay(row) if row.request_hash == fingerprint else _mismatch()
+            # An expired key is taken over by this request.
+            row.request_hash = fingerprint
+            row.response_body = None
+            row.expires_at = now + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+        response = handler()
+        if not _storable(response):
+            transaction.set_rollback(True)
+            return response
+        row.status_code = response.status_code
+        row.response_body = response.data
+        row.save()
+        return response
+
+
+def expire_idempotency_keys(chunk_size=1000):
+    """Deletes expired keys chunk by chunk, so no delete holds many row locks. Returns the count."""
+    from .models import IdempotencyKey
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+# ========================================Idempotent Request End===================================
@@ -0,0 +1,101 @@
+"""
+A stand-in bKash tokenized checkout API for the benchmark commands: a raw
+ASGI app answering token/grant, create, execute and payment/status after a
+fixed delay, so gateway latency can be simulated without the sandbox.
+
+    uvicorn core.management.commands._bkash_stub:app --port 9100
+
+BKASH_STUB_LATENCY_MS sets the delay (default 200). free_port() and
+serve() start it (or the project itself) under uvicorn for a benchmark.
+"""
+import asyncio, httpx, json, os, socket, subprocess, sys, time, uuid
+
+
+LATENCY = int(os.getenv('BKASH_STUB_LATENCY_MS', '200')) / 1000
+
+
+def _grant(body):
+    return {"id_token": uuid.uuid4().hex, "refresh_token": uuid.uuid4().hex, "token_type": "Bearer", "expires_in": 3600}
+
+
+def _create(body):
+    payment_id = f"TR{uuid.uuid4().hex[:16].upper()}"
+    return {
+        "paymentID": payment_id,
+        "bkashURL": f"https://sandbox.bka.sh/checkout?paymentId={payment_id}",
+        "amount": body.get("amount"),
+        "merchantInvoiceNumber": body.get("merchantInvoiceNumber"),
+        "transactionStatus": "Initiated",
+        "statusCode": "0000",
+    }
+
+
+def _execute(body):
+    return {
+        "paymentID": body.get("paymentID"),
+        "trxID": uuid.uuid4().hex[:10].upper(),
+        "transactionStatus": "Completed",
+        "statusCode": "0000",
+    }
+
+
+def _status(body):
+    return {"paymentID": body.get("paymentID"), "transactionStatus": "Completed", "statusCode": "0000"}
+
+
+ROUTES = {
+    'token/grant': _grant,
+    'token/refresh': _grant,
+    'create': _create,
+    'execute': _execute,
+    'payment/status': _status,
+}
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while (await receive())['type'] != 'lifespan.shutdown':
+            await send({'type': 'lifespan.startup.complete'})
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+    raw = await _read_body(receive)
+    handler = next((h for suffix, h in ROUTES.items() if scope['path'].rstrip('/').endswith(suffix)), None)
+    await asyncio.sleep(LATENCY)
+    if handler is None:
+        status, payload = 404, {"statusCode": "404", "statusMessage": "Not found"}
+    else:
+        status, payload = 200, handler(json.loads(raw or b'{}'))
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port, env, *extra, scheme='http'):
+    """Runs app under uvicorn on 127.0.0.1:port and waits until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', app, '--port', str(port), '--log-level', 'warning', *extra],
+        env={**os.environ, **env},
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"{scheme}://127.0.0.1:{port}/", timeout=1, verify=False)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{app} did not start on port {port}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from core.models import PendingWalletCredit
+from core.wallet import apply_pending_credits
+import time
+
+
+class Command(BaseCommand):
+    help = "Apply queued paid-invoice credits (WALLET_CREDIT_BATCHING) per merchant, one wallet update per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep running and poll for new credits.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between passes with --loop.")
+
+    def run_once(self, batch_size):
+        applied = 0
+        merchant_ids = (PendingWalletCredit.objects
+                        .filter(applied_at__isnull=True)
+                        .values_list('merchant_id', flat=True)
+                        .distinct())
+        for merchant_id in list(merchant_ids):
+            while True:
+                count = apply_pending_credits(merchant_id, batch_size=batch_size)
+                applied += count
+                if count < batch_size:
+                    break
+        return applied
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            applied = self.run_once(options['batch_size'])
+            if applied:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Applied {applied} credits in {elapsed:.2f}s")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,62 @@
+from authentication.models import MerchantWallet
+from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+from core.wallet import WALLET_FIELDS, replay_wallet, repair_wallet, wallet_totals
+from django.db import connections
+import os, time
+
+
+def _close_connections():
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+
+
+def _audit_wallet(job):
+    wallet_id, chunk_size, repair = job
+    rows, expected = replay_wallet(wallet_id, chunk_size)
+    actual = wallet_totals(MerchantWallet.objects.get(pk=wallet_id))
+    drift = {name: getattr(expected, name) - getattr(actual, name) for name in WALLET_FIELDS}
+    repaired = False
+    if any(drift.values()) and repair:
+        drift = repair_wallet(wallet_id, chunk_size)._asdict()
+        repaired = True
+    return wallet_id, rows, drift, repaired
+
+
+class Command(BaseCommand):
+    help = ("Replay WalletTransaction history per wallet and report wallets whose balance, "
+            "withdraw_processing or total_withdraw drifted from it. --repair moves the wallet to the replayed state.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows fetched per round trip while streaming.")
+        parser.add_argument('--merchant', type=int, nargs='+', help="Only audit these merchant ids.")
+        parser.add_argument('--repair', action='store_true')
+
+    def handle(self, *args, **options):
+        wallets = MerchantWallet.objects.order_by('pk')
+        if options['merchant']:
+            wallets = wallets.filter(merchant_id__in=options['merchant'])
+        merchant_of = dict(wallets.values_list('pk', 'merchant_id'))
+        jobs = [(wallet_id, options['chunk_size'], options['repair']) for wallet_id in merchant_of]
+
+        started = time.perf_counter()
+        total_rows = drifted = 0
+        _close_connections()
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1), initializer=_close_connections) as pool:
+            for wallet_id, rows, drift, repaired in pool.map(_audit_wallet, jobs, chunksize=16):
+                total_rows += rows
+                if not any(drift.values()):
+                    continue
+                drifted += 1
+                details = " ".join(f"{name}={delta:+}" for name, delta in drift.items() if delta)
+                self.stdout.write(
+                    f"merchant={merchant_of[wallet_id]} wallet={wallet_id} {details}"
+                    f"{' (repaired)' if repaired else ''}"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Audited {len(jobs)} wallets / {total_rows} transactions in {elapsed:.2f}s "
+            f"({total_rows / elapsed if elapsed else 0:,.0f} rows/sec), {drifted} drifted."
+        )
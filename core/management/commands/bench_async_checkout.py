@@ -0,0 +1,99 @@
+from authentication.models import BasePaymentGateWay, CustomUser, Merchant
+from core.models import Invoice
+from django.core.management.base import BaseCommand
+from ._bkash_stub import free_port, serve
+from django.urls import reverse
+from decimal import Decimal
+import asyncio, httpx, statistics, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Benchmark get-payment/bkash/ served by WSGI worker threads (sync views) against ASGI with "
+            "ASYNC_CHECKOUT (async views), with bKash replaced by a stub answering after --latency-ms. "
+            "Reports requests/sec and latency at each concurrency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help="Requests per run.")
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 50, 200])
+        parser.add_argument('--latency-ms', type=int, default=200, help="Delay of every stub bKash call.")
+
+    def _setup(self, stub_url, count):
+        user = CustomUser.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}", first_name="Bench", phone_number="0")
+        merchant = Merchant.objects.create(
+            user=user, brand_name="Bench", fees_type='Flat',
+            deposit_fees=Decimal('0'), payout_fees=Decimal('0'), withdraw_fees=Decimal('0'),
+        )
+        gateway = BasePaymentGateWay.objects.create(
+            method='bkash', base_url=f"{stub_url}/", callback_base_url="http://127.0.0.1",
+            details_json={'app_key': 'k', 'app_secret': 's', 'username': 'u', 'password': 'p'},
+        )
+        others = BasePaymentGateWay.objects.filter(method='bkash', is_active=True).exclude(pk=gateway.pk).count()
+        if others:
+            self.stderr.write(f"{others} other active bkash gateway(s) will also receive bench traffic.")
+        invoices = Invoice.create_many([
+            Invoice(merchant=merchant, customer_name=f"Customer {n}", customer_number='01700000000',
+                    customer_amount=Decimal('100.00'), customer_order_id=f"bench-{n}", method='bkash')
+            for n in range(count)
+        ])
+        return merchant, gateway, [invoice.invoice_payment_id for invoice in invoices]
+
+    async def _load(self, base_url, ids, concurrency):
+        latencies, failures, errors = [], 0, set()
+        queue = iter(ids)
+        url = base_url + reverse('get-payment-bkash')
+
+        async def worker(client):
+            nonlocal failures
+            for invoice_payment_id in queue:
+                started = time.perf_counter()
+                response = await client.get(url, params={'invoice_payment_id': invoice_payment_id})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or 'paymentID' not in response.text:
+                    failures += 1
+                    errors.add(f"{response.status_code} {response.text[:200]}")
+
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            return time.perf_counter() - started, sorted(latencies), failures, errors
+
+    def _report(self, label, concurrency, elapsed, latencies, failures, errors):
+        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+        self.stdout.write(
+            f"{label:<5} concurrency={concurrency:<4} requests={len(latencies):<5} req/sec={len(latencies) / elapsed:,.1f} "
+            f"p50={statistics.median(latencies) * 1000:.0f}ms p99={p99 * 1000:.0f}ms failures={failures}"
+        )
+        for error in sorted(errors)[:3]:
+            self.stderr.write(f"  {error}")
+
+    def handle(self, *args, **options):
+        stub_port = free_port()
+        stub = serve('core.management.commands._bkash_stub:app', stub_port,
+                           {'BKASH_STUB_LATENCY_MS': str(options['latency_ms'])})
+        total = options['requests'] * len(options['concurrency'])
+        merchant, gateway, ids = self._setup(f"http://127.0.0.1:{stub_port}", total)
+        servers = (
+            # uvicorn runs a WSGI app on a pool of 10 worker threads.
+            ('wsgi', 'zeonixpay.wsgi:application', {'ASYNC_CHECKOUT': 'False'}, ('--interface', 'wsgi')),
+            ('asgi', 'zeonixpay.asgi:application', {'ASYNC_CHECKOUT': 'True'}, ()),
+        )
+        env = {'ALLOWED_HOSTS': '*', 'API_RATE_LIMIT_ENABLED': 'False'}
+        try:
+            for label, app, flags, extra in servers:
+                port = free_port()
+                server = serve(app, port, {**env, **flags}, *extra)
+                try:
+                    for n, concurrency in enumerate(options['concurrency']):
+                        batch = ids[n * options['requests']:(n + 1) * options['requests']]
+                        result = asyncio.run(self._load(f"http://127.0.0.1:{port}", batch, concurrency))
+                        self._report(label, concurrency, *result)
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            stub.terminate()
+            stub.wait()
+            merchant.invoices.all().delete()
+            merchant.user.delete()
+            gateway.delete()
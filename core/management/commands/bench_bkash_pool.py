@@ -0,0 +1,84 @@
+from authentication.models import BasePaymentGateWay
+from core.payment.bkash import BKashClient
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from ._bkash_stub import free_port, serve
+import datetime, ipaddress, os, statistics, tempfile, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Benchmark BKashClient create+execute against the local bKash stub over TLS, "
+            "with a new connection per call (requests.post) and with the pooled per-gateway session. "
+            "Reports p50/p99 latency of each create+execute pair.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help="create+execute pairs per run.")
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8])
+        parser.add_argument('--latency-ms', type=int, default=5, help="Delay of every stub bKash call.")
+
+    def _certificate(self, directory):
+        """A self-signed certificate for 127.0.0.1, so every new connection pays a real TLS handshake."""
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1)).not_valid_after(now + datetime.timedelta(hours=1))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .sign(key, hashes.SHA256())
+        )
+        key_file, cert_file = os.path.join(directory, 'key.pem'), os.path.join(directory, 'cert.pem')
+        with open(key_file, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        with open(cert_file, 'wb') as f:
+            f.write(certificate.public_bytes(serialization.Encoding.PEM))
+        return key_file, cert_file
+
+    def _checkout(self, client, n):
+        started = time.perf_counter()
+        created = client.create_payment(
+            amount="100.00", intent="sale", merchant_invoice_number=f"bench-{n}", callback_url="https://pay.invalid/",
+        )
+        client.execute_payment(created["paymentID"])
+        return time.perf_counter() - started
+
+    def _run(self, client, count, concurrency):
+        self._checkout(client, 0)  # grants the token (and opens the pool)
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            latencies = sorted(pool.map(lambda n: self._checkout(client, n), range(count)))
+            return time.perf_counter() - started, latencies
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            key_file, cert_file = self._certificate(directory)
+            # requests reads the CA bundle from the environment for requests.post and sessions alike.
+            os.environ['REQUESTS_CA_BUNDLE'] = cert_file
+            port = free_port()
+            stub = serve('core.management.commands._bkash_stub:app', port,
+                         {'BKASH_STUB_LATENCY_MS': str(options['latency_ms'])},
+                         '--ssl-keyfile', key_file, '--ssl-certfile', cert_file, scheme='https')
+            gateway = BasePaymentGateWay(
+                method='bkash', method_uuid=uuid.uuid4().hex, base_url=f"https://127.0.0.1:{port}/",
+                details_json={'app_key': 'k', 'app_secret': 's', 'username': 'u', 'password': 'p'},
+            )
+            try:
+                for concurrency in options['concurrency']:
+                    for label in ('new-conn', 'pooled'):
+                        client = BKashClient(gateway)
+                        if label == 'new-conn':
+                            client.session = None
+                        elapsed, latencies = self._run(client, options['requests'], concurrency)
+                        p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+                        self.stdout.write(
+                            f"{label:<8} concurrency={concurrency:<3} pairs={len(latencies):<5} pairs/sec={len(latencies) / elapsed:,.1f} "
+                            f"p50={statistics.median(latencies) * 1000:.1f}ms p99={p99 * 1000:.1f}ms"
+                        )
+            finally:
+                stub.terminate()
+                stub.wait()
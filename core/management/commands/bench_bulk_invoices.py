@@ -0,0 +1,73 @@
+from authentication.models import CustomUser, Merchant
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from decimal import Decimal
+import json, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Benchmark invoice creation through payment/create/ (one call per invoice) "
+            "against payment/create/bulk/ (one call per batch). Reports invoices/sec.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1000, help="Invoices created per endpoint.")
+        parser.add_argument('--batch-sizes', nargs='+', type=int, default=[50, 200, 500])
+
+    def _setup_merchant(self):
+        user = CustomUser.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}", first_name="Bench", phone_number="0")
+        merchant = Merchant.objects.create(
+            user=user, brand_name="Bench", fees_type='Flat',
+            deposit_fees=Decimal('0'), payout_fees=Decimal('0'), withdraw_fees=Decimal('0'),
+        )
+        return merchant, merchant.api_keys
+
+    def _item(self, n):
+        return {
+            'customer_name': f"Customer {n}",
+            'customer_number': '01700000000',
+            'customer_amount': '100.00',
+            'customer_order_id': f"bench-{n}",
+            'callback_url': 'https://example.com/callback',
+            'method': 'bkash',
+        }
+
+    def _run(self, label, calls, invoices):
+        started = time.perf_counter()
+        created = sum(call() for call in calls)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<22} invoices={created:<6} calls={len(calls):<6} "
+            f"seconds={elapsed:.2f} invoices/sec={created / elapsed:,.1f}"
+        )
+        if created != invoices:
+            self.stderr.write(f"{label}: expected {invoices} invoices, created {created}")
+
+    @override_settings(ALLOWED_HOSTS=['*'], API_RATE_LIMIT_ENABLED=False)
+    def handle(self, *args, **options):
+        merchant, api_key = self._setup_merchant()
+        client = Client(HTTP_API_KEY=api_key.api_key, HTTP_SECRET_KEY=api_key.secret_key)
+        total = options['invoices']
+
+        def single(n):
+            def call():
+                response = client.post(reverse('create-payment'), json.dumps(self._item(n)), content_type='application/json')
+                return int('paymentID' in response.json())
+            return call
+
+        def bulk(start, size):
+            def call():
+                body = {'invoices': [self._item(n) for n in range(start, start + size)]}
+                response = client.post(reverse('create-payment-bulk'), json.dumps(body), content_type='application/json')
+                return response.json().get('created', 0)
+            return call
+
+        try:
+            self._run("single", [single(n) for n in range(total)], total)
+            for size in options['batch_sizes']:
+                calls = [bulk(start, min(size, total - start)) for start in range(0, total, size)]
+                self._run(f"bulk batch={size}", calls, total)
+        finally:
+            merchant.invoices.all().delete()
+            merchant.user.delete()
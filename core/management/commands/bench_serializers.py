@@ -0,0 +1,87 @@
+from authentication.models import CustomUser, Merchant
+from core.compiled import compiled_plan
+from core.models import WalletTransaction
+from core.renderers import FastJSONRenderer
+from core.serializers import WalletTransactionSerializer
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from rest_framework.renderers import JSONRenderer
+from decimal import Decimal
+import statistics, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Serialize --rows WalletTransaction rows with WalletTransactionSerializer + JSONRenderer "
+            "and with the compiled plan + FastJSONRenderer, and report time and queries for each.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the median is reported.")
+
+    def _setup(self, count):
+        user = CustomUser.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}", first_name="Bench", phone_number="0")
+        merchant = Merchant.objects.create(
+            user=user, brand_name="Bench", fees_type='Flat',
+            deposit_fees=Decimal('0'), payout_fees=Decimal('0'), withdraw_fees=Decimal('0'),
+        )
+        content_type = ContentType.objects.get(app_label='core', model='invoice')
+        # (content_type, object_id) is unique, so start past the existing rows.
+        start = (WalletTransaction.objects.aggregate(last=Max('object_id'))['last'] or 0) + 1
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(
+                wallet=merchant.merchant_wallet, merchant=merchant, content_type=content_type, object_id=start + n,
+                amount=Decimal('100.00'), fee=Decimal('2.00'), net_amount=Decimal('98.00'),
+                previous_balance=Decimal(n), current_balance=Decimal(n + 98), method='bkash',
+                status='success', tran_type='credit', trx_id=f"TRX{n}", trx_uuid=uuid.uuid4().hex,
+            )
+            for n in range(count)
+        ], batch_size=1000)
+        return merchant
+
+    def _serializer(self, queryset):
+        return JSONRenderer().render(WalletTransactionSerializer(queryset, many=True).data)
+
+    def _joined(self, queryset):
+        # The serializer without its per-row merchant/content type queries.
+        return self._serializer(queryset.select_related('merchant', 'content_type'))
+
+    def _compiled(self, queryset):
+        return FastJSONRenderer().render(compiled_plan(WalletTransactionSerializer).data(queryset))
+
+    def _measure(self, func, queryset, repeat):
+        timings, queries = [], []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        for _ in range(repeat):
+            queries.clear()
+            # Counted with a wrapper: connection.queries keeps only the last 9000.
+            with connection.execute_wrapper(count):
+                started = time.perf_counter()
+                body = func(queryset.all())
+                timings.append(time.perf_counter() - started)
+        return statistics.median(timings), len(queries), body
+
+    def handle(self, *args, **options):
+        merchant = self._setup(options['rows'])
+        queryset = WalletTransaction.objects.filter(merchant=merchant).order_by('-created_at')
+        try:
+            results = {}
+            for label, func in (('serializer', self._serializer), ('joined', self._joined), ('compiled', self._compiled)):
+                elapsed, queries, body = self._measure(func, queryset, options['repeat'])
+                results[label] = (elapsed, body)
+                self.stdout.write(
+                    f"{label:<10} rows={options['rows']:<6} {elapsed * 1000:,.0f}ms "
+                    f"rows/sec={options['rows'] / elapsed:,.0f} queries={queries} bytes={len(body):,}"
+                )
+            self.stdout.write(
+                f"speedup {results['serializer'][0] / results['compiled'][0]:.1f}x "
+                f"({results['joined'][0] / results['compiled'][0]:.1f}x over joined), "
+                f"identical output: {len({body for _, body in results.values()}) == 1}"
+            )
+        finally:
+            merchant.user.delete()
@@ -0,0 +1,89 @@
+from authentication.models import CustomUser, Merchant, MerchantWallet
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from concurrent.futures import ThreadPoolExecutor
+from core.models import Invoice, WalletTransaction, WalletLedgerEntry, MerchantWalletShard
+from core.wallet import wallet_totals
+from django.db import connection
+from decimal import Decimal
+import itertools, statistics, time, uuid
+
+
+class Command(BaseCommand):
+    help = ("Benchmark concurrent wallet credits against one hot merchant wallet. "
+            "Reports credits/sec and per-credit latency (time spent waiting on the wallet lock dominates it).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 8, 32])
+        parser.add_argument('--credits', type=int, default=200, help="Credits per thread.")
+        parser.add_argument('--amount', type=Decimal, default=Decimal('10.00'))
+        parser.add_argument('--modes', nargs='+', default=['row'], choices=[m for m, _ in MerchantWallet.STORAGE_MODE])
+        parser.add_argument('--shards', type=int, default=8, help="shard_count used for the sharded mode.")
+
+    def _setup_merchant(self):
+        user = CustomUser.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}", first_name="Bench", phone_number="0")
+        return Merchant.objects.create(
+            user=user, brand_name="Bench", fees_type='Flat',
+            deposit_fees=Decimal('0'), payout_fees=Decimal('0'), withdraw_fees=Decimal('0'),
+        )
+
+    def _credit_worker(self, wallet_id, merchant_id, count, amount):
+        # Credits look like invoice deposits so the deposit fee bucket applies;
+        # object ids only need to be unique per run.
+        errors = 0
+        latencies = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    WalletTransaction.objects.create(
+                        wallet_id=wallet_id, merchant_id=merchant_id, amount=amount,
+                        content_type=self.content_type, object_id=next(self.object_ids),
+                        method='bench', status='success', tran_type='credit',
+                    )
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+        finally:
+            connection.close()
+        return errors, latencies
+
+    def _reset_wallet(self, wallet, mode, shards):
+        WalletLedgerEntry.objects.filter(wallet=wallet).delete()
+        MerchantWalletShard.objects.filter(wallet=wallet).delete()
+        MerchantWallet.objects.filter(pk=wallet.pk).update(
+            balance=0, withdraw_processing=0, total_withdraw=0, storage_mode=mode, shard_count=shards,
+        )
+
+    def handle(self, *args, **options):
+        merchant = self._setup_merchant()
+        self.content_type = ContentType.objects.get_for_model(Invoice)
+        self.object_ids = itertools.count(10 ** 9 + int(time.time()) % 10 ** 6 * 1000)
+        wallet = merchant.merchant_wallet
+        amount = options['amount']
+        try:
+            for mode in options['modes']:
+                for threads in options['threads']:
+                    self._reset_wallet(wallet, mode, options['shards'])
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=threads) as pool:
+                        futures = [
+                            pool.submit(self._credit_worker, wallet.pk, merchant.pk, options['credits'], amount)
+                            for _ in range(threads)
+                        ]
+                        results = [f.result() for f in futures]
+                    elapsed = time.perf_counter() - started
+
+                    errors = sum(e for e, _ in results)
+                    latencies = sorted(l for _, ls in results for l in ls)
+                    applied = len(latencies)
+                    balance = wallet_totals(MerchantWallet.objects.get(pk=wallet.pk)).balance
+                    p50 = statistics.median(latencies) * 1000 if latencies else 0
+                    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+                    self.stdout.write(
+                        f"mode={mode:<8} threads={threads:<3} credits={applied:<6} errors={errors:<5} "
+                        f"credits/sec={applied / elapsed:,.1f} p50={p50:.2f}ms p99={p99:.2f}ms "
+                        f"lost_updates={'no' if balance == amount * applied else 'YES'}"
+                    )
+        finally:
+            merchant.user.delete()
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from core.wallet import compact_wallet_ledger, fold_wallet_shards
+from core.models import WalletLedgerEntry, MerchantWalletShard
+import time
+
+
+class Command(BaseCommand):
+    help = ("Fold uncompacted WalletLedgerEntry rows into their wallet snapshot, "
+            "and shard counters of wallets that are no longer sharded back into the wallet row.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Entries folded per wallet per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep compacting every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def compact_once(self, batch_size):
+        folded = 0
+        wallet_ids = (WalletLedgerEntry.objects
+                      .filter(compacted=False)
+                      .values_list('wallet_id', flat=True)
+                      .distinct())
+        for wallet_id in list(wallet_ids):
+            while True:
+                count = compact_wallet_ledger(wallet_id, batch_size=batch_size)
+                folded += count
+                if count < batch_size:
+                    break
+        
+        leftover_shards = (MerchantWalletShard.objects
+                           .exclude(wallet__storage_mode='sharded')
+                           .values_list('wallet_id', flat=True)
+                           .distinct())
+        for wallet_id in list(leftover_shards):
+            folded += fold_wallet_shards(wallet_id)
+        return folded
+
+    def handle(self, *args, **options):
+        while True:
+            folded = self.compact_once(options['batch_size'])
+            if folded or not options['loop']:
+                self.stdout.write(f"Compacted {folded} ledger entries / shards.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
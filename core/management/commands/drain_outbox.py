@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from core.outbox import drain_outbox
+import time
+
+
+class Command(BaseCommand):
+    help = ("Run the consumers of pending OutboxEvents (OUTBOX_SIDE_EFFECTS). Several workers can run "
+            "at once; each claims its batch with SKIP LOCKED.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep running and poll for new events.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the outbox is empty with --loop.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.perf_counter()
+            drained = 0
+            while True:
+                count = drain_outbox(batch_size=batch_size)
+                drained += count
+                if count < batch_size:
+                    break
+            if drained:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Drained {drained} events in {elapsed:.2f}s")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.idempotency import expire_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired payment API Idempotency-Keys in chunks. Safe to run from cron while the API is live."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = expire_idempotency_keys(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys.")
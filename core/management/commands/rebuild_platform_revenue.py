@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.revenue import rebuild_platform_revenue
+
+
+class Command(BaseCommand):
+    help = ("Recompute PlatformRevenueAccount and PlatformRevenueDaily from successful WalletTransactions. "
+            "Run with payments paused.")
+
+    def handle(self, *args, **options):
+        buckets, days = rebuild_platform_revenue()
+        self.stdout.write(f"Rebuilt {buckets} revenue buckets and {days} day rows.")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.rollups import rebuild_wallet_rollups
+import time
+
+
+class Command(BaseCommand):
+    help = "Recompute WalletRollup from invoices, withdraw requests and payouts (backfill / repair). Run with payments paused."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_wallet_rollups()
+        self.stdout.write(f"Rebuilt {rows} rollup rows in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_merchantwallet_storage_mode'),
+        ('core', '0004_invoice_note_paymenttransfer_note_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trx_uuid', models.CharField(max_length=50)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('withdraw_processing', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_withdraw', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('compacted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='authentication.merchantwallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'compacted'], name='core_wallet_wallet__665725_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_merchantwallet_shard_count_and_more'),
+        ('core', '0005_walletledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantWalletShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_no', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('withdraw_processing', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_withdraw', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='authentication.merchantwallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'shard_no'), name='uniq_wallet_shard_no')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_merchantwallet_shard_count_and_more'),
+        ('core', '0006_merchantwalletshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingWalletCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('method', models.CharField(blank=True, max_length=50, null=True)),
+                ('trx_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_credit', to='core.invoice')),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_credits', to='authentication.merchant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['merchant', 'applied_at'], name='core_pendin_merchan_8cb980_idx')],
+            },
+        ),
+    ]
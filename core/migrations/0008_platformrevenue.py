@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_pendingwalletcredit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformRevenueAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('deposit', 'Deposit'), ('payout', 'Payout'), ('withdraw', 'Withdraw'), ('other', 'Other')], max_length=10)),
+                ('shard_no', models.PositiveSmallIntegerField(default=0)),
+                ('total_fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'shard_no'), name='uniq_revenue_bucket_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlatformRevenueDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bucket', models.CharField(choices=[('deposit', 'Deposit'), ('payout', 'Payout'), ('withdraw', 'Withdraw'), ('other', 'Other')], max_length=10)),
+                ('shard_no', models.PositiveSmallIntegerField(default=0)),
+                ('total_fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='core_platfo_day_51c5de_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'bucket', 'shard_no'), name='uniq_revenue_day_bucket_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_merchantwallet_shard_count_and_more'),
+        ('core', '0008_platformrevenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('invoice', 'Invoice'), ('withdraw', 'Withdraw'), ('payout', 'Payout')], max_length=10)),
+                ('status', models.CharField(max_length=32)),
+                ('shard_no', models.PositiveSmallIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.BigIntegerField(default=0)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_rollups', to='authentication.merchant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'day'], name='core_wallet_kind_8713ea_idx')],
+                'constraints': [models.UniqueConstraint(fields=('merchant', 'day', 'kind', 'status', 'shard_no'), name='uniq_wallet_rollup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_merchant_rate_limit'),
+        ('core', '0011_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_uuid', models.CharField(editable=False, max_length=50, unique=True)),
+                ('payout_count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('fee', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('merchant', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payout_batches', to='authentication.merchant')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paymenttransfer',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transfers', to='core.payoutbatch'),
+        ),
+    ]
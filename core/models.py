@@ -2,13 +2,109 @@ from authentication.models import CustomUser, Merchant, APIKey, MerchantWallet,
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.db import models, transaction
-import uuid, random, string
+from django.utils import timezone
+from .wallet import wallet_mutation, wallet_totals, credit_invoice
+from .fees import fee_policy
+from .revenue import fee_bucket, record_platform_fee
+from .checkout import forget_checkout_session
+from .outbox import emit
+from .rollups import shift_rollup, invoice_rollup_status, book_created_rows
+import uuid, random, string, copy
 from decimal import Decimal
 
 
+# ============================================Save Pipeline Start=======================================
+class LockedOriginalMixin:
+    """
+    Loads the stored row once per save, under select_for_update, so the edit
+    checks, the field diff and the wallet state transitions all work from the
+    same snapshot instead of each fetching the row again.
+    """
+    def _load_original(self):
+        preloaded = self.__dict__.pop('_locked_original', None)
+        if preloaded is not None or not self.pk:
+            return preloaded
+        return type(self).objects.select_for_update().filter(pk=self.pk).first()
+    
+    def _changed_fields(self, original):
+        # Compare raw column values so foreign keys are not fetched for the diff.
+        return {
+            f.name for f in self._meta.concrete_fields
+            if f.name not in ('id', 'created_at') and getattr(original, f.attname) != getattr(self, f.attname)
+        }
+    
+    ROLLUP_KIND = None
+    ROLLUP_AMOUNT_FIELD = 'amount'
+    
+    def rollup_status(self):
+        return self.status
+    
+    def _rollup_state(self, obj):
+        if obj is None:
+            return None
+        return obj.rollup_status(), Decimal(str(getattr(obj, self.ROLLUP_AMOUNT_FIELD) or '0'))
+    
+    def _shift_rollup(self, original, fee=Decimal('0')):
+        shift_rollup(self.merchant_id, timezone.localdate(self.created_at), self.ROLLUP_KIND,
+                     self._rollup_state(original), self._rollup_state(self), fee=fee)
+    
+    def _publish_rollup(self, original, fee=Decimal('0'), event='saved'):
+        """
+        Books the save's rollup move in its transaction, or with OUTBOX_SIDE_EFFECTS as one
+        OutboxEvent ("<kind>.<event>") that drain_outbox hands to its consumers.
+        """
+        if not settings.OUTBOX_SIDE_EFFECTS:
+            return self._shift_rollup(original, fee=fee)
+        old, new = self._rollup_state(original), self._rollup_state(self)
+        if old == new and not fee and event == 'saved':
+            return
+        emit(f"{self.ROLLUP_KIND}.{event}", self, rollup={
+            'merchant_id': self.merchant_id,
+            'day': timezone.localdate(self.created_at).isoformat(),
+            'kind': self.ROLLUP_KIND,
+            'old': old and [old[0], str(old[1])],
+            'new': new and [new[0], str(new[1])],
+            'fee': str(fee),
+        })
+    
+    def _sync_debit_transaction(self, created, **values):
+        ct = ContentType.objects.get_for_model(self.__class__)
+        trx = None
+        if not created:
+            trx = (WalletTransaction.objects.select_for_update(of=('self',))
+                   .select_related('wallet', 'merchant')
+                   .filter(content_type=ct, object_id=self.pk, tran_type='debit').first())
+        
+        if trx is None:
+            return WalletTransaction.objects.create(
+                wallet=self.merchant.merchant_wallet,
+                merchant=self.merchant,
+                content_type=ct,
+                object_id=self.pk,
+                tran_type='debit',
+                **values
+            )
+        
+        # Hand the row we already hold the lock on to WalletTransaction.save as its original.
+        trx._locked_original = copy.copy(trx)
+        for name, value in values.items():
+            setattr(trx, name, value)
+        trx.save(update_fields=list(values))
+        return trx
+    
+    def _booked_fee(self, trx, already_booked):
+        """Fee to add to the rollup: the transaction's fee on the save that makes it successful."""
+        if trx is None or already_booked or trx.status != 'success':
+            return Decimal('0')
+        return trx.fee or Decimal('0')
+
+# ============================================Save Pipeline End=======================================
+
+
 # ============================================Invoice/Cash In Start=======================================
-class Invoice(models.Model):
+class Invoice(LockedOriginalMixin, models.Model):
     STATUS = (
         ('active', 'Active'),
         ('deactive', 'Deactive'),
@@ -50,6 +146,8 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     ALLOWED_WHEN_PAID = frozenset(('customer_name', 'customer_number', 'customer_address'))
+    ROLLUP_KIND = 'invoice'
+    ROLLUP_AMOUNT_FIELD = 'customer_amount'
     
     def generate_invoice_trxn(self):
         """Generate a unique transaction ID in the format: F37LIY561560"""
@@ -57,11 +155,7 @@ class Invoice(models.Model):
         suffix = ''.join(random.choices(string.digits, k=6))  # 6 random digits (e.g., 561560)
         return prefix + suffix
     
-    def edit_restricted_method(self):
-        if not self.pk:
-            return
-
-        original = Invoice.objects.only('pay_status').filter(pk=self.pk).first()
+    def edit_restricted_method(self, original):
         if not original:
             return
         
@@ -69,20 +163,17 @@ class Invoice(models.Model):
             raise ValidationError(f"This Invoice is {original.status}. Can't Update!")
 
         if original.pay_status == 'paid':
-            changed = set()
-            current = Invoice.objects.get(pk=self.pk)
-            for f in self._meta.concrete_fields:
-                name = f.name
-                if name in ('id', 'created_at'):
-                    continue
-                if getattr(current, name) != getattr(self, name):
-                    changed.add(name)
-
+            changed = self._changed_fields(original)
             if changed - self.ALLOWED_WHEN_PAID:
                 raise ValidationError("This invoice is already paid and cannot be edited.")
     
+    def is_creditable(self):
+        return self.status.lower() == 'active' and self.pay_status.lower() == 'paid' and bool(self.transaction_id)
+    
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        self.edit_restricted_method()
+        original = self._load_original()
+        self.edit_restricted_method(original)
         
         if not self.invoice_payment_id:
             print(not self.invoice_payment_id)
@@ -91,28 +182,145 @@ class Invoice(models.Model):
         if not self.invoice_trxn:
             self.invoice_trxn = self.generate_invoice_trxn()
         
-        if self.status.lower() == 'active' and self.pay_status.lower() == 'paid' and self.transaction_id:
-            WalletTransaction.objects.create(
-                wallet = self.merchant.merchant_wallet,
-                merchant = self.merchant,
-                service = self,
-                amount = self.customer_amount,
-                method = self.method,
-                status='success',
-                trx_id=self.transaction_id,
-                tran_type='credit'
-            )
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+        if original is not None:
+            # The cached checkout page and status entry (ETag) are stale once
+            # the invoice changes; the next poll rebuilds them.
+            forget_checkout_session(self.invoice_payment_id)
+        was_paid = original is not None and original.is_creditable()
+        if settings.OUTBOX_SIDE_EFFECTS:
+            # The credit runs in drain_outbox; the save only writes the event.
+            self._publish_rollup(original, event='paid' if self.is_creditable() and not was_paid else 'saved')
+            return ret
+        trx = None
+        if self.is_creditable():
+            # Idempotent: a repeated save or callback only finds the existing credit.
+            trx = credit_invoice(self)
+        self._shift_rollup(original, fee=self._booked_fee(trx, was_paid))
+        return ret
+    
+    @classmethod
+    @transaction.atomic
+    def create_many(cls, invoices, batch_size=500):
+        """
+        Inserts new, unpaid invoices with one bulk_create. save() is not called:
+        ids are generated here and the rollups are booked per group, and since
+        nothing is paid yet there is no wallet credit to make.
+        """
+        for invoice in invoices:
+            if invoice.is_creditable():
+                raise ValidationError("Bulk created invoices can't be paid already.")
+            invoice.invoice_payment_id = invoice.invoice_payment_id or uuid.uuid4().hex
+            invoice.invoice_trxn = invoice.invoice_trxn or invoice.generate_invoice_trxn()
+        created = cls.objects.bulk_create(invoices, batch_size=batch_size)
+        book_created_rows(cls.ROLLUP_KIND, (
+            (invoice.merchant_id, timezone.localdate(invoice.created_at), invoice.rollup_status(), Decimal(str(invoice.customer_amount or '0')))
+            for invoice in created
+        ))
+        return created
+    
+    def rollup_status(self):
+        return invoice_rollup_status(self.status, self.pay_status)
     
     def __str__(self):
         return f"Invoice#{self.invoice_payment_id}"
 
+
+class PendingWalletCredit(models.Model):
+    """Outbox row for a paid invoice whose wallet credit is applied in batches."""
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name='pending_credit')
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='pending_credits')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    method = models.CharField(max_length=50, blank=True, null=True)
+    trx_id = models.CharField(max_length=64, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['merchant', 'applied_at']),
+        ]
+    
+    def __str__(self):
+        return f"Pending credit for {self.invoice_id}"
+
 # ============================================Invoice/Cash In End=======================================
 
 
 
 # ===================================Payment Transfer/Refund/Cash Out Start==============================
-class PaymentTransfer(models.Model):
+class PayoutBatch(models.Model):
+    """Payouts submitted together through payment/payout/batch/, reserved with one wallet hold."""
+    merchant = models.ForeignKey(Merchant, on_delete=models.SET_NULL, related_name='payout_batches', null=True)
+    batch_uuid = models.CharField(max_length=50, editable=False, unique=True)
+    payout_count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    @classmethod
+    @transaction.atomic
+    def submit(cls, merchant, transfers, batch_size=500):
+        """
+        Creates a batch of new, pending payouts. The total of the payouts plus
+        their fees is held on the merchant's wallet with one locked update, and
+        the payouts and their pending debit WalletTransactions are inserted
+        with bulk_create; PaymentTransfer.save is not called, but a payout
+        later saved as success or rejected settles or releases its own share
+        of the hold like a single payout.
+        """
+        if not transfers:
+            raise ValidationError("A payout batch needs at least one payout.")
+        wallet = merchant.merchant_wallet
+        fees = fee_policy(merchant).fees('payout', [transfer.amount for transfer in transfers])
+        debits = [Decimal(str(transfer.amount)) + fee for transfer, fee in zip(transfers, fees)]
+        
+        mutation = wallet_mutation(wallet)
+        mutation.hold(sum(debits, Decimal('0')))
+        
+        batch = cls.objects.create(
+            merchant=merchant, batch_uuid=uuid.uuid4().hex, payout_count=len(transfers),
+            amount=sum((Decimal(str(transfer.amount)) for transfer in transfers), Decimal('0')),
+            fee=sum(fees, Decimal('0')),
+        )
+        for transfer in transfers:
+            transfer.merchant, transfer.batch, transfer.status = merchant, batch, 'pending'
+            transfer.trx_uuid = uuid.uuid4().hex
+        created = PaymentTransfer.objects.bulk_create(transfers, batch_size=batch_size)
+        if any(transfer.pk is None for transfer in created):
+            # Backends that don't return ids from bulk_create (MySQL).
+            ids = dict(PaymentTransfer.objects.filter(batch=batch).values_list('trx_uuid', 'pk'))
+            for transfer in created:
+                transfer.pk = ids[transfer.trx_uuid]
+        
+        content_type = ContentType.objects.get_for_model(PaymentTransfer)
+        running = mutation.balance_before
+        holds = []
+        for transfer, fee, debit in zip(created, fees, debits):
+            holds.append(WalletTransaction(
+                wallet=wallet, merchant=merchant, content_type=content_type, object_id=transfer.pk,
+                amount=debit, fee=fee, net_amount=transfer.amount, method=transfer.payment_method,
+                previous_balance=running, current_balance=running - debit,
+                status='pending', tran_type='debit', trx_uuid=uuid.uuid4().hex,
+            ))
+            running -= debit
+        WalletTransaction.objects.bulk_create(holds, batch_size=batch_size)
+        mutation.finish(batch.batch_uuid)
+        
+        book_created_rows(PaymentTransfer.ROLLUP_KIND, (
+            (merchant.pk, timezone.localdate(transfer.created_at), transfer.rollup_status(), Decimal(str(transfer.amount)))
+            for transfer in created
+        ))
+        return batch, created
+    
+    def status_counts(self):
+        return dict(self.transfers.values_list('status').annotate(count=models.Count('id')).order_by())
+    
+    def __str__(self):
+        return f"PayoutBatch#{self.batch_uuid}"
+
+
+class PaymentTransfer(LockedOriginalMixin, models.Model):
     PAYMENT_METHOD = (
         ('bkash', 'Bkash'),
         ('nagad', 'Nagad'),
@@ -134,6 +342,7 @@ class PaymentTransfer(models.Model):
     status = models.CharField(choices=STATUS, default='pending', max_length=10)
     created_at = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True, null=True)
+    batch = models.ForeignKey(PayoutBatch, on_delete=models.SET_NULL, related_name='transfers', blank=True, null=True)
     
     transaction_rel = GenericRelation(
         'WalletTransaction',
@@ -143,31 +352,20 @@ class PaymentTransfer(models.Model):
     )
     
     ALLOWED_WHEN_PAID = frozenset(('trx_id', 'status', 'confirm_by'))
+    ROLLUP_KIND = 'payout'
     
     @property
     def wallet_transaction(self):
         return self.transaction_rel.first()
     
-    def edit_restricted_method(self):
-        if not self.pk:
-            return
-
-        original = PaymentTransfer.objects.only('status').filter(pk=self.pk).first()
+    def edit_restricted_method(self, original):
         if not original:
             return
 
         if original.status.lower() in ['success', 'rejected', 'delete']:
             raise ValidationError(f"This Payment Payout is {original.status}. Can't Update!")
         
-        changed = set()
-        current = PaymentTransfer.objects.get(pk=self.pk)
-        for f in self._meta.concrete_fields:
-            name = f.name
-            if name in ('id', 'created_at'):
-                continue
-            if getattr(current, name) != getattr(self, name):
-                changed.add(name)
-
+        changed = self._changed_fields(original)
         if changed - self.ALLOWED_WHEN_PAID:
             raise ValidationError("Only Transaction & Status can update!")
     
@@ -177,24 +375,17 @@ class PaymentTransfer(models.Model):
 
     
     def verify_withdraw_amount(self):
-        fee_value = self._as_decimal(getattr(self.merchant, 'payout_fees', 0))
-        fees_type = (getattr(self.merchant, 'fees_type', '') or '').lower()
-        is_percentage = fees_type in ('percentage', 'parcentage')
-        if is_percentage:
-            fee = (self.amount * fee_value) / Decimal('100')
-        elif fees_type == 'flat':
-            fee = fee_value
-        else:
-            fee = (self.amount * Decimal('10')) / Decimal('100')
-        
-        wallet_balance = self.merchant.merchant_wallet.balance
-        return wallet_balance >= self.amount+fee
+        fee, total = fee_policy(self.merchant).debit('payout', self.amount)
+        wallet_balance = wallet_totals(self.merchant.merchant_wallet).balance
+        return wallet_balance >= total
     
+    @transaction.atomic
     def save(self, *args, **kwargs):
         if self.confirm_by and self.confirm_by.role.name.lower() != "staff":
             raise ValidationError("Only users with the 'Staff' role can confirm the payment.")
         
-        self.edit_restricted_method()
+        original = self._load_original()
+        self.edit_restricted_method(original)
         
         if not self.pk and self.verify_withdraw_amount() is False:
             raise ValidationError("Payout amount less then your Wallet balance.")
@@ -206,36 +397,25 @@ class PaymentTransfer(models.Model):
             self.status = 'success'
         
         ret = super().save(*args, **kwargs)
-        self._sync_wallet_transaction()
+        trx = self._sync_wallet_transaction(created=original is None)
+        self._publish_rollup(original, fee=self._booked_fee(trx, original is not None and original.status == 'success'))
         return ret
     
-    def _sync_wallet_transaction(self):
-        ct = ContentType.objects.get_for_model(self.__class__)
-        
-        defaults = {
-            'wallet': self.merchant.merchant_wallet,
-            'merchant': self.merchant,
-            'net_amount': self.amount,
-            # 'method': getattr(self.payment_method, 'method_type', None),
-            'method': self.payment_method,
-            'status': 'success' if str(self.status).lower() == 'success' and self.trx_id else 'pending',
-            'trx_id': self.trx_id,
-        }
-        
-        WalletTransaction.objects.update_or_create(
-            wallet = self.merchant.merchant_wallet,
-            merchant = self.merchant,
-            content_type=ct,
-            object_id=self.pk,
-            tran_type = 'debit',
-            defaults=defaults
+    def _sync_wallet_transaction(self, created=False):
+        return self._sync_debit_transaction(
+            created,
+            net_amount=self.amount,
+            # method=getattr(self.payment_method, 'method_type', None),
+            method=self.payment_method,
+            status='success' if str(self.status).lower() == 'success' and self.trx_id else 'pending',
+            trx_id=self.trx_id,
         )
 
 # ===================================Payment Transfer/Refund/Cash Out End==============================
 
 
 # ======================================Withdraw Request/Cash Out Start=================================
-class WithdrawRequest(models.Model):
+class WithdrawRequest(LockedOriginalMixin, models.Model):
     STATUS = (
         ('pending', 'Pending'), ('success', 'Success'), ('rejected', 'Rejected'), ('delete', 'Delete')
     )
@@ -258,15 +438,13 @@ class WithdrawRequest(models.Model):
         related_query_name='withdraw'
     )
     
+    ROLLUP_KIND = 'withdraw'
+    
     @property
     def wallet_transaction(self):
         return self.transaction_rel.first()
     
-    def edit_restricted_method(self):
-        if not self.pk:
-            return
-
-        original = WithdrawRequest.objects.only('status').filter(pk=self.pk).first()
+    def edit_restricted_method(self, original):
         if not original:
             return
 
@@ -278,22 +456,14 @@ class WithdrawRequest(models.Model):
 
     
     def verify_withdraw_amount(self):
-        fee_value = self._as_decimal(getattr(self.merchant, 'withdraw_fees', 0))
-        fees_type = (getattr(self.merchant, 'fees_type', '') or '').lower()
-        is_percentage = fees_type in ('percentage', 'parcentage')
-        if is_percentage:
-            fee = (self.amount * fee_value) / Decimal('100')
-        elif fees_type == 'flat':
-            fee = fee_value
-        else:
-            fee = (self.amount * Decimal('10')) / Decimal('100')
-        
-        wallet_balance = self.merchant.merchant_wallet.balance
-        print(wallet_balance)
-        return wallet_balance >= self.amount+fee
+        fee, total = fee_policy(self.merchant).debit('withdraw', self.amount)
+        wallet_balance = wallet_totals(self.merchant.merchant_wallet).balance
+        return wallet_balance >= total
     
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        self.edit_restricted_method()
+        original = self._load_original()
+        self.edit_restricted_method(original)
         
         if not self.pk and self.verify_withdraw_amount() is False:
             raise ValidationError("Withdraw amount exceeds your wallet balance.")
@@ -306,12 +476,11 @@ class WithdrawRequest(models.Model):
             self.status = 'success'
         
         ret = super().save(*args, **kwargs)
-        self._sync_wallet_transaction()
+        trx = self._sync_wallet_transaction(created=original is None)
+        self._publish_rollup(original, fee=self._booked_fee(trx, original is not None and original.status == 'success'))
         return ret
 
-    def _sync_wallet_transaction(self):
-        ct = ContentType.objects.get_for_model(self.__class__)
-        
+    def _sync_wallet_transaction(self, created=False):
         if str(self.status).lower() == "rejected":
             status__ = "failed"
         elif str(self.status).lower() == "pending" and self.trx_id is None:
@@ -319,22 +488,12 @@ class WithdrawRequest(models.Model):
         else:
             status__ = "success"
         
-        defaults = {
-            'wallet':   self.merchant.merchant_wallet,
-            'merchant': self.merchant,
-            'net_amount':   self.amount,
-            'method':   getattr(self.payment_method, 'method_type', None),
-            'status':   status__,
-            'trx_id':   self.trx_id,
-        }
-        
-        WalletTransaction.objects.update_or_create(
-            wallet = self.merchant.merchant_wallet,
-            merchant = self.merchant,
-            content_type=ct,
-            object_id=self.pk,
-            tran_type = 'debit',
-            defaults=defaults
+        return self._sync_debit_transaction(
+            created,
+            net_amount=self.amount,
+            method=getattr(self.payment_method, 'method_type', None),
+            status=status__,
+            trx_id=self.trx_id,
         )
     
 # ======================================Withdraw Request/Cash Out End=================================
@@ -343,7 +502,7 @@ class WithdrawRequest(models.Model):
 
 
 # ========================================Wallet Transaction Start===================================
-class WalletTransaction(models.Model):
+class WalletTransaction(LockedOriginalMixin, models.Model):
     STATUS = (('pending', 'Pending'), ('success', 'Success'), ('failed', 'Failed'))
     TRAN_TYPE = (('debit', 'Debit'), ('credit', 'Credit'))
     wallet = models.ForeignKey(MerchantWallet, on_delete=models.SET_NULL, related_name='wallet_transaction', blank=True, null=True)
@@ -369,19 +528,7 @@ class WalletTransaction(models.Model):
     def _as_decimal(self, v):
         return Decimal(str(v or '0'))
 
-    def _get_original(self):
-        if not self.pk:
-            return None
-        try:
-            return type(self).objects.get(pk=self.pk)
-        except type(self).DoesNotExist:
-            return None
-    
-    def edit_restricted_method(self):
-        if not self.pk:
-            return
-
-        original = WalletTransaction.objects.only('status').filter(pk=self.pk).first()
+    def edit_restricted_method(self, original):
         if not original:
             return
 
@@ -398,36 +545,18 @@ class WalletTransaction(models.Model):
             self.ip_address = ip
     
     def _which_fee_bucket(self):
-        tran = (self.tran_type or '').lower()
         model_name = None
-        if self.content_type:
-            model_name = (self.content_type.model or '').lower()
+        if self.content_type_id:
+            model_name = ContentType.objects.get_for_id(self.content_type_id).model
         elif self.service is not None:
-            model_name = self.service.__class__.__name__.lower()
-
-        if model_name:
-            model_name = model_name.replace('_', '')
+            model_name = self.service.__class__.__name__
 
-        if tran == 'credit' and model_name == 'invoice':
-            return 'deposit'
-        if tran == 'debit' and model_name in ('paymenttransfer',):
-            return 'payout'
-        if tran == 'debit' and model_name in ('withdrawrequest',):
-            return 'withdraw'
-        return None
+        bucket = fee_bucket(self.tran_type, model_name)
+        return None if bucket == 'other' else bucket
 
     
     def credit_fees_disbursement(self):
-        fee_value = self._as_decimal(getattr(self.merchant, 'deposit_fees', 0))
-        fees_type = (getattr(self.merchant, 'fees_type', '') or '').lower()
-        is_percentage = fees_type in ('percentage', 'parcentage')
-        if is_percentage:
-            self.fee = (self.amount * fee_value) / Decimal('100')
-        elif fees_type == 'flat':
-            self.fee = fee_value
-        else:
-            self.fee = (self.amount * Decimal('10')) / Decimal('100')
-        self.net_amount = self.amount - self.fee
+        self.fee, self.net_amount = fee_policy(self.merchant).deposit(self.amount)
     
     def fees_disbursement(self):
         if not self.merchant:
@@ -440,24 +569,7 @@ class WalletTransaction(models.Model):
         if bucket == 'deposit':
             self.credit_fees_disbursement()
         else:
-            if bucket == 'payout':
-                fee_value = self._as_decimal(getattr(self.merchant, 'payout_fees', 0))
-            elif bucket == 'withdraw':
-                fee_value = self._as_decimal(getattr(self.merchant, 'withdraw_fees', 0))
-            else:
-                fee_value = 5
-            
-            fees_type = (getattr(self.merchant, 'fees_type', '') or '').lower()
-            is_percentage = fees_type in ('percentage', 'parcentage')
-            
-            if is_percentage:
-                self.fee = (self.net_amount * fee_value) / Decimal('100')
-            elif fees_type == 'flat':
-                self.fee = fee_value
-            else:
-                self.fee = (self.amount * Decimal('10')) / Decimal('100')
-            
-            self.amount = self.net_amount + self.fee
+            self.fee, self.amount = fee_policy(self.merchant).debit(bucket or 'other', self.net_amount)
     
     @transaction.atomic
     def save(self, *args, **kwargs):
@@ -466,25 +578,17 @@ class WalletTransaction(models.Model):
         if not self.trx_uuid:
             self.trx_uuid = uuid.uuid4().hex
         
-        self.edit_restricted_method()
+        original = self._load_original()
+        self.edit_restricted_method(original)
         self.save_user_ip_address(kwargs.pop('request', None))
         
-        original = self._get_original()
         prev_status = (original.status.lower() if original and original.status else None)
         prev_amount = (self._as_decimal(original.amount) if original else None)
                
         new_status = (self.status or '').lower()
         new_tran   = (self.tran_type or '').lower()
         
-        wallet = self.wallet
-        if not wallet:
-            raise ValidationError("Wallet is required for a transaction.")
-        
-        # old_balance = wallet.balance
-        if creating or not self.previous_balance:
-            old_balance_for_record = wallet.balance
-        else:
-            old_balance_for_record = self.previous_balance  # freeze from first write
+        mutation = wallet_mutation(self.wallet)
         
         # ---------- FEES ----------
         self.fees_disbursement()
@@ -494,37 +598,25 @@ class WalletTransaction(models.Model):
         if new_tran == 'debit':
             if not original:
                 if new_status == 'pending':
-                    if wallet.balance < self.amount:
-                        raise ValidationError("Insufficient available balance to place a pending hold.")
-                    wallet.balance -= self.amount
-                    wallet.withdraw_processing += self.amount
+                    mutation.hold(self.amount)
 
                 elif new_status == 'success':
-                    if wallet.balance < self.amount:
-                        raise ValidationError("Insufficient balance for successful debit.")
-                    wallet.balance -= self.amount
-                    wallet.total_withdraw += self.amount
+                    mutation.debit(self.amount)
 
                 elif new_status == 'failed':
                     pass
             else:
                 if prev_status == 'pending':
                     if new_status == 'pending':
-                        diff = (self.amount - prev_amount)
-                        if diff > 0 and wallet.available_balance < diff:
-                            raise ValidationError("Insufficient available balance to increase pending hold.")
-                        wallet.balance -= diff
-                        wallet.withdraw_processing += diff
+                        mutation.adjust_hold(self.amount - prev_amount)
 
                     elif new_status == 'success':
                         if self.amount != prev_amount:
                             raise ValidationError("Amount cannot change when finalizing to success. Cancel & recreate.")
-                        wallet.withdraw_processing -= prev_amount
-                        wallet.total_withdraw += prev_amount
+                        mutation.settle_hold(prev_amount)
 
                     elif new_status == 'failed':
-                        wallet.withdraw_processing -= prev_amount
-                        wallet.balance += prev_amount
+                        mutation.release_hold(prev_amount)
                         
 
                 elif prev_status in ('success', 'failed'):
@@ -532,25 +624,26 @@ class WalletTransaction(models.Model):
 
                 elif prev_status is None:
                     pass
-            
-            wallet.save()
         
         # ---------- CREDIT case ----------
         elif new_tran == 'credit':
             if not original:
                 if new_status == 'success':
-                    wallet.balance += self.net_amount
-                    wallet.save()
+                    mutation.credit(self.net_amount)
             else:
                 if prev_status == 'pending' and new_status == 'success':
-                    wallet.balance += self.net_amount
-                    wallet.save()
+                    mutation.credit(self.net_amount)
                 elif prev_status in ('success', 'failed'):
                     raise ValidationError(f"Cannot update a {prev_status} transaction.")
 
+        mutation.finish(self.trx_uuid)
+        if new_status == 'success' and prev_status != 'success' and self.fee:
+            record_platform_fee(self._which_fee_bucket(), self.fee)
+        
+        self.wallet = mutation.wallet
         if creating or not self.previous_balance:
-            self.previous_balance = old_balance_for_record  # set once
-        self.current_balance = wallet.balance
+            self.previous_balance = mutation.balance_before  # set once, ledger wallets leave it empty for credits
+        self.current_balance = mutation.balance_after
         
         update_fields = kwargs.get('update_fields')
         if update_fields is not None:
@@ -575,3 +668,176 @@ class WalletTransaction(models.Model):
         ]
 # ========================================Wallet Transaction End===================================
 
+
+
+# ========================================Wallet Ledger Start===================================
+class WalletLedgerEntry(models.Model):
+    """Append-only balance delta, written instead of updating MerchantWallet in ledger mode."""
+    wallet = models.ForeignKey(MerchantWallet, on_delete=models.CASCADE, related_name='ledger_entries')
+    trx_uuid = models.CharField(max_length=50)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    withdraw_processing = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_withdraw = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    compacted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'compacted']),
+        ]
+    
+    def __str__(self):
+        return f"Ledger entry {self.trx_uuid}"
+
+
+class MerchantWalletShard(models.Model):
+    """Counter sub-row of a sharded wallet; totals are the wallet row plus every shard."""
+    wallet = models.ForeignKey(MerchantWallet, on_delete=models.CASCADE, related_name='shards')
+    shard_no = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    withdraw_processing = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_withdraw = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'shard_no'], name='uniq_wallet_shard_no')
+        ]
+    
+    def __str__(self):
+        return f"Wallet {self.wallet_id} shard {self.shard_no}"
+# ========================================Wallet Ledger End===================================
+
+
+
+# ========================================Platform Revenue Start===================================
+class PlatformRevenueAccount(models.Model):
+    """
+    Running fee revenue per fee bucket. Each bucket is split over a few
+    shard rows so successful transactions of different merchants do not
+    queue on one row lock; the total is the sum of the shards.
+    """
+    BUCKET = (('deposit', 'Deposit'), ('payout', 'Payout'), ('withdraw', 'Withdraw'), ('other', 'Other'))
+    bucket = models.CharField(max_length=10, choices=BUCKET)
+    shard_no = models.PositiveSmallIntegerField(default=0)
+    total_fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'shard_no'], name='uniq_revenue_bucket_shard')
+        ]
+    
+    def __str__(self):
+        return f"{self.bucket} revenue #{self.shard_no}"
+
+
+class PlatformRevenueDaily(models.Model):
+    """Fee revenue per day (in TIME_ZONE) and bucket, sharded like PlatformRevenueAccount."""
+    day = models.DateField()
+    bucket = models.CharField(max_length=10, choices=PlatformRevenueAccount.BUCKET)
+    shard_no = models.PositiveSmallIntegerField(default=0)
+    total_fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'bucket', 'shard_no'], name='uniq_revenue_day_bucket_shard')
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.bucket} revenue #{self.shard_no}"
+# ========================================Platform Revenue End===================================
+
+
+
+# ========================================Wallet Rollup Start===================================
+class WalletRollup(models.Model):
+    """
+    Amount, fee and count of invoices / withdrawals / payouts per merchant,
+    day (in TIME_ZONE), kind and status. Invoice statuses are stored as
+    "status:pay_status". Like the revenue rows, each key is spread over a
+    few shard rows and read as their sum.
+    """
+    KIND = (('invoice', 'Invoice'), ('withdraw', 'Withdraw'), ('payout', 'Payout'))
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='wallet_rollups')
+    day = models.DateField()
+    kind = models.CharField(max_length=10, choices=KIND)
+    status = models.CharField(max_length=32)
+    shard_no = models.PositiveSmallIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    fee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'day', 'kind', 'status', 'shard_no'], name='uniq_wallet_rollup_key')
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.merchant_id} {self.day} {self.kind} {self.status}"
+# ========================================Wallet Rollup End===================================
+
+
+
+# ========================================Idempotency Key Start===================================
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a payment API call made with an Idempotency-Key
+    header. Only hashes of the key and of the request are kept; the row is
+    written in the same transaction as the invoice / payout it answers for.
+    """
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key_hash = models.CharField(max_length=64)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(default=200)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'key_hash'], name='uniq_idempotency_key')
+        ]
+    
+    def __str__(self):
+        return f"IdempotencyKey#{self.key_hash[:12]}"
+
+# ========================================Idempotency Key End===================================
+
+
+
+# ========================================Outbox Start===================================
+class OutboxEvent(models.Model):
+    """
+    A side effect of an Invoice / PaymentTransfer / WithdrawRequest save,
+    written in the save's transaction and run later by `manage.py drain_outbox`.
+    done lists the consumers that have already run for the event.
+    """
+    event_type = models.CharField(max_length=64)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    service = GenericForeignKey('content_type', 'object_id')
+    payload = models.JSONField(default=dict)
+    done = models.JSONField(default=list)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type}#{self.object_id}"
+
+# ========================================Outbox End===================================
@@ -0,0 +1,116 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from collections import defaultdict
+from decimal import Decimal
+import datetime, logging
+
+
+logger = logging.getLogger(__name__)
+_consumers = defaultdict(dict)
+
+
+# ========================================Outbox Start===================================
+def consumer(*event_types, name=None):
+    """
+    Registers a function as a consumer of the given event types; it is called
+    with the OutboxEvent by drain_outbox. Consumers are tracked per event by
+    name, so a retried event only runs the consumers that have not succeeded.
+    """
+    def register(func):
+        for event_type in event_types:
+            _consumers[event_type][name or f"{func.__module__}.{func.__qualname__}"] = func
+        return func
+    return register
+
+
+def consumers_for(event_type):
+    return _consumers.get(event_type, {})
+
+
+def emit(event_type, instance, **payload):
+    """
+    Writes one OutboxEvent for instance in the current transaction, so the
+    event exists exactly when the state change it describes commits.
+    """
+    from .models import OutboxEvent
+    return OutboxEvent.objects.create(
+        event_type=event_type,
+        content_type=ContentType.objects.get_for_model(instance.__class__),
+        object_id=instance.pk,
+        payload=payload,
+    )
+
+
+def _retry_delay(attempts):
+    return datetime.timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def drain_outbox(batch_size=100):
+    """
+    Runs the consumers of up to batch_size due events and returns how many
+    were picked. Rows are claimed with select_for_update(skip_locked=True),
+    so several workers can drain side by side. Each consumer runs in its own
+    savepoint: a failing one is retried later with backoff while the ones
+    that succeeded are recorded and not run again.
+    """
+    from .models import OutboxEvent
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(OutboxEvent.objects
+                      .select_for_update(skip_locked=True)
+                      .filter(processed_at__isnull=True, available_at__lte=now)
+                      .order_by('id')[:batch_size])
+        for event in events:
+            failed = False
+            for name, func in consumers_for(event.event_type).items():
+                if name in event.done:
+                    continue
+                try:
+                    with transaction.atomic():
+                        func(event)
+                    event.done.append(name)
+                except Exception as exc:
+                    failed = True
+                    event.last_error = f"{name}: {exc}"[:1000]
+                    logger.exception("Outbox consumer %s failed on event %s", name, event.pk)
+            if failed:
+                event.attempts += 1
+                event.available_at = now + _retry_delay(event.attempts)
+            else:
+                event.processed_at = now
+        OutboxEvent.objects.bulk_update(events, ['done', 'attempts', 'last_error', 'available_at', 'processed_at'])
+    return len(events)
+
+# ========================================Outbox End===================================
+
+
+
+# ========================================Outbox Consumers Start===================================
+def _state(value):
+    return (value[0], Decimal(value[1])) if value else None
+
+
+@consumer('invoice.saved', 'invoice.paid', 'payout.saved', 'withdraw.saved', name='analytics-rollup')
+def rollup_consumer(event):
+    from .rollups import shift_rollup
+    rollup = event.payload['rollup']
+    shift_rollup(
+        rollup['merchant_id'], datetime.date.fromisoformat(rollup['day']), rollup['kind'],
+        _state(rollup['old']), _state(rollup['new']), fee=Decimal(rollup['fee']),
+    )
+
+
+@consumer('invoice.paid', name='ledger-credit')
+def ledger_credit_consumer(event):
+    from .models import Invoice
+    from .wallet import credit_invoice
+    invoice = Invoice.objects.select_for_update().filter(pk=event.object_id).first()
+    if invoice is None or not invoice.is_creditable():
+        return
+    # The deposit fee is only known once credited, so it is booked here
+    # rather than with the invoice's status move.
+    trx = credit_invoice(invoice)
+    invoice._shift_rollup(invoice, fee=invoice._booked_fee(trx, already_booked=False))
+
+# ========================================Outbox Consumers End===================================
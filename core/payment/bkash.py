@@ -1,5 +1,7 @@
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
 import requests
+from requests.adapters import HTTPAdapter
 from rest_framework import views
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
@@ -8,19 +10,75 @@ from core.models import Invoice
 from rest_framework.exceptions import NotFound, ValidationError
 from core.utils import DataEncryptDecrypt
 from urllib.parse import urlencode
-from authentication.models import BasePaymentGateWay
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from core.utils import render_api_response
+from .breaker import record_call
+from .rotation import get_next_gateway
+from .registry import gateway_registry
+from django.views import View
+import asyncio, hashlib, httpx, random, threading, time, uuid, weakref
 import os
 
-BKASH_ID_TOKEN_CACHE_KEY = "bkash:id_token"
-BKASH_REFRESH_TOKEN_CACHE_KEY = "bkash:refresh_token"
-BKASH_ID_TOKEN_TTL = 55 * 60
+BKASH_ID_TOKEN_TTL = 60 * 60  # when the grant response has no expires_in
 BKASH_REFRESH_TOKEN_TTL = 24 * 60 * 60
+BKASH_TOKEN_EXPIRY_SLACK = 5 * 60
+# One token fetch per gateway at a time; the lock outlives a timed-out refresh plus grant.
+BKASH_TOKEN_LOCK_TTL = 2 * int(settings.BKASH_CONNECT_TIMEOUT + settings.BKASH_READ_TIMEOUT) + 5
+BKASH_TOKEN_WAIT = 0.05
 
 
+def bkash_token_key(method_uuid):
+    return f"bkash:tokens:{method_uuid}"
+
+
+def bkash_token_lock_key(method_uuid):
+    return f"bkash:tokens-lock:{method_uuid}"
+
+
+# Compare-and-delete, so a holder whose lock expired cannot drop the lock another worker took since.
+_RELEASE_LOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def release_token_lock(key, token):
+    """Deletes the token lock at key only while it still holds this holder's token."""
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        client = backend._cache.get_client(key, write=True)
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, backend.make_and_validate_key(key), backend._cache._serializer.dumps(token))
+    elif backend.get(key) == token:
+        # LocMemCache is per process; get and delete is close enough there.
+        backend.delete(key)
+
 
 class BKashError(Exception):
     pass
 
+
+_bkash_sessions = {}
+_bkash_sessions_lock = threading.Lock()
+
+
+def bkash_session(gateway):
+    """
+    The worker's pooled keep-alive requests.Session for a gateway, so calls
+    reuse open TCP/TLS connections instead of handshaking every time.
+    Retries are left to BKashClient._post, which only retries status queries.
+    """
+    key = (gateway.method_uuid, gateway.base_url)
+    session = _bkash_sessions.get(key)
+    if session is None:
+        with _bkash_sessions_lock:
+            session = _bkash_sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.BKASH_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _bkash_sessions[key] = session
+    return session
+
+
 class BKashClient:
     def __init__(self, random_bkash_gateway):
         self.base = f"{random_bkash_gateway.base_url}tokenized/checkout/"
@@ -29,9 +87,17 @@ class BKashClient:
         self.username = str(random_bkash_gateway.details_json["username"])
         self.password = str(random_bkash_gateway.details_json["password"])
         self.product_name = str(random_bkash_gateway.details_json["product_name"]) if random_bkash_gateway.details_json.get("product_name") else None
-
-    # ------- token helpers -------
-    def _grant_token(self):
+        self.method_uuid = random_bkash_gateway.method_uuid
+        self.token_key = bkash_token_key(random_bkash_gateway.method_uuid)
+        self.token_lock_key = bkash_token_lock_key(random_bkash_gateway.method_uuid)
+        # Tokens cached under other credentials (the gateway was edited) are ignored.
+        self.token_owner = hashlib.sha1(f"{self.base}|{self.app_key}|{self.username}".encode()).hexdigest()
+        # None sends every call on a new connection through requests.post.
+        self.session = bkash_session(random_bkash_gateway) if settings.BKASH_POOLED_SESSIONS else None
+        self.timeout = (settings.BKASH_CONNECT_TIMEOUT, settings.BKASH_READ_TIMEOUT)
+
+    # ------- request / response shapes (shared with AsyncBKashClient) -------
+    def _grant_request(self):
         url = f"{self.base}token/grant"
         data = {
             "app_key": self.app_key,
@@ -42,67 +108,57 @@ class BKashClient:
             "password": self.password,
             "Content-Type": "application/json"
         }
-        r = requests.post(url, json=data, headers=headers)
+        return url, data, headers
+
+    def _refresh_request(self, refresh_token):
+        url, data, headers = self._grant_request()
+        return f"{self.base}token/refresh", {**data, "refresh_token": refresh_token}, headers
+
+    def _read_tokens(self, r, action, previous=None):
+        """The cache entry for a grant or refresh response; a refresh may keep the previous refresh token."""
         if r.status_code != 200:
-            raise BKashError(f"Grant token failed: {r.status_code} {r.text}")
+            raise BKashError(f"{action} failed: {r.status_code} {r.text}")
         body = r.json()
         id_token = body.get("id_token")
-        refresh_token = body.get("refresh_token")
+        refresh_token = body.get("refresh_token") or (previous or {}).get("refresh_token")
         token_type = body.get("token_type", "Bearer")
         if not id_token or not refresh_token:
-            raise BKashError(f"Bad grant token response: {body}")
-
-        # cache.set(BKASH_ID_TOKEN_CACHE_KEY, f"{token_type} {id_token}", BKASH_ID_TOKEN_TTL)
-        # cache.set(BKASH_REFRESH_TOKEN_CACHE_KEY, refresh_token, BKASH_REFRESH_TOKEN_TTL)
-        return f"{token_type} {id_token}"
+            raise BKashError(f"Bad {action.lower()} response: {body}")
 
-    def _refresh_token(self, refresh_token):
-        url = self.base + "token/refresh"
-        data = {
-            "app_key": self.app_key,
-            "app_secret": self.app_secret,
-            "refresh_token": refresh_token
-        }
-        headers = {
-            "username": self.username,
-            "password": self.password,
-            "Content-Type": "application/json"
+        now = time.time()
+        if previous and refresh_token == previous["refresh_token"]:
+            refresh_expires_at = previous["refresh_expires_at"]
+        else:
+            refresh_expires_at = now + BKASH_REFRESH_TOKEN_TTL - BKASH_TOKEN_EXPIRY_SLACK
+        return {
+            "owner": self.token_owner,
+            "authorization": f"{token_type} {id_token}",
+            "expires_at": now + int(body.get("expires_in") or BKASH_ID_TOKEN_TTL) - BKASH_TOKEN_EXPIRY_SLACK,
+            "refresh_token": refresh_token,
+            "refresh_expires_at": refresh_expires_at,
         }
-        r = requests.post(url, json=data, headers=headers, timeout=30)
-        if r.status_code != 200:
-            raise BKashError(f"Refresh token failed: {r.status_code} {r.text}")
-        body = r.json()
-        id_token = body.get("id_token")
-        new_refresh_token = body.get("refresh_token") or refresh_token
-        token_type = body.get("token_type", "Bearer")
-        cache.set(BKASH_ID_TOKEN_CACHE_KEY, f"{token_type} {id_token}", BKASH_ID_TOKEN_TTL)
-        cache.set(BKASH_REFRESH_TOKEN_CACHE_KEY, new_refresh_token, BKASH_REFRESH_TOKEN_TTL)
-        return f"{token_type} {id_token}"
 
-    def _authorization(self):
-        # token = cache.get(BKASH_ID_TOKEN_CACHE_KEY)
-        # if token:
-        #     return token
-        
-        # refresh_token = cache.get(BKASH_REFRESH_TOKEN_CACHE_KEY)
-        # if refresh_token:
-        #     try:
-        #         return self._refresh_token(refresh_token)
-        #     except Exception:
-        #         pass
-        return self._grant_token()
+    def _usable(self, tokens):
+        """(authorization or None, tokens worth refreshing or None) for a cache entry."""
+        if not tokens or tokens.get("owner") != self.token_owner:
+            return None, None
+        now = time.time()
+        if tokens["expires_at"] > now:
+            return tokens["authorization"], tokens
+        return None, tokens if tokens["refresh_expires_at"] > now else None
 
-    def _headers_auth(self):
+    def _token_timeout(self, tokens):
+        return max(1, int(tokens["refresh_expires_at"] - time.time()))
+
+    def _auth_headers(self, authorization):
         return {
             "accept": "application/json",
-            "Authorization": self._authorization(),
+            "Authorization": authorization,
             "X-App-Key": self.app_key,
             "content-type": "application/json"
         }
 
-    # ------- payment endpoints -------
-    def create_payment(self, *, amount, intent, merchant_invoice_number, payer_reference=None, mode="0011", agreement_id=None, callback_url=None):
-        url = f"{self.base}create"
+    def _create_payload(self, *, amount, intent, merchant_invoice_number, payer_reference=None, mode="0011", agreement_id=None, callback_url=None):
         payload = {
             "mode": mode,  # tokenization mode per bKash docs (sandbox often "0011")
             "callbackURL": callback_url,
@@ -115,26 +171,99 @@ class BKashClient:
             payload["payerReference"] = self.product_name if self.product_name is not None else "01770618575"
         if agreement_id:
             payload["agreementID"] = agreement_id
-        r = requests.post(url, json=payload, headers=self._headers_auth())
+        return payload
+
+    def _checked(self, r, action):
         if r.status_code != 200:
-            raise BKashError(f"Create payment failed: {r.status_code} {r.text}")
+            raise BKashError(f"{action} failed: {r.status_code} {r.text}")
         return r.json()
 
+    def _post(self, url, payload, headers, retries=0):
+        """
+        POST to bKash. Only idempotent calls pass retries: connection errors,
+        timeouts and 5xx answers are retried with jittered exponential backoff.
+        """
+        post = self.session.post if self.session is not None else requests.post
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                r = post(url, json=payload, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                record_call(self.method_uuid, None, time.perf_counter() - started)
+                if attempt == retries:
+                    raise
+            else:
+                record_call(self.method_uuid, r.status_code, time.perf_counter() - started)
+                if r.status_code < 500 or attempt == retries:
+                    return r
+            time.sleep(settings.BKASH_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    # ------- token helpers -------
+    def _grant_token(self):
+        url, data, headers = self._grant_request()
+        return self._read_tokens(self._post(url, data, headers), "Grant token")
+
+    def _refresh_token(self, tokens):
+        url, data, headers = self._refresh_request(tokens["refresh_token"])
+        return self._read_tokens(self._post(url, data, headers), "Refresh token", tokens)
+
+    def _fetch_tokens(self, stale):
+        if stale:
+            try:
+                return self._refresh_token(stale)
+            except (BKashError, requests.RequestException, ValueError):
+                pass
+        return self._grant_token()
+
+    def _authorization(self):
+        """
+        The gateway's id token from the cache. When it has expired, one caller
+        (across threads and processes, through a cache lock) refreshes it, or
+        grants a new one, while the others wait for the result.
+        """
+        authorization, stale = self._usable(cache.get(self.token_key))
+        if authorization:
+            return authorization
+        deadline = time.monotonic() + BKASH_TOKEN_LOCK_TTL
+        lock_token = uuid.uuid4().hex
+        locked = cache.add(self.token_lock_key, lock_token, BKASH_TOKEN_LOCK_TTL)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(BKASH_TOKEN_WAIT)
+            authorization, stale = self._usable(cache.get(self.token_key))
+            if authorization:
+                return authorization
+            locked = cache.add(self.token_lock_key, lock_token, BKASH_TOKEN_LOCK_TTL)
+        try:
+            # The previous holder may have stored tokens between our get and add.
+            authorization, stale = self._usable(cache.get(self.token_key))
+            if authorization:
+                return authorization
+            tokens = self._fetch_tokens(stale)
+            cache.set(self.token_key, tokens, self._token_timeout(tokens))
+            return tokens["authorization"]
+        finally:
+            if locked:
+                release_token_lock(self.token_lock_key, lock_token)
+
+    def _headers_auth(self):
+        return self._auth_headers(self._authorization())
+
+    # ------- payment endpoints -------
+    def create_payment(self, **kwargs):
+        r = self._post(f"{self.base}create", self._create_payload(**kwargs), self._headers_auth())
+        return self._checked(r, "Create payment")
+
     def execute_payment(self, payment_id: str):
         url = f"{self.base}execute"
         payload = {"paymentID": payment_id}
-        r = requests.post(url, json=payload, headers=self._headers_auth(), timeout=30)
-        if r.status_code != 200:
-            raise BKashError(f"Execute payment failed: {r.status_code} {r.text}")
-        return r.json()
+        r = self._post(url, payload, self._headers_auth())
+        return self._checked(r, "Execute payment")
 
     def query_payment(self, payment_id: str):
         url = self.base + "payment/status"
         payload = {"paymentID": payment_id}
-        r = requests.post(url, json=payload, headers=self._headers_auth(), timeout=30)
-        if r.status_code != 200:
-            raise BKashError(f"Query payment failed: {r.status_code} {r.text}")
-        return r.json()
+        r = self._post(url, payload, self._headers_auth(), retries=settings.BKASH_QUERY_RETRIES)
+        return self._checked(r, "Query payment")
 
     def refund(self, *, amount, payment_id, trx_id, sku=None, reason=None):
         url = self.base + "payment/refund"
@@ -148,41 +277,102 @@ class BKashClient:
         if reason:
             payload["reason"] = reason
 
-        r = requests.post(url, json=payload, headers=self._headers_auth(), timeout=30)
-        if r.status_code != 200:
-            raise BKashError(f"Refund failed: {r.status_code} {r.text}")
-        return r.json()
+        r = self._post(url, payload, self._headers_auth())
+        return self._checked(r, "Refund")
 
 
+_async_http_clients = weakref.WeakKeyDictionary()
 
-# ===============================================================================================
-def get_next_payment_gateway(method):
-    gateways = BasePaymentGateWay.objects.filter(method=method, is_active=True).order_by('id')
-    if not gateways.exists():
-        return None
-    
-    last_id = cache.get("last_used_bkash_id")
-    if last_id:
-        next_gateway = gateways.filter(id__gt=last_id).first()
-        if not next_gateway:
-            next_gateway = gateways.first()
-    
-    else:
-        next_gateway = gateways.first()
-    
-    cache.set("last_used_bkash_id", next_gateway.id, None)
-    return next_gateway
 
+def _async_http():
+    # httpx clients belong to the event loop they were opened on, so there is
+    # one pooled client per loop (one per process under ASGI).
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = _async_http_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.BKASH_READ_TIMEOUT, connect=settings.BKASH_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.BKASH_ASYNC_MAX_CONNECTIONS),
+        )
+    return client
 
-class BKashCreatePaymentView(views.APIView):
-    def _create_and_maybe_redirect(self, request, invoice_payment_id: str):
-        if not invoice_payment_id:
-            raise ValidationError({"invoice_payment_id": "This field is required."})
+
+class AsyncBKashClient(BKashClient):
+    """BKashClient for the async checkout views: same calls, awaited over a shared httpx pool."""
+    async def _post(self, url, payload, headers):
+        started = time.perf_counter()
         try:
-            invoice = Invoice.objects.get(invoice_payment_id=invoice_payment_id)
-        except Invoice.DoesNotExist:
-            raise NotFound("Invoice not found.")
-        
+            r = await _async_http().post(url, json=payload, headers=headers)
+        except httpx.TransportError:
+            record_call(self.method_uuid, None, time.perf_counter() - started)
+            raise
+        record_call(self.method_uuid, r.status_code, time.perf_counter() - started)
+        return r
+
+    async def _fetch_tokens(self, stale):
+        if stale:
+            try:
+                url, data, headers = self._refresh_request(stale["refresh_token"])
+                return self._read_tokens(await self._post(url, data, headers), "Refresh token", stale)
+            except (BKashError, httpx.HTTPError, ValueError):
+                pass
+        url, data, headers = self._grant_request()
+        return self._read_tokens(await self._post(url, data, headers), "Grant token")
+
+    async def _authorization(self):
+        authorization, stale = self._usable(await cache.aget(self.token_key))
+        if authorization:
+            return authorization
+        deadline = time.monotonic() + BKASH_TOKEN_LOCK_TTL
+        lock_token = uuid.uuid4().hex
+        locked = await cache.aadd(self.token_lock_key, lock_token, BKASH_TOKEN_LOCK_TTL)
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(BKASH_TOKEN_WAIT)
+            authorization, stale = self._usable(await cache.aget(self.token_key))
+            if authorization:
+                return authorization
+            locked = await cache.aadd(self.token_lock_key, lock_token, BKASH_TOKEN_LOCK_TTL)
+        try:
+            authorization, stale = self._usable(await cache.aget(self.token_key))
+            if authorization:
+                return authorization
+            tokens = await self._fetch_tokens(stale)
+            await cache.aset(self.token_key, tokens, self._token_timeout(tokens))
+            return tokens["authorization"]
+        finally:
+            if locked:
+                await sync_to_async(release_token_lock)(self.token_lock_key, lock_token)
+
+    async def _headers_auth(self):
+        return self._auth_headers(await self._authorization())
+
+    async def create_payment(self, **kwargs):
+        r = await self._post(f"{self.base}create", self._create_payload(**kwargs), await self._headers_auth())
+        return self._checked(r, "Create payment")
+
+    async def execute_payment(self, payment_id: str):
+        r = await self._post(f"{self.base}execute", {"paymentID": payment_id}, await self._headers_auth())
+        return self._checked(r, "Execute payment")
+
+    async def query_payment(self, payment_id: str):
+        r = await self._post(self.base + "payment/status", {"paymentID": payment_id}, await self._headers_auth())
+        return self._checked(r, "Query payment")
+
+
+
+def bkash_client(gateway):
+    """The worker's BKashClient for gateway, built once per gateway registry snapshot."""
+    return gateway_registry().client(BKashClient, gateway)
+
+
+def async_bkash_client(gateway):
+    """AsyncBKashClient counterpart of bkash_client (call it through sync_to_async; the registry may load)."""
+    return gateway_registry().client(AsyncBKashClient, gateway)
+
+
+# ===============================================================================================
+class BKashCreatePaymentMixin:
+    def invoice_state_error(self, invoice):
         if invoice.pay_status.lower() == 'paid':
             return Response(
                 {
@@ -197,42 +387,39 @@ class BKashCreatePaymentView(views.APIView):
                     'message': f"This invoice is already {invoice.pay_status} and cannot be edited."
                 }
             )
-        
-        random_bkash_gateway = get_next_payment_gateway(method='bkash')
-        if random_bkash_gateway is None:
-            return Response(
-                {
-                    'status': False,
-                    'message': 'No Bkash Payment Method Found!'
-                }
-            )
-        
-        invoice.payment_gateway = random_bkash_gateway
-        invoice.save(update_fields=["payment_gateway"])
-        client = BKashClient(invoice.payment_gateway)
+        return None
+    
+    def no_gateway_response(self):
+        return Response(
+            {
+                'status': False,
+                'message': 'No Bkash Payment Method Found!'
+            }
+        )
+    
+    def create_payment_kwargs(self, invoice, invoice_payment_id):
         # callback_url = f"{invoice.payment_gateway.callback_base_url}?invoice_payment_id={invoice_payment_id}"
         callback_url = f"{invoice.payment_gateway.callback_base_url}{reverse('bkash_callback', kwargs={'invoice_payment_id': str(invoice_payment_id)})}"
-        try:
-            resp = client.create_payment(
-                amount=invoice.customer_amount,
-                intent="sale",
-                merchant_invoice_number=str(invoice.invoice_payment_id),
-                payer_reference=str(invoice.invoice_trxn),
-                mode="0011",
-                callback_url=callback_url
-            )
-        except BKashError as e:
-            return Response({"status": False, "message": str(e)}, status=502)
-
+        return dict(
+            amount=invoice.customer_amount,
+            intent="sale",
+            merchant_invoice_number=str(invoice.invoice_payment_id),
+            payer_reference=str(invoice.invoice_trxn),
+            mode="0011",
+            callback_url=callback_url
+        )
+    
+    def record_payment_id(self, invoice, resp):
         payment_id = resp.get("paymentID")
-        bkash_redirect_url = resp.get("bkashURL") or resp.get("bkashUrl") or resp.get("redirectURL")
-
         if payment_id:
             invoice.method_payment_id = payment_id
             invoice.pay_status = "pending"
             invoice.save(update_fields=["method_payment_id", "pay_status"])
-
-        if request.query_params.get("redirect") in ("1", "true", "yes"):
+    
+    def created_response(self, request, resp):
+        payment_id = resp.get("paymentID")
+        bkash_redirect_url = resp.get("bkashURL") or resp.get("bkashUrl") or resp.get("redirectURL")
+        if request.GET.get("redirect") in ("1", "true", "yes"):
             if bkash_redirect_url:
                 return redirect(bkash_redirect_url)
             return Response({"status": False, "message": "No bKash redirect URL returned."}, status=502)
@@ -243,35 +430,81 @@ class BKashCreatePaymentView(views.APIView):
             "redirectURL": bkash_redirect_url,
             "raw": resp
         }, status=200)
+
+
+class BKashCreatePaymentView(BKashCreatePaymentMixin, views.APIView):
+    def _create_and_maybe_redirect(self, request, invoice_payment_id: str):
+        if not invoice_payment_id:
+            raise ValidationError({"invoice_payment_id": "This field is required."})
+        try:
+            invoice = Invoice.objects.get(invoice_payment_id=invoice_payment_id)
+        except Invoice.DoesNotExist:
+            raise NotFound("Invoice not found.")
+        
+        state_error = self.invoice_state_error(invoice)
+        if state_error:
+            return state_error
+        
+        random_bkash_gateway = get_next_gateway('bkash')
+        if random_bkash_gateway is None:
+            return self.no_gateway_response()
+        
+        invoice.payment_gateway = random_bkash_gateway
+        invoice.save(update_fields=["payment_gateway"])
+        client = bkash_client(invoice.payment_gateway)
+        try:
+            resp = client.create_payment(**self.create_payment_kwargs(invoice, invoice_payment_id))
+        except BKashError as e:
+            return Response({"status": False, "message": str(e)}, status=502)
+
+        self.record_payment_id(invoice, resp)
+        return self.created_response(request, resp)
     
     def get(self, request, *args, **kwargs):
         return self._create_and_maybe_redirect(request, request.GET.get("invoice_payment_id"))
 
 
-class BKashCallbackView(views.APIView):
+class AsyncBKashCreatePaymentView(BKashCreatePaymentMixin, View):
+    """
+    BKashCreatePaymentView for ASYNC_CHECKOUT: the bKash round-trips are
+    awaited, so one worker serves many checkouts at once. Database writes
+    still go through Invoice.save in a thread.
+    """
+    async def get(self, request, *args, **kwargs):
+        invoice_payment_id = request.GET.get("invoice_payment_id")
+        if not invoice_payment_id:
+            return render_api_response(Response({"invoice_payment_id": "This field is required."}, status=400))
+        invoice = await Invoice.objects.filter(invoice_payment_id=invoice_payment_id).afirst()
+        if invoice is None:
+            return render_api_response(Response({"detail": "Invoice not found."}, status=404))
+        
+        state_error = self.invoice_state_error(invoice)
+        if state_error:
+            return render_api_response(state_error)
+        
+        random_bkash_gateway = await sync_to_async(get_next_gateway)('bkash')
+        if random_bkash_gateway is None:
+            return render_api_response(self.no_gateway_response())
+        
+        invoice.payment_gateway = random_bkash_gateway
+        await sync_to_async(invoice.save)(update_fields=["payment_gateway"])
+        client = await sync_to_async(async_bkash_client)(invoice.payment_gateway)
+        try:
+            resp = await client.create_payment(**self.create_payment_kwargs(invoice, invoice_payment_id))
+        except (BKashError, httpx.HTTPError) as e:
+            return render_api_response(Response({"status": False, "message": str(e)}, status=502))
+
+        await sync_to_async(self.record_payment_id)(invoice, resp)
+        return render_api_response(self.created_response(request, resp))
+
+
+class BKashCallbackMixin:
     def decrypt_data(self, data_json):
         encrypt_decrypt = DataEncryptDecrypt(data_json['key'])
         decrypt_data_json = encrypt_decrypt.decrypt_data(data_json['code'])
         return decrypt_data_json
     
-    def get(self, request, *args, **kwargs):
-        invoice_payment_id = kwargs.get('invoice_payment_id')
-        payment_id = request.GET.get("paymentID")
-        status = request.GET.get("status")
-        # signature = request.GET.get("signature")
-        
-        invoice = get_object_or_404(Invoice, method_payment_id=payment_id, invoice_payment_id=invoice_payment_id)
-
-        if not payment_id or not status:
-            raise ValidationError("Missing paymentID or status.")
-        
-        client = BKashClient(invoice.payment_gateway)
-        try:
-            response = client.execute_payment(payment_id=payment_id)
-        except BKashError as e:
-            return Response({"status": False, "message": str(e)}, status=502)
-        
-        
+    def apply_execute_result(self, invoice, status, response):
         client_callback_url = invoice.callback_url
         # query_string = urlencode(response)
         
@@ -348,6 +581,52 @@ class BKashCallbackView(views.APIView):
             }, status=400)
 
 
+class BKashCallbackView(BKashCallbackMixin, views.APIView):
+    def get(self, request, *args, **kwargs):
+        invoice_payment_id = kwargs.get('invoice_payment_id')
+        payment_id = request.GET.get("paymentID")
+        status = request.GET.get("status")
+        # signature = request.GET.get("signature")
+        
+        invoice = get_object_or_404(Invoice, method_payment_id=payment_id, invoice_payment_id=invoice_payment_id)
+
+        if not payment_id or not status:
+            raise ValidationError("Missing paymentID or status.")
+        
+        client = bkash_client(invoice.payment_gateway)
+        try:
+            response = client.execute_payment(payment_id=payment_id)
+        except BKashError as e:
+            return Response({"status": False, "message": str(e)}, status=502)
+        
+        return self.apply_execute_result(invoice, status, response)
+
+
+class AsyncBKashCallbackView(BKashCallbackMixin, View):
+    """BKashCallbackView for ASYNC_CHECKOUT: the execute call is awaited, the invoice update runs in a thread."""
+    async def get(self, request, *args, **kwargs):
+        invoice_payment_id = kwargs.get('invoice_payment_id')
+        payment_id = request.GET.get("paymentID")
+        status = request.GET.get("status")
+        
+        invoice = await Invoice.objects.select_related('payment_gateway').filter(
+            method_payment_id=payment_id, invoice_payment_id=invoice_payment_id
+        ).afirst()
+        if invoice is None:
+            return render_api_response(Response({"detail": "No Invoice matches the given query."}, status=404))
+
+        if not payment_id or not status:
+            return render_api_response(Response(["Missing paymentID or status."], status=400))
+        
+        client = await sync_to_async(async_bkash_client)(invoice.payment_gateway)
+        try:
+            response = await client.execute_payment(payment_id=payment_id)
+        except (BKashError, httpx.HTTPError) as e:
+            return render_api_response(Response({"status": False, "message": str(e)}, status=502))
+        
+        return render_api_response(await sync_to_async(self.apply_execute_result)(invoice, status, response))
+
+
 
 class BKashQueryPaymentView(views.APIView):
     def get(self, request, *args, **kwargs):
@@ -359,7 +638,7 @@ class BKashQueryPaymentView(views.APIView):
         if not invoice:
             return Response({"status": False, "message": "No Invoice Detec with this paymentID"}, status=400)
         
-        client = BKashClient(invoice.payment_gateway)
+        client = bkash_client(invoice.payment_gateway)
         try:
             data = client.query_payment(payment_id)
         except BKashError as e:
@@ -0,0 +1,135 @@
+"""
+Per-gateway circuit breaker kept in the shared cache, so every worker sees
+the same health for a BasePaymentGateWay (keyed by method_uuid).
+
+closed     calls are counted in GATEWAY_BREAKER_BUCKET-second buckets; once the
+           last GATEWAY_BREAKER_WINDOW seconds hold GATEWAY_BREAKER_MIN_CALLS
+           calls and too many failed or were slow, the circuit opens.
+open       rotation skips the gateway for GATEWAY_BREAKER_COOLDOWN seconds.
+half-open  after the cooldown rotation hands the gateway out once more; the
+           first call that reports back closes the circuit (fresh counters)
+           or opens it again.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import time
+
+
+# ========================================Gateway Circuit Breaker Start===================================
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+# bKash answers these for bad credentials and throttling.
+FAILURE_STATUS_CODES = frozenset((401, 403, 429))
+
+
+def breaker_key(method_uuid):
+    return f"gateway-breaker:{method_uuid}"
+
+
+def breaker_probe_key(method_uuid):
+    return f"gateway-breaker-probe:{method_uuid}"
+
+
+def breaker_bucket_key(method_uuid, epoch, bucket, counter):
+    return f"gateway-breaker:{method_uuid}:{epoch}:{bucket}:{counter}"
+
+
+def is_failure(status_code):
+    return status_code is None or status_code >= 500 or status_code in FAILURE_STATUS_CODES
+
+
+def _window(method_uuid, epoch, now):
+    """The bucket keys of the rolling window per counter."""
+    last = int(now // settings.GATEWAY_BREAKER_BUCKET)
+    buckets = range(last - settings.GATEWAY_BREAKER_WINDOW // settings.GATEWAY_BREAKER_BUCKET + 1, last + 1)
+    return {
+        counter: [breaker_bucket_key(method_uuid, epoch, bucket, counter) for bucket in buckets]
+        for counter in ('calls', 'failures', 'slow')
+    }
+
+
+def _state(entry, now):
+    if entry is None or entry['state'] == CLOSED:
+        return CLOSED
+    return HALF_OPEN if now - entry['opened_at'] >= settings.GATEWAY_BREAKER_COOLDOWN else OPEN
+
+
+def _counts(method_uuid, epoch, now):
+    keys = _window(method_uuid, epoch, now)
+    values = cache.get_many([key for names in keys.values() for key in names])
+    return {counter: sum(values.get(key, 0) for key in names) for counter, names in keys.items()}
+
+
+def _trips(counts):
+    calls = counts['calls']
+    if calls < settings.GATEWAY_BREAKER_MIN_CALLS:
+        return False
+    return (counts['failures'] / calls >= settings.GATEWAY_BREAKER_FAILURE_RATE
+            or counts['slow'] / calls >= settings.GATEWAY_BREAKER_SLOW_RATE)
+
+
+def _incr(key):
+    ttl = settings.GATEWAY_BREAKER_WINDOW + settings.GATEWAY_BREAKER_BUCKET
+    cache.add(key, 0, ttl)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between add and incr.
+        cache.set(key, 1, ttl)
+
+
+def record_call(method_uuid, status_code, latency):
+    """Counts one gateway call; status_code is None when no response came back."""
+    failed = is_failure(status_code)
+    slow = latency * 1000 >= settings.GATEWAY_BREAKER_SLOW_MS
+    now = time.time()
+    entry = cache.get(breaker_key(method_uuid))
+    state = _state(entry, now)
+    epoch = entry['epoch'] if entry else 0
+
+    if state == HALF_OPEN:
+        # The probe decides: close with fresh counters or open for another cooldown.
+        if failed or slow:
+            cache.set(breaker_key(method_uuid), {'state': OPEN, 'epoch': epoch, 'opened_at': now}, None)
+        else:
+            cache.set(breaker_key(method_uuid), {'state': CLOSED, 'epoch': epoch + 1, 'opened_at': None}, None)
+        cache.delete(breaker_probe_key(method_uuid))
+        return
+    if state == OPEN:
+        return  # calls still in flight from before the circuit opened
+
+    bucket = int(now // settings.GATEWAY_BREAKER_BUCKET)
+    _incr(breaker_bucket_key(method_uuid, epoch, bucket, 'calls'))
+    if failed:
+        _incr(breaker_bucket_key(method_uuid, epoch, bucket, 'failures'))
+    if slow:
+        _incr(breaker_bucket_key(method_uuid, epoch, bucket, 'slow'))
+    if (failed or slow) and _trips(_counts(method_uuid, epoch, now)):
+        cache.set(breaker_key(method_uuid), {'state': OPEN, 'epoch': epoch, 'opened_at': now}, None)
+
+
+def circuit_states(method_uuids):
+    """{method_uuid: state} for several gateways in one cache read."""
+    now = time.time()
+    entries = cache.get_many([breaker_key(method_uuid) for method_uuid in method_uuids])
+    return {method_uuid: _state(entries.get(breaker_key(method_uuid)), now) for method_uuid in method_uuids}
+
+
+def claim_probe(method_uuid):
+    """Whether this caller sends the single half-open probe of this cooldown."""
+    return cache.add(breaker_probe_key(method_uuid), time.time(), settings.GATEWAY_BREAKER_COOLDOWN)
+
+
+def circuit_status(method_uuid):
+    now = time.time()
+    entry = cache.get(breaker_key(method_uuid))
+    counts = _counts(method_uuid, entry['epoch'] if entry else 0, now)
+    calls = counts['calls']
+    return {
+        'state': _state(entry, now),
+        'opened_at': entry['opened_at'] if entry else None,
+        'calls': calls,
+        'failure_rate': round(counts['failures'] / calls, 3) if calls else 0,
+        'slow_rate': round(counts['slow'] / calls, 3) if calls else 0,
+    }
+
+# ========================================Gateway Circuit Breaker End===================================
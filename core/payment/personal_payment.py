@@ -5,8 +5,7 @@ from .serializers import PersonalAgentPaymentProcessSerializer
 from rest_framework import status, views
 from core.models import Invoice
 from rest_framework.exceptions import ValidationError
-from authentication.models import BasePaymentGateWay
-from django.core.cache import cache
+from .rotation import get_next_gateway
 from authentication.models import StorePaymentMessage
 from django.db import transaction
 from django.db.models import Q
@@ -149,17 +148,7 @@ class PersonalAgentPaymentBaseView(views.APIView):
             raise Exception("Not Invoice Found with this Payment ID!")
 
     def _get_next_gateway(self, method: str):
-        qs = BasePaymentGateWay.objects.filter(method=method).order_by('id')
-        if not qs.exists():
-            return None
-        cache_key = f"last_used_{method}_id"
-        last_id = cache.get(cache_key)
-        if last_id:
-            nxt = qs.filter(id__gt=last_id).first() or qs.first()
-        else:
-            nxt = qs.first()
-        cache.set(cache_key, nxt.id, None)
-        return nxt
+        return get_next_gateway(method)
 
     def _verify_payment(self, transaction_id: str, invoice):
         src_q = Q()
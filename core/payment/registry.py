@@ -0,0 +1,127 @@
+"""
+In-process registry of the active BasePaymentGateWay rows. Each worker
+keeps one immutable GatewaySnapshot (gateways, weighted rotation slots per
+method, and the API clients built from them) and swaps in a new one when:
+
+- a gateway is saved or deleted in this process (signal), or
+- the version token in the shared cache changes, which is how a save in
+  another worker reaches this one, or
+- GATEWAY_REGISTRY_TTL seconds passed, for changes that skip signals
+  (queryset.update()).
+
+Picking a gateway therefore runs no queries; the registry itself costs one
+cache read of the version token.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from authentication.models import BasePaymentGateWay
+from types import MappingProxyType
+import threading, time, uuid
+
+
+REGISTRY_VERSION_KEY = "gateway-registry-version"
+
+
+# ========================================Gateway Registry Start===================================
+def weighted_slots(weights):
+    """
+    Smooth weighted round-robin order for {gateway_id: weight}: every id
+    appears weight times, spread out instead of in runs (weights 1, 1, 2
+    give c a b c rather than a b c c).
+    """
+    current = {gateway_id: 0 for gateway_id in weights}
+    total = sum(weights.values())
+    slots = []
+    for _ in range(total):
+        for gateway_id, weight in weights.items():
+            current[gateway_id] += weight
+        chosen = max(current, key=current.get)
+        current[chosen] -= total
+        slots.append(chosen)
+    return slots
+
+
+class GatewaySnapshot:
+    """The active gateways as loaded at one version; never changed after it is built."""
+    def __init__(self, version, gateways):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.gateways = MappingProxyType({gateway.method_uuid: gateway for gateway in gateways})
+        by_method = {}
+        for gateway in gateways:
+            by_method.setdefault(gateway.method, []).append(gateway)
+        self.rotations = MappingProxyType({
+            method: (
+                tuple(weighted_slots({gateway.id: gateway.weight for gateway in members if gateway.weight > 0})),
+                MappingProxyType({gateway.id: gateway for gateway in members}),
+            )
+            for method, members in by_method.items()
+        })
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def rotation(self, method):
+        """(slots, {id: gateway}) of method; empty when it has no active gateway."""
+        return self.rotations.get(method, ((), MappingProxyType({})))
+
+    def client(self, factory, gateway):
+        """
+        factory(gateway) built once per snapshot for a gateway in it; other
+        gateways (inactive ones an old invoice still points at) get a new one.
+        """
+        current = self.gateways.get(gateway.method_uuid)
+        if current is None:
+            return factory(gateway)
+        key = (factory, gateway.method_uuid)
+        client = self._clients.get(key)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory(current)
+        return client
+
+
+_snapshot = None
+_load_lock = threading.Lock()
+
+
+def _current_version():
+    version = cache.get(REGISTRY_VERSION_KEY)
+    if version is None:
+        # Evicted or never set: every worker reloads once on the new token.
+        cache.add(REGISTRY_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(REGISTRY_VERSION_KEY)
+    return version
+
+
+def gateway_registry():
+    """The worker's current GatewaySnapshot, reloaded when stale."""
+    global _snapshot
+    version = _current_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < settings.GATEWAY_REGISTRY_TTL:
+        return snapshot
+    with _load_lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.loaded_at >= settings.GATEWAY_REGISTRY_TTL:
+            snapshot = _snapshot = GatewaySnapshot(version, list(BasePaymentGateWay.objects.filter(is_active=True).order_by('id')))
+    return snapshot
+
+
+def invalidate_gateways():
+    """
+    Drops this worker's snapshot and gives the others a new version token,
+    now and again after commit, so a worker that reloaded before the commit
+    reloads once more.
+    """
+    def bump():
+        global _snapshot
+        _snapshot = None
+        cache.set(REGISTRY_VERSION_KEY, uuid.uuid4().hex, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+# ========================================Gateway Registry End===================================
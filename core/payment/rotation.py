@@ -0,0 +1,54 @@
+"""
+Weighted round-robin over the active BasePaymentGateWay rows of a method,
+shared by every worker: the slot list comes from the in-process gateway
+registry and each pick advances one atomic cache counter, so N picks over
+gateways weighted w1..wk split exactly in proportion however many workers
+make them. With the per-process LocMemCache (no REDIS_URL) that only holds
+per process.
+"""
+from django.core.cache import cache
+from .breaker import CLOSED, HALF_OPEN, circuit_states, claim_probe
+from .registry import gateway_registry
+
+
+# ========================================Gateway Rotation Start===================================
+def rotation_counter_key(method):
+    return f"gateway-rotation-counter:{method}"
+
+
+def next_slot(method):
+    key = rotation_counter_key(method)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr.
+        cache.add(key, 1, None)
+        return 1
+
+
+def get_next_gateway(method):
+    """
+    The next gateway of method by weight, skipping gateways whose circuit is
+    open (a half-open one goes to the single caller that claims its probe).
+    None when there is no active gateway or every circuit is open.
+    """
+    slots, gateways = gateway_registry().rotation(method)
+    if not slots:
+        return None
+    start = next_slot(method)
+    states = circuit_states([gateway.method_uuid for gateway in gateways.values()])
+    tried = set()
+    for n in range(len(slots)):
+        gateway = gateways[slots[(start + n) % len(slots)]]
+        if gateway.id in tried:
+            continue
+        tried.add(gateway.id)
+        state = states[gateway.method_uuid]
+        if state == CLOSED or (state == HALF_OPEN and claim_probe(gateway.method_uuid)):
+            return gateway
+        if len(tried) == len(gateways):
+            break
+    return None
+
+# ========================================Gateway Rotation End===================================
@@ -0,0 +1,29 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder keeps working without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer writing compact responses with orjson. Types orjson leaves
+    to `default` (datetimes, Decimal, lazy strings, querysets) go through
+    DRF's encoder, so the bytes match JSONRenderer's. Indented output and
+    installs without orjson use JSONRenderer itself.
+    """
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer: U+2028/U+2029 are valid JSON but not valid javascript.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
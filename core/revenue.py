@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db.models import F, Sum, Count
+from django.db.models.functions import Coalesce, TruncDate
+from django.db import transaction, IntegrityError
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from decimal import Decimal
+import random
+
+
+REVENUE_SHARDS = 8
+
+
+# ========================================Platform Revenue Start===================================
+def fee_bucket(tran_type, model_name):
+    """Same buckets as WalletTransaction._which_fee_bucket, with 'other' for the rest."""
+    tran = (tran_type or '').lower()
+    model_name = (model_name or '').lower().replace('_', '')
+    if tran == 'credit' and model_name == 'invoice':
+        return 'deposit'
+    if tran == 'debit' and model_name == 'paymenttransfer':
+        return 'payout'
+    if tran == 'debit' and model_name == 'withdrawrequest':
+        return 'withdraw'
+    return 'other'
+
+
+def add_to_counters(model, lookup, **deltas):
+    """Adds deltas to the counter row matching lookup, creating it on first use."""
+    rows = model.objects.filter(**lookup)
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        rows.update(**changes)
+
+
+def record_platform_fee(bucket, fee, count=1, day=None):
+    """
+    Adds fee revenue to the running account and the day row, inside the
+    caller's transaction so a rolled back success books nothing and a
+    committed one is never missing. The rows are sharded, so concurrent
+    payments do not queue on one counter row.
+    """
+    from .models import PlatformRevenueAccount, PlatformRevenueDaily
+    if not fee:
+        return
+    bucket = bucket or 'other'
+    day = day or timezone.localdate()
+    shard_no = random.randrange(REVENUE_SHARDS)
+    add_to_counters(PlatformRevenueAccount, {'bucket': bucket, 'shard_no': shard_no},
+                    total_fee=fee, transaction_count=count)
+    add_to_counters(PlatformRevenueDaily, {'day': day, 'bucket': bucket, 'shard_no': shard_no},
+                    total_fee=fee, transaction_count=count)
+
+
+def _revenue_rows(by_day=True):
+    """
+    Successful fee totals and counts per (created day, bucket) from
+    WalletTransaction; the day is None without by_day.
+    """
+    from .models import WalletTransaction
+    rows = WalletTransaction.objects.filter(status='success', fee__gt=0)
+    group = ('tran_type', 'content_type_id')
+    if by_day:
+        rows = rows.annotate(day=TruncDate('created_at'))
+        group += ('day',)
+    rows = rows.values(*group).annotate(total=Coalesce(Sum('fee'), Decimal('0')), count=Count('id')).order_by()
+    totals = {}
+    for row in rows:
+        model_name = ContentType.objects.get_for_id(row['content_type_id']).model if row['content_type_id'] else None
+        key = (row.get('day'), fee_bucket(row['tran_type'], model_name))
+        fee, count = totals.get(key, (Decimal('0'), 0))
+        totals[key] = (fee + row['total'], count + row['count'])
+    return totals
+
+
+def platform_revenue():
+    """
+    Total fee revenue and the split per bucket, read from the account rows.
+    Without PLATFORM_REVENUE_READ (a database not yet backfilled) it is
+    aggregated from WalletTransaction instead.
+    """
+    from .models import PlatformRevenueAccount
+    if settings.PLATFORM_REVENUE_READ:
+        rows = (PlatformRevenueAccount.objects
+                .values('bucket')
+                .annotate(total=Sum('total_fee'))
+                .order_by())
+        totals = {row['bucket']: row['total'] for row in rows}
+    else:
+        totals = {}
+        for (_, bucket), (fee, count) in _revenue_rows(by_day=False).items():
+            totals[bucket] = totals.get(bucket, Decimal('0')) + fee
+    buckets = {bucket: total.quantize(Decimal('0.01')) for bucket, total in totals.items()}
+    return sum(buckets.values(), Decimal('0.00')), buckets
+
+
+def rebuild_platform_revenue():
+    """
+    Recomputes both revenue tables from successful WalletTransactions. The
+    success day is not stored, so historic rows are dated by created_at.
+    It is a backfill for existing data; run it with payments paused, since
+    a fee committed while it recounts can be dropped.
+    """
+    from .models import PlatformRevenueAccount, PlatformRevenueDaily
+    daily = _revenue_rows()
+    accounts = {}
+    for (day, bucket), (fee, count) in daily.items():
+        total_fee, total_count = accounts.get(bucket, (Decimal('0'), 0))
+        accounts[bucket] = (total_fee + fee, total_count + count)
+
+    with transaction.atomic():
+        PlatformRevenueAccount.objects.all().delete()
+        PlatformRevenueDaily.objects.all().delete()
+        PlatformRevenueAccount.objects.bulk_create([
+            PlatformRevenueAccount(bucket=bucket, total_fee=fee, transaction_count=count)
+            for bucket, (fee, count) in accounts.items()
+        ])
+        PlatformRevenueDaily.objects.bulk_create([
+            PlatformRevenueDaily(day=day, bucket=bucket, total_fee=fee, transaction_count=count)
+            for (day, bucket), (fee, count) in daily.items()
+        ], batch_size=1000)
+    return len(accounts), len(daily)
+
+# ========================================Platform Revenue End===================================
@@ -0,0 +1,185 @@
+from django.db.models import Sum, Count, OuterRef, Subquery, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from decimal import Decimal
+import datetime
+from .revenue import add_to_counters
+import random
+
+
+ROLLUP_SHARDS = 4
+ZERO = Decimal('0')
+# kind: (model name, amount field, fields joined into the status key)
+ROLLUP_SOURCES = {
+    'invoice': ('Invoice', 'customer_amount', ('status', 'pay_status')),
+    'withdraw': ('WithdrawRequest', 'amount', ('status',)),
+    'payout': ('PaymentTransfer', 'amount', ('status',)),
+}
+
+
+def invoice_rollup_status(status, pay_status):
+    return f"{status}:{pay_status}"
+
+
+# ========================================Wallet Rollup Start===================================
+def shift_rollup(merchant_id, day, kind, old, new, fee=ZERO):
+    """
+    Moves one row's contribution between rollup keys, inside the caller's
+    transaction so the rollups commit or roll back with the source row. old
+    and new are (status, amount) before and after the save, None when the
+    row did not exist; fee is added to the new key (fees are booked on the
+    transition that charges them).
+    """
+    from .models import WalletRollup
+    if merchant_id is None or (old == new and not fee):
+        return
+    lookup = {
+        'merchant_id': merchant_id,
+        'day': day,
+        'kind': kind,
+        'shard_no': random.randrange(ROLLUP_SHARDS),
+    }
+    if old and new and old[0] == new[0]:
+        moves = [(new[0], new[1] - old[1], fee, 0)]
+    else:
+        moves = ([(old[0], -old[1], ZERO, -1)] if old else []) + ([(new[0], new[1], fee, 1)] if new else [])
+    for status, amount, move_fee, count in moves:
+        add_to_counters(WalletRollup, {**lookup, 'status': status}, amount=amount, fee=move_fee, count=count)
+
+
+def book_created_rows(kind, rows):
+    """
+    Adds freshly inserted rows (e.g. from bulk_create) to the rollups with
+    one counter write per (merchant, day, status) instead of one per row.
+    rows are (merchant_id, day, status, amount).
+    """
+    from .models import WalletRollup
+    groups = {}
+    for merchant_id, day, status, amount in rows:
+        if merchant_id is None:
+            continue
+        amount_total, count = groups.get((merchant_id, day, status), (ZERO, 0))
+        groups[(merchant_id, day, status)] = (amount_total + amount, count + 1)
+    for (merchant_id, day, status), (amount, count) in groups.items():
+        lookup = {
+            'merchant_id': merchant_id,
+            'day': day,
+            'kind': kind,
+            'status': status,
+            'shard_no': random.randrange(ROLLUP_SHARDS),
+        }
+        add_to_counters(WalletRollup, lookup, amount=amount, fee=ZERO, count=count)
+
+
+def _source_model(kind):
+    from django.apps import apps
+    model_name, amount_field, status_fields = ROLLUP_SOURCES[kind]
+    return apps.get_model('core', model_name), amount_field, status_fields
+
+
+def rollup_totals(kind, merchant=None, start_day=None, end_day=None):
+    """
+    Amount per status key for a kind, over all days or the inclusive day
+    range. Platform-wide totals also add the rows whose merchant was deleted,
+    which have no rollup key; there are few of them and merchant is indexed.
+    """
+    from .models import WalletRollup
+    rows = WalletRollup.objects.filter(kind=kind)
+    if merchant is not None:
+        rows = rows.filter(merchant=merchant)
+    if start_day:
+        rows = rows.filter(day__gte=start_day)
+    if end_day:
+        rows = rows.filter(day__lte=end_day)
+    totals = {}
+    for row in rows.values('status').annotate(total=Sum('amount')).order_by():
+        totals[row['status']] = row['total'] or ZERO
+
+    if merchant is None:
+        model, amount_field, status_fields = _source_model(kind)
+        orphans = model.objects.filter(merchant__isnull=True)
+        if start_day:
+            orphans = orphans.filter(created_at__date__gte=start_day)
+        if end_day:
+            orphans = orphans.filter(created_at__date__lte=end_day)
+        for row in orphans.values(*status_fields).annotate(total=Sum(amount_field)).order_by():
+            key = ':'.join(row[name] for name in status_fields)
+            totals[key] = totals.get(key, ZERO) + (row['total'] or ZERO)
+    return totals
+
+
+def _parse_local(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return timezone.localtime(parsed)
+
+
+def whole_day_range(after=None, before=None):
+    """
+    (start_day, end_day) when a created_at_after / created_at_before pair
+    (gte / lte) covers whole local days, e.g. 2025-01-01T00:00 to
+    2025-01-31T23:59:59.999999; None when it cuts through a day.
+    """
+    start_day = end_day = None
+    try:
+        if after:
+            start = _parse_local(after)
+            if start is None or start.time() != datetime.time.min:
+                return None
+            start_day = start.date()
+        if before:
+            end = _parse_local(before)
+            if end is None or end.time() != datetime.time.max:
+                return None
+            end_day = end.date()
+    except ValueError:
+        return None
+    return start_day, end_day
+
+
+def _success_fee(model):
+    from .models import WalletTransaction
+    fees = (WalletTransaction.objects
+            .filter(content_type=ContentType.objects.get_for_model(model), object_id=OuterRef('pk'), status='success')
+            .values('fee')[:1])
+    return Coalesce(Subquery(fees), ZERO, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def rebuild_wallet_rollups():
+    """
+    Recomputes WalletRollup from the invoice, withdraw and payout tables.
+    It is a backfill for existing data; run it with payments paused, since
+    a move committed while it recounts can be dropped.
+    """
+    from .models import WalletRollup
+    rollups = []
+    for kind in ROLLUP_SOURCES:
+        model, amount_field, status_fields = _source_model(kind)
+        rows = (model.objects
+                .filter(merchant__isnull=False)
+                .annotate(day=TruncDate('created_at'), trx_fee=_success_fee(model))
+                .values('merchant_id', 'day', *status_fields)
+                .annotate(total=Sum(amount_field), fee_total=Sum('trx_fee'), rows=Count('id'))
+                .order_by())
+        for row in rows.iterator(chunk_size=2000):
+            rollups.append(WalletRollup(
+                merchant_id=row['merchant_id'], day=row['day'], kind=kind,
+                status=':'.join(row[name] for name in status_fields),
+                amount=row['total'] or ZERO, fee=row['fee_total'] or ZERO, count=row['rows'],
+            ))
+
+    with transaction.atomic():
+        WalletRollup.objects.all().delete()
+        WalletRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+# ========================================Wallet Rollup End===================================
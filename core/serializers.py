@@ -1,4 +1,4 @@
-from .models import Invoice, PaymentTransfer, WithdrawRequest, WalletTransaction
+from .models import Invoice, PaymentTransfer, PayoutBatch, WithdrawRequest, WalletTransaction
 from authentication.models import UserPaymentMethod
 from rest_framework import serializers
 from authentication.models import CustomUser
@@ -10,6 +10,51 @@ class InvoiceSerializer(serializers.ModelSerializer):
         model = Invoice
         fields = '__all__'
 
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Validates every item with the one child serializer and keeps going past
+    bad items: item_errors maps an item's index to its errors, and the
+    validated data is a list of (index, data) for the good ones.
+    """
+    items_name = 'items'
+    
+    def to_internal_value(self, data):
+        name = self.items_name
+        if not isinstance(data, list):
+            raise serializers.ValidationError({name: [f"Expected a list of {name}."]})
+        if not data:
+            raise serializers.ValidationError({name: ["This list may not be empty."]})
+        if self.max_length is not None and len(data) > self.max_length:
+            raise serializers.ValidationError({name: [f"Ensure this list has at most {self.max_length} {name}."]})
+        self.item_errors = {}
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+        return valid
+    
+    def save(self, **kwargs):
+        self.instance = self.create(self.validated_data, **kwargs)
+        return self.instance
+
+
+class BulkInvoiceListSerializer(BulkListSerializer):
+    items_name = 'invoices'
+    
+    def create(self, validated_data, **extra):
+        invoices = [Invoice(**attrs, **extra) for _, attrs in validated_data]
+        return list(zip((index for index, _ in validated_data), Invoice.create_many(invoices)))
+
+
+class BulkInvoiceSerializer(InvoiceSerializer):
+    class Meta(InvoiceSerializer.Meta):
+        # Bulk invoices always start unpaid and belong to the calling merchant.
+        read_only_fields = ('merchant', 'status', 'pay_status', 'transaction_id', 'method_payment_id', 'invoice_trxn')
+        list_serializer_class = BulkInvoiceListSerializer
+
+
 class CreatePaymentSerializer(serializers.ModelSerializer):
     
     class Meta:
@@ -19,6 +64,7 @@ class CreatePaymentSerializer(serializers.ModelSerializer):
 
 class PaymentTransferSerializer(serializers.ModelSerializer):
     store_name = serializers.SerializerMethodField()
+    compiled_sources = {'store_name': ('merchant__brand_name', None)}
     class Meta:
         model = PaymentTransfer
         fields = '__all__'
@@ -27,10 +73,37 @@ class PaymentTransferSerializer(serializers.ModelSerializer):
         return obj.merchant.brand_name
 
 
+class BulkPayoutListSerializer(BulkListSerializer):
+    items_name = 'payouts'
+    
+    def create(self, validated_data, merchant):
+        """Returns (batch, [(index, transfer), ...])."""
+        batch, transfers = PayoutBatch.submit(merchant, [PaymentTransfer(**attrs) for _, attrs in validated_data])
+        return batch, list(zip((index for index, _ in validated_data), transfers))
+
+
+class BulkPayoutSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentTransfer
+        # Batch payouts always start pending and belong to the calling merchant.
+        fields = ('receiver_name', 'receiver_number', 'amount', 'payment_method', 'payment_details', 'note')
+        list_serializer_class = BulkPayoutListSerializer
+    
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Payout amount must be greater than zero.")
+        return value
+
+
 class WithdrawRequestSerializer(serializers.ModelSerializer):
     store_name = serializers.SerializerMethodField()
     paymentMethod = serializers.SerializerMethodField()
     paymentDetails = serializers.SerializerMethodField()
+    compiled_sources = {
+        'store_name': ('merchant__brand_name', lambda brand_name: brand_name or None),
+        'paymentMethod': ('payment_method__method_type', None),
+        'paymentDetails': ('payment_method__params', None),
+    }
     class Meta:
         model = WithdrawRequest
         fields = '__all__'
@@ -51,9 +124,20 @@ class WithdrawRequestSerializer(serializers.ModelSerializer):
             return None
 
 
+WALLET_TRANSACTION_SOURCES = {
+    'paymenttransfer': 'Payout',
+    'withdrawrequest': 'Withdraw',
+    'invoice': 'Deposit',
+}
+
+
 class WalletTransactionSerializer(serializers.ModelSerializer):
     source = serializers.SerializerMethodField(read_only=True)
     store_name = serializers.SerializerMethodField()
+    compiled_sources = {
+        'source': ('content_type__model', WALLET_TRANSACTION_SOURCES.get),
+        'store_name': ('merchant__brand_name', None),
+    }
     class Meta:
         model = WalletTransaction
         fields = '__all__'
@@ -64,12 +148,7 @@ class WalletTransactionSerializer(serializers.ModelSerializer):
     def get_source(self, obj):
         content_type = obj.content_type
         if content_type:
-            if content_type.model == 'paymenttransfer':
-                return 'Payout'
-            elif content_type.model == 'withdrawrequest':
-                return 'Withdraw'
-            elif content_type.model == 'invoice':
-                return 'Deposit'
+            return WALLET_TRANSACTION_SOURCES.get(content_type.model)
         return None
     
 
@@ -0,0 +1,35 @@
+from authentication.models import CustomUser, Merchant
+from .models import WalletTransaction
+from django.test import Client
+from decimal import Decimal
+import uuid
+
+
+# ========================================Test Fixtures Start===================================
+class MerchantFixtureMixin:
+    """
+    Fixtures shared by the core and authentication test cases: a merchant
+    with flat 2 / 1 / 1 fees, a funded wallet, and a Client signed with the
+    merchant's API key.
+    """
+    def create_merchant(self, brand_name="Test", **fields):
+        user = CustomUser.objects.create(username=uuid.uuid4().hex[:12], first_name="Test", phone_number="0")
+        return Merchant.objects.create(
+            user=user, brand_name=brand_name, fees_type='Flat',
+            deposit_fees=Decimal('2'), payout_fees=Decimal('1'), withdraw_fees=Decimal('1'),
+            **fields,
+        )
+
+    def fund_wallet(self, merchant, amount=Decimal('1000')):
+        """Credits amount as a successful transaction; returns the merchant reloaded with its updated wallet."""
+        WalletTransaction.objects.create(
+            wallet=merchant.merchant_wallet, merchant=merchant, amount=amount, net_amount=amount,
+            status='success', tran_type='credit',
+        )
+        return Merchant.objects.get(pk=merchant.pk)
+
+    def api_client(self, merchant):
+        credential = merchant.api_keys
+        return Client(HTTP_API_KEY=credential.api_key, HTTP_SECRET_KEY=credential.secret_key)
+
+# ========================================Test Fixtures End===================================
@@ -1,3 +1,1283 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, RequestFactory, AsyncRequestFactory, override_settings
+from django.urls import reverse
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from authentication.models import BasePaymentGateWay, MerchantWallet
+from django.utils import timezone
+from django.db.models import F, Sum
+from .models import (
+    Invoice, PaymentTransfer, WithdrawRequest, WalletTransaction, IdempotencyKey, OutboxEvent, WalletRollup,
+    WalletLedgerEntry, MerchantWalletShard, PendingWalletCredit, PlatformRevenueAccount, PlatformRevenueDaily,
+)
+from .outbox import consumer, drain_outbox, _consumers
+from .idempotency import expire_idempotency_keys
+from .rollups import rollup_totals, whole_day_range
+from .wallet import (
+    WALLET_FIELDS, WalletMutation, LedgerWalletMutation, ShardedWalletMutation, wallet_mutation, wallet_totals,
+    compact_wallet_ledger, credit_shard, fold_wallet_shards, apply_pending_credits, credit_invoice,
+    transaction_effect, replay_wallet, repair_wallet,
+)
+from .management.commands.audit_wallets import _audit_wallet
+from .revenue import platform_revenue, rebuild_platform_revenue
+from .fees import FEE_BUCKETS, FeePolicy
+from .checkout import store_checkout_sessions, store_invoice_status, checkout_version_key, checkout_version_ttl, checkout_session_key, invoice_status_key
+from .views import GetOnlinePayment, AsyncGetOnlinePayment, VerifyPayment, AsyncVerifyPayment
+from .payment.bkash import BKashClient, AsyncBKashClient, BKashCallbackView, AsyncBKashCallbackView, BKashError, bkash_client, bkash_token_key, bkash_token_lock_key
+from .payment.breaker import breaker_key, circuit_status, record_call
+from .payment.rotation import get_next_gateway
+from .testing import MerchantFixtureMixin
+from .payment.registry import REGISTRY_VERSION_KEY, gateway_registry, weighted_slots
+from authentication.serializers import BasePaymentGateWaySerializer
+from .serializers import InvoiceSerializer, PaymentTransferSerializer, WithdrawRequestSerializer, WalletTransactionSerializer
+from .compiled import compiled_plan
+from .renderers import FastJSONRenderer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from django.utils.translation import gettext_lazy
+from asgiref.sync import async_to_sync
+from unittest import mock
+from decimal import Decimal, ROUND_HALF_EVEN
+import datetime, json, os, requests, threading, time, uuid
 
-# Create your tests here.
+
+# ========================================Wallet Mutation Start===================================
+class WalletMutationTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.wallet = self.create_merchant().merchant_wallet
+        self._set(balance=Decimal('100'))
+
+    def _set(self, **values):
+        MerchantWallet.objects.filter(pk=self.wallet.pk).update(**values)
+
+    def _row(self):
+        return tuple(MerchantWallet.objects.filter(pk=self.wallet.pk).values_list(*WALLET_FIELDS).get())
+
+    def test_hold_refuses_to_overdraw(self):
+        with self.assertRaisesMessage(ValidationError, "Insufficient available balance"):
+            WalletMutation(self.wallet.pk).hold(Decimal('150'))
+        self.assertEqual(self._row(), (Decimal('100'), Decimal('0'), Decimal('0')))
+        WalletMutation(self.wallet.pk).hold(Decimal('60'))
+        self.assertEqual(self._row(), (Decimal('40'), Decimal('60'), Decimal('0')))
+
+    def test_debit_refuses_to_overdraw(self):
+        with self.assertRaisesMessage(ValidationError, "Insufficient balance"):
+            WalletMutation(self.wallet.pk).debit(Decimal('100.01'))
+        mutation = WalletMutation(self.wallet.pk)
+        mutation.debit(Decimal('100'))
+        self.assertEqual(self._row(), (Decimal('0'), Decimal('0'), Decimal('100')))
+        self.assertEqual((mutation.balance_before, mutation.balance_after), (Decimal('100'), Decimal('0')))
+
+    def test_guard_checks_the_row_not_the_loaded_wallet(self):
+        mutation = WalletMutation(self.wallet.pk)
+        self._set(balance=Decimal('10'))  # another writer got there first
+        with self.assertRaises(ValidationError):
+            mutation.debit(Decimal('50'))
+        self.assertEqual(self._row(), (Decimal('10'), Decimal('0'), Decimal('0')))
+
+    def test_adjust_hold_is_guarded_by_available_balance(self):
+        self._set(withdraw_processing=Decimal('60'))  # available_balance 40
+        with self.assertRaisesMessage(ValidationError, "increase pending hold"):
+            WalletMutation(self.wallet.pk).adjust_hold(Decimal('41'))
+        WalletMutation(self.wallet.pk).adjust_hold(Decimal('40'))
+        self.assertEqual(self._row(), (Decimal('60'), Decimal('100'), Decimal('0')))
+        # Shrinking a hold is never refused.
+        WalletMutation(self.wallet.pk).adjust_hold(Decimal('-30'))
+        self.assertEqual(self._row(), (Decimal('90'), Decimal('70'), Decimal('0')))
+
+    def test_settle_and_release_move_the_hold(self):
+        WalletMutation(self.wallet.pk).hold(Decimal('60'))
+        WalletMutation(self.wallet.pk).settle_hold(Decimal('25'))
+        self.assertEqual(self._row(), (Decimal('40'), Decimal('35'), Decimal('25')))
+        WalletMutation(self.wallet.pk).release_hold(Decimal('35'))
+        self.assertEqual(self._row(), (Decimal('75'), Decimal('0'), Decimal('25')))
+
+# ========================================Wallet Mutation End===================================
+
+
+# ========================================Ledger Wallet Start===================================
+class LedgerWalletTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        wallet = self.create_merchant().merchant_wallet
+        MerchantWallet.objects.filter(pk=wallet.pk).update(balance=Decimal('100'), storage_mode='ledger')
+        self.wallet = MerchantWallet.objects.get(pk=wallet.pk)
+
+    def _row(self):
+        return tuple(MerchantWallet.objects.filter(pk=self.wallet.pk).values_list(*WALLET_FIELDS).get())
+
+    def _credit(self, amount, trx_uuid):
+        mutation = wallet_mutation(self.wallet)
+        mutation.credit(amount)
+        mutation.finish(trx_uuid)
+
+    def test_credit_appends_a_ledger_entry(self):
+        self.assertIsInstance(wallet_mutation(self.wallet), LedgerWalletMutation)
+        self._credit(Decimal('30'), 'trx-1')
+        self.assertEqual(self._row(), (Decimal('100'), Decimal('0'), Decimal('0')))
+        self.assertEqual(
+            list(WalletLedgerEntry.objects.filter(wallet=self.wallet).values_list('trx_uuid', *WALLET_FIELDS, 'compacted')),
+            [('trx-1', Decimal('30'), Decimal('0'), Decimal('0'), False)],
+        )
+
+    def test_totals_add_the_uncompacted_entries(self):
+        self._credit(Decimal('30'), 'trx-1')
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('130'), Decimal('0'), Decimal('0')))
+
+        # The hold is checked against row + entries, not the row's 100.
+        mutation = wallet_mutation(self.wallet)
+        mutation.hold(Decimal('120'))
+        mutation.finish('trx-2')
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('10'), Decimal('120'), Decimal('0')))
+        with self.assertRaisesMessage(ValidationError, "Insufficient available balance"):
+            wallet_mutation(self.wallet).hold(Decimal('11'))
+        self.assertEqual(self._row(), (Decimal('100'), Decimal('0'), Decimal('0')))
+
+    def test_compaction_folds_each_entry_once(self):
+        for n, amount in enumerate(('10', '20', '30')):
+            self._credit(Decimal(amount), f'trx-{n}')
+
+        self.assertEqual(compact_wallet_ledger(self.wallet.pk, batch_size=2), 2)
+        self.assertEqual(self._row(), (Decimal('130'), Decimal('0'), Decimal('0')))
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('160'), Decimal('0'), Decimal('0')))
+
+        self.assertEqual(compact_wallet_ledger(self.wallet.pk, batch_size=2), 1)
+        self.assertEqual(compact_wallet_ledger(self.wallet.pk, batch_size=2), 0)
+        self.assertEqual(self._row(), (Decimal('160'), Decimal('0'), Decimal('0')))
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('160'), Decimal('0'), Decimal('0')))
+        self.assertFalse(WalletLedgerEntry.objects.filter(wallet=self.wallet, compacted=False).exists())
+
+# ========================================Ledger Wallet End===================================
+
+
+# ========================================Sharded Wallet Start===================================
+class ShardedWalletTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        wallet = self.create_merchant().merchant_wallet
+        MerchantWallet.objects.filter(pk=wallet.pk).update(balance=Decimal('100'), storage_mode='sharded', shard_count=4)
+        self.wallet = MerchantWallet.objects.get(pk=wallet.pk)
+
+    def _row(self):
+        return tuple(MerchantWallet.objects.filter(pk=self.wallet.pk).values_list(*WALLET_FIELDS).get())
+
+    def _shards(self):
+        return dict(MerchantWalletShard.objects.filter(wallet=self.wallet).values_list('shard_no', 'balance'))
+
+    def test_credits_land_on_shards(self):
+        mutation = wallet_mutation(self.wallet)
+        self.assertIsInstance(mutation, ShardedWalletMutation)
+        mutation.credit(Decimal('30'))
+        credit_shard(self.wallet, Decimal('5'), shard_no=1)
+        credit_shard(self.wallet, Decimal('5'), shard_no=1)
+
+        self.assertEqual(self._row(), (Decimal('100'), Decimal('0'), Decimal('0')))
+        shards = self._shards()
+        self.assertLessEqual(set(shards), set(range(4)))
+        self.assertEqual(sum(shards.values()), Decimal('40'))
+        self.assertEqual(MerchantWalletShard.objects.filter(wallet=self.wallet, shard_no=1).count(), 1)
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('140'), Decimal('0'), Decimal('0')))
+
+    def test_debit_checks_the_row_plus_its_shards(self):
+        credit_shard(self.wallet, Decimal('50'), shard_no=0)
+        wallet_mutation(self.wallet).debit(Decimal('120'))
+        self.assertEqual(self._row(), (Decimal('-20'), Decimal('0'), Decimal('120')))
+        self.assertEqual(wallet_totals(self.wallet), (Decimal('30'), Decimal('0'), Decimal('120')))
+        with self.assertRaisesMessage(ValidationError, "Insufficient balance"):
+            wallet_mutation(self.wallet).debit(Decimal('31'))
+        self.assertEqual(self._row(), (Decimal('-20'), Decimal('0'), Decimal('120')))
+
+    def test_fold_moves_the_shards_back_once(self):
+        for shard_no, amount in enumerate(('10', '20', '30')):
+            credit_shard(self.wallet, Decimal(amount), shard_no=shard_no)
+        wallet_mutation(self.wallet).hold(Decimal('150'))
+        totals = wallet_totals(self.wallet)
+        self.assertEqual(totals, (Decimal('10'), Decimal('150'), Decimal('0')))
+
+        self.assertEqual(fold_wallet_shards(self.wallet.pk), 3)
+        self.assertEqual(self._shards(), {})
+        self.assertEqual(self._row(), tuple(totals))
+        self.assertEqual(fold_wallet_shards(self.wallet.pk), 0)
+        self.assertEqual(self._row(), tuple(totals))
+
+# ========================================Sharded Wallet End===================================
+
+
+# ========================================Batched Credits Start===================================
+@override_settings(WALLET_CREDIT_BATCHING=True)
+class ApplyPendingCreditsTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.create_merchant()
+        self.invoices = [self._paid_invoice(f"TRX{n}") for n in range(3)]
+
+    def _paid_invoice(self, trx_id):
+        return Invoice.objects.create(
+            merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'),
+            pay_status='paid', transaction_id=trx_id,
+        )
+
+    def _credits(self, invoice):
+        return WalletTransaction.objects.filter(object_id=invoice.pk, tran_type='credit')
+
+    def _balance(self):
+        return MerchantWallet.objects.get(merchant=self.merchant).balance
+
+    def test_paid_invoices_are_queued(self):
+        self.assertEqual(PendingWalletCredit.objects.filter(merchant=self.merchant, applied_at__isnull=True).count(), 3)
+        self.assertFalse(WalletTransaction.objects.filter(merchant=self.merchant).exists())
+        self.assertEqual(self._balance(), Decimal('0'))
+
+    def test_batch_is_applied_with_one_wallet_update(self):
+        wallet_table = MerchantWallet._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(apply_pending_credits(self.merchant.pk, batch_size=2), 2)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(f'UPDATE "{wallet_table}"')]
+        self.assertEqual(len(updates), 1, "\n".join(updates))
+
+        first, second, third = self.invoices
+        self.assertEqual(self._balance(), Decimal('196'))
+        self.assertEqual(
+            [tuple(self._credits(invoice).values_list('fee', 'net_amount', 'previous_balance', 'current_balance').get())
+             for invoice in (first, second)],
+            [(Decimal('2'), Decimal('98'), Decimal('0'), Decimal('98')),
+             (Decimal('2'), Decimal('98'), Decimal('98'), Decimal('196'))],
+        )
+        self.assertFalse(self._credits(third).exists())
+        self.assertEqual(
+            [applied_at is not None for applied_at in PendingWalletCredit.objects.order_by('id').values_list('applied_at', flat=True)],
+            [True, True, False],
+        )
+
+        self.assertEqual(apply_pending_credits(self.merchant.pk, batch_size=2), 1)
+        self.assertEqual(apply_pending_credits(self.merchant.pk, batch_size=2), 0)
+        self.assertEqual(self._balance(), Decimal('294'))
+        self.assertFalse(PendingWalletCredit.objects.filter(applied_at__isnull=True).exists())
+
+    def test_already_credited_invoices_are_skipped(self):
+        first = self.invoices[0]
+        with override_settings(WALLET_CREDIT_BATCHING=False):
+            credit_invoice(first)
+        self.assertEqual(self._balance(), Decimal('98'))
+
+        self.assertEqual(apply_pending_credits(self.merchant.pk), 3)
+        self.assertEqual(self._balance(), Decimal('294'))
+        for invoice in self.invoices:
+            self.assertEqual(self._credits(invoice).count(), 1)
+        self.assertFalse(PendingWalletCredit.objects.filter(applied_at__isnull=True).exists())
+
+# ========================================Batched Credits End===================================
+
+
+# ========================================Fee Policy Start===================================
+class FeePolicyTests(SimpleTestCase):
+    RATES = {'deposit': Decimal('1.5'), 'payout': Decimal('2.25'), 'withdraw': Decimal('1.75')}
+    AMOUNTS = [Decimal(a) for a in ('0', '0.01', '0.50', '1.50', '2.50', '33.33', '99.99', '100', '1234.57', '50000')]
+
+    def _policy(self, fees_type):
+        return FeePolicy(fees_type, self.RATES['deposit'], self.RATES['payout'], self.RATES['withdraw'])
+
+    def _old_fee(self, fees_type, bucket, amount):
+        """The per-model calculation FeePolicy replaced, rounded the way DecimalField stores it."""
+        kind = (fees_type or '').lower()
+        fee_value = self.RATES.get(bucket, Decimal('5'))
+        if kind in ('percentage', 'parcentage'):
+            fee = (amount * fee_value) / Decimal('100')
+        elif kind == 'flat':
+            fee = fee_value
+        else:
+            fee = (amount * Decimal('10')) / Decimal('100')
+        return fee.quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+    def test_fee_matches_the_old_calculation(self):
+        for fees_type in ('Parcentage', 'percentage', 'Percentage', 'Flat', 'flat', 'unknown', None):
+            policy = self._policy(fees_type)
+            for bucket in FEE_BUCKETS:
+                for amount in self.AMOUNTS:
+                    with self.subTest(fees_type=fees_type, bucket=bucket, amount=amount):
+                        self.assertEqual(policy.fee(bucket, amount), self._old_fee(fees_type, bucket, amount))
+
+    def test_other_bucket(self):
+        self.assertEqual(self._policy('Flat').fee('other', Decimal('100')), Decimal('5'))
+        self.assertEqual(self._policy('percentage').fee('other', Decimal('300')), Decimal('15'))
+        self.assertEqual(self._policy('unknown').fee('other', Decimal('300')), Decimal('30'))
+
+    def test_rounds_half_even_to_the_cent(self):
+        policy = FeePolicy('percentage', Decimal('1'), 0, 0)
+        self.assertEqual(policy.fee('deposit', Decimal('0.50')), Decimal('0.00'))  # 0.005
+        self.assertEqual(policy.fee('deposit', Decimal('1.50')), Decimal('0.02'))  # 0.015
+        self.assertEqual(policy.fee('deposit', Decimal('2.50')), Decimal('0.02'))  # 0.025
+        self.assertEqual(policy.fee('deposit', Decimal('2.51')), Decimal('0.03'))  # 0.0251
+
+    def test_deposit_and_debit_totals(self):
+        policy = self._policy('percentage')
+        self.assertEqual(policy.deposit(Decimal('200')), (Decimal('3.00'), Decimal('197.00')))
+        self.assertEqual(policy.debit('payout', Decimal('200')), (Decimal('4.50'), Decimal('204.50')))
+        self.assertEqual(policy.debit('withdraw', Decimal('200')), (Decimal('3.50'), Decimal('203.50')))
+
+    def test_fees_equals_fee_for_each_item(self):
+        for fees_type in ('Parcentage', 'Flat', 'unknown'):
+            policy = self._policy(fees_type)
+            for bucket in FEE_BUCKETS:
+                with self.subTest(fees_type=fees_type, bucket=bucket):
+                    self.assertEqual(policy.fees(bucket, self.AMOUNTS), [policy.fee(bucket, a) for a in self.AMOUNTS])
+        self.assertEqual(self._policy('Flat').fees('deposit', []), [])
+
+# ========================================Fee Policy End===================================
+
+
+# ========================================Wallet Replay Start===================================
+class WalletReplayTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())
+        self.wallet = self.merchant.merchant_wallet
+        for status in ('pending', 'success', 'failed'):
+            WalletTransaction.objects.create(
+                wallet=self.wallet, merchant=self.merchant, net_amount=Decimal('100'),
+                status=status, tran_type='debit',
+            )
+        self.wallet.refresh_from_db()
+
+    def _drift(self):
+        _, _, drift, _ = _audit_wallet((self.wallet.pk, 2, False))
+        return drift
+
+    def test_transaction_effect(self):
+        amount, net = Decimal('105'), Decimal('100')
+        cases = [
+            ('debit', 'pending', (-amount, amount, 0)),
+            ('debit', 'success', (-amount, 0, amount)),
+            ('Debit', 'SUCCESS', (-amount, 0, amount)),
+            ('debit', 'failed', (0, 0, 0)),
+            ('debit', 'rejected', (0, 0, 0)),
+            ('credit', 'success', (net, 0, 0)),
+            ('credit', 'pending', (0, 0, 0)),
+            ('credit', 'failed', (0, 0, 0)),
+            (None, None, (0, 0, 0)),
+        ]
+        for tran_type, status, effect in cases:
+            with self.subTest(tran_type=tran_type, status=status):
+                self.assertEqual(transaction_effect(tran_type, status, amount, net), effect)
+        self.assertEqual(transaction_effect('credit', 'success', amount, None), (0, 0, 0))
+
+    def test_replay_matches_the_wallet(self):
+        rows, expected = replay_wallet(self.wallet.pk, chunk_size=2)
+        self.assertEqual(rows, 4)
+        self.assertEqual(expected, wallet_totals(self.wallet))
+        self.assertEqual(self._drift(), {name: 0 for name in WALLET_FIELDS})
+
+    def test_drift_is_detected_and_repaired(self):
+        before = tuple(wallet_totals(self.wallet))
+        MerchantWallet.objects.filter(pk=self.wallet.pk).update(
+            balance=F('balance') + Decimal('7'), withdraw_processing=F('withdraw_processing') - Decimal('3'),
+        )
+        self.assertEqual(self._drift(), {'balance': Decimal('-7'), 'withdraw_processing': Decimal('3'), 'total_withdraw': 0})
+
+        self.assertEqual(repair_wallet(self.wallet.pk), (Decimal('-7'), Decimal('3'), 0))
+        self.assertEqual(self._drift(), {name: 0 for name in WALLET_FIELDS})
+        self.wallet.refresh_from_db()
+        self.assertEqual(tuple(wallet_totals(self.wallet)), before)
+        self.assertEqual(repair_wallet(self.wallet.pk), (0, 0, 0))
+
+    def test_audit_repairs_on_request(self):
+        MerchantWallet.objects.filter(pk=self.wallet.pk).update(total_withdraw=F('total_withdraw') + Decimal('1'))
+        _, _, drift, repaired = _audit_wallet((self.wallet.pk, 2, True))
+        self.assertTrue(repaired)
+        self.assertEqual(drift, {'balance': 0, 'withdraw_processing': 0, 'total_withdraw': Decimal('-1')})
+        self.assertEqual(self._drift(), {name: 0 for name in WALLET_FIELDS})
+
+    def test_repair_keeps_ledger_entries(self):
+        MerchantWallet.objects.filter(pk=self.wallet.pk).update(storage_mode='ledger')
+        self.wallet.refresh_from_db()
+        WalletTransaction.objects.create(
+            wallet=self.wallet, merchant=self.merchant, amount=Decimal('50'), net_amount=Decimal('50'),
+            status='success', tran_type='credit',
+        )
+        entries = list(WalletLedgerEntry.objects.filter(wallet=self.wallet).values_list('id', 'balance', 'compacted'))
+        self.assertTrue(entries)
+        MerchantWallet.objects.filter(pk=self.wallet.pk).update(balance=F('balance') - Decimal('20'))
+
+        self.assertEqual(repair_wallet(self.wallet.pk).balance, Decimal('20'))
+        self.assertEqual(list(WalletLedgerEntry.objects.filter(wallet=self.wallet).values_list('id', 'balance', 'compacted')), entries)
+        self.assertEqual(self._drift(), {name: 0 for name in WALLET_FIELDS})
+
+# ========================================Wallet Replay End===================================
+
+
+# ========================================Save Query Budget Start===================================
+class SaveQueryBudgetTests(MerchantFixtureMixin, TestCase):
+    """
+    Fixed query ceilings for every save transition of the wallet-touching
+    models. A change that makes one of these saves chattier has to raise the
+    ceiling here on purpose.
+
+    The counter writes run in the save's transaction: the WalletRollup move
+    costs up to 2 queries per key (1 in steady state), a transition to
+    success with a fee 4 more for the platform revenue rows (two UPDATEs in
+    steady state). Counter shards are picked at random, so the ceilings are
+    the worst case.
+    """
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())
+        self.wallet = self.merchant.merchant_wallet
+
+    def _queries(self, ctx):
+        # Savepoints only depend on how deeply the atomic blocks nest, so they are not counted.
+        return [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def assertMaxQueries(self, ceiling, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args, **kwargs)
+        queries = self._queries(ctx)
+        self.assertLessEqual(len(queries), ceiling, "\n".join(queries))
+        return result
+
+    def _invoice(self):
+        return Invoice.objects.create(
+            merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'),
+        )
+
+    def test_invoice_create(self):
+        self.assertMaxQueries(3, self._invoice)
+
+    def test_invoice_paid(self):
+        invoice = self._invoice()
+        invoice.pay_status = 'paid'
+        invoice.transaction_id = 'TRX1'
+        self.assertMaxQueries(16, invoice.save)
+
+    def test_invoice_paid_resave(self):
+        invoice = self._invoice()
+        invoice.pay_status = 'paid'
+        invoice.transaction_id = 'TRX1'
+        invoice.save()
+        invoice.customer_name = "Renamed"
+        self.assertMaxQueries(3, invoice.save)
+        self.assertEqual(WalletTransaction.objects.filter(object_id=invoice.pk, tran_type='credit').count(), 1)
+
+    def test_payout_create(self):
+        transfer = PaymentTransfer(
+            merchant=self.merchant, receiver_name="R", receiver_number="1",
+            amount=Decimal('50'), payment_method='bkash', payment_details={},
+        )
+        self.assertMaxQueries(8, transfer.save)
+
+    def test_payout_success(self):
+        transfer = PaymentTransfer.objects.create(
+            merchant=self.merchant, receiver_name="R", receiver_number="1",
+            amount=Decimal('50'), payment_method='bkash', payment_details={},
+        )
+        transfer = PaymentTransfer.objects.get(pk=transfer.pk)
+        transfer.trx_id = 'TRX2'
+        self.assertMaxQueries(14, transfer.save)
+
+    def _withdraw(self):
+        return WithdrawRequest.objects.create(merchant=self.merchant, amount=Decimal('50'))
+
+    def test_withdraw_create(self):
+        self.assertMaxQueries(8, self._withdraw)
+
+    def test_withdraw_success(self):
+        withdraw = WithdrawRequest.objects.get(pk=self._withdraw().pk)
+        withdraw.trx_id = 'TRX3'
+        self.assertMaxQueries(14, withdraw.save)
+
+    def test_withdraw_rejected(self):
+        withdraw = WithdrawRequest.objects.get(pk=self._withdraw().pk)
+        withdraw.status = 'rejected'
+        self.assertMaxQueries(10, withdraw.save)
+
+    def test_wallet_transaction_credit(self):
+        self.assertMaxQueries(
+            7, WalletTransaction.objects.create,
+            wallet=self.wallet, merchant=self.merchant, amount=Decimal('10'), net_amount=Decimal('10'), status='success', tran_type='credit',
+        )
+
+# ========================================Save Query Budget End===================================
+
+
+# ========================================Platform Revenue Start===================================
+class PlatformRevenueTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())  # fee 5, 'other'
+
+    def _fee_sum(self):
+        return WalletTransaction.objects.filter(status='success').aggregate(total=Sum('fee'))['total']
+
+    def _pay_invoice(self):
+        invoice = Invoice.objects.create(
+            merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'),
+        )
+        invoice.pay_status, invoice.transaction_id = 'paid', 'TRX1'
+        invoice.save()
+
+    def _payout(self):
+        transfer = PaymentTransfer.objects.create(
+            merchant=self.merchant, receiver_name="R", receiver_number="1",
+            amount=Decimal('50'), payment_method='bkash', payment_details={},
+        )
+        transfer = PaymentTransfer.objects.get(pk=transfer.pk)
+        transfer.trx_id = 'TRX2'
+        transfer.save()
+
+    def test_account_matches_the_fee_sum(self):
+        self._pay_invoice()
+        self._payout()
+        withdraw = WithdrawRequest.objects.get(pk=WithdrawRequest.objects.create(merchant=self.merchant, amount=Decimal('50')).pk)
+        withdraw.status = 'rejected'
+        withdraw.save()
+
+        expected = (Decimal('8.00'), {'deposit': Decimal('2.00'), 'payout': Decimal('1.00'), 'other': Decimal('5.00')})
+        self.assertEqual(self._fee_sum(), expected[0])
+        self.assertEqual(platform_revenue(), expected)
+        self.assertEqual(PlatformRevenueDaily.objects.aggregate(total=Sum('total_fee'))['total'], expected[0])
+        self.assertEqual(PlatformRevenueAccount.objects.aggregate(total=Sum('transaction_count'))['total'], 3)
+        with self.settings(PLATFORM_REVENUE_READ=False):
+            self.assertEqual(platform_revenue(), expected)
+
+        rebuild_platform_revenue()
+        self.assertEqual(platform_revenue(), expected)
+
+    def test_rolled_back_success_books_nothing(self):
+        before = platform_revenue()
+        with self.assertRaises(ValidationError):
+            with transaction.atomic():
+                self._pay_invoice()
+                raise ValidationError("callback failed")
+        self.assertEqual(platform_revenue(), before)
+        self.assertEqual(platform_revenue()[0], self._fee_sum())
+
+# ========================================Platform Revenue End===================================
+
+
+# ========================================Wallet Rollup Start===================================
+class WalletRollupTests(MerchantFixtureMixin, TestCase):
+    DAYS = [datetime.date(2026, 1, 1), datetime.date(2026, 1, 2), datetime.date(2026, 1, 3)]
+
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())
+        for day, amounts in zip(self.DAYS, (('100', '50'), ('30',), ('70', '20'))):
+            with mock.patch('django.utils.timezone.now', return_value=self._at(day, datetime.time(12))):
+                for n, amount in enumerate(amounts):
+                    invoice = Invoice.objects.create(
+                        merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal(amount),
+                    )
+                    transfer = PaymentTransfer.objects.create(
+                        merchant=self.merchant, receiver_name="R", receiver_number="1",
+                        amount=Decimal(amount) / 10, payment_method='bkash', payment_details={},
+                    )
+                    if n == 0:
+                        invoice.pay_status, invoice.transaction_id = 'paid', f'TRX-{invoice.pk}'
+                        invoice.save()
+                        transfer.trx_id = f'TRX-P{transfer.pk}'
+                        transfer.save()
+
+    def _at(self, day, time):
+        return timezone.make_aware(datetime.datetime.combine(day, time))
+
+    def _raw_totals(self, kind, merchant, after, before):
+        model, amount_field, status_fields = {
+            'invoice': (Invoice, 'customer_amount', ('status', 'pay_status')),
+            'payout': (PaymentTransfer, 'amount', ('status',)),
+        }[kind]
+        rows = model.objects.all()
+        if merchant is not None:
+            rows = rows.filter(merchant=merchant)
+        if after:
+            rows = rows.filter(created_at__gte=after)
+        if before:
+            rows = rows.filter(created_at__lte=before)
+        return {
+            ':'.join(row[name] for name in status_fields): row['total']
+            for row in rows.values(*status_fields).annotate(total=Sum(amount_field)).order_by()
+        }
+
+    def test_rollups_match_raw_aggregates_for_whole_days(self):
+        first, second, third = self.DAYS
+        ranges = [
+            (None, None),
+            (first, first),
+            (second, third),
+            (None, second),
+            (third, None),
+        ]
+        for start, end in ranges:
+            after = start and self._at(start, datetime.time.min)
+            before = end and self._at(end, datetime.time.max)
+            days = whole_day_range(after and after.isoformat(), before and before.isoformat())
+            self.assertEqual(days, (start, end))
+            for kind in ('invoice', 'payout'):
+                for merchant in (self.merchant, None):
+                    with self.subTest(start=start, end=end, kind=kind, merchant=merchant):
+                        rollup = {key: total for key, total in rollup_totals(kind, merchant, *days).items() if total}
+                        self.assertTrue(rollup)
+                        self.assertEqual(rollup, self._raw_totals(kind, merchant, after, before))
+
+    def test_cut_through_days_are_not_whole(self):
+        self.assertIsNone(whole_day_range(self._at(self.DAYS[0], datetime.time(12)).isoformat()))
+        self.assertIsNone(whole_day_range(None, self._at(self.DAYS[0], datetime.time(23, 59)).isoformat()))
+
+    def test_rolled_back_save_moves_no_rollup(self):
+        before = list(WalletRollup.objects.order_by('id').values_list('status', 'amount', 'count'))
+        with self.assertRaises(ValidationError):
+            with transaction.atomic():
+                invoice = Invoice.objects.create(
+                    merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('10'),
+                )
+                invoice.pay_status, invoice.transaction_id = 'paid', 'TRX-X'
+                invoice.save()
+                raise ValidationError("callback failed")
+        self.assertEqual(list(WalletRollup.objects.order_by('id').values_list('status', 'amount', 'count')), before)
+
+# ========================================Wallet Rollup End===================================
+
+
+# ========================================Bulk Invoice Start===================================
+@override_settings(ALLOWED_HOSTS=['*'])
+class BulkCreatePaymentTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.create_merchant()
+        self.client = self.api_client(self.merchant)
+
+    def _post(self, invoices):
+        return self.client.post(reverse('create-payment-bulk'), json.dumps({'invoices': invoices}), content_type='application/json').json()
+
+    def _item(self, **extra):
+        return {'customer_name': "C", 'customer_number': "1", 'customer_amount': "100.00", 'method': 'bkash', **extra}
+
+    def test_bulk_create_reports_each_item(self):
+        body = self._post([self._item(), self._item(customer_amount="oops"), self._item(pay_status='paid', transaction_id='X')])
+        self.assertEqual((body['created'], body['failed']), (2, 1))
+        self.assertEqual([item['index'] for item in body['results']], [0, 1, 2])
+        self.assertIn('customer_amount', body['results'][1]['errors'])
+        self.assertIn('method=bkash', body['results'][0]['paymentURL'])
+
+        invoices = Invoice.objects.filter(merchant=self.merchant)
+        self.assertEqual(invoices.count(), 2)
+        # Bulk invoices always start unpaid, whatever the item says.
+        self.assertEqual(set(invoices.values_list('pay_status', flat=True)), {'pending'})
+        self.assertEqual(len(set(invoices.values_list('invoice_payment_id', flat=True))), 2)
+        self.assertEqual(rollup_totals('invoice', self.merchant), {'active:pending': Decimal('200')})
+
+    def test_bulk_create_rejects_oversized_batch(self):
+        with self.settings(BULK_INVOICE_MAX_ITEMS=2):
+            body = self._post([self._item()] * 3)
+        self.assertFalse(body['status'])
+        self.assertFalse(Invoice.objects.filter(merchant=self.merchant).exists())
+
+# ========================================Bulk Invoice End===================================
+
+
+# ========================================Payout Batch Start===================================
+class PayoutBatchTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())
+        self.client = self.api_client(self.merchant)
+
+    def _post(self, payouts):
+        return self.client.post(reverse('payment-payout-batch'), json.dumps({'payouts': payouts}), content_type='application/json')
+
+    def _item(self, amount):
+        return {'receiver_name': "R", 'receiver_number': "017", 'amount': amount, 'payment_method': 'bkash', 'payment_details': {}}
+
+    def _wallet(self):
+        wallet = self.merchant.merchant_wallet
+        wallet.refresh_from_db()
+        return wallet.balance, wallet.withdraw_processing, wallet.total_withdraw
+
+    def test_batch_holds_total_plus_fees(self):
+        body = self._post([self._item("100"), self._item("50"), self._item("25.50")]).json()
+        self.assertTrue(body['status'])
+        self.assertEqual((body['count'], body['amount'], body['fee']), (3, "175.50", "3.00"))
+        self.assertEqual(self._wallet(), (Decimal('821.50'), Decimal('178.50'), Decimal('0')))
+        self.assertEqual(
+            sorted(WalletTransaction.objects.filter(tran_type='debit', status='pending').values_list('amount', flat=True)),
+            [Decimal('26.50'), Decimal('51'), Decimal('101')],
+        )
+        self.assertEqual(rollup_totals('payout', self.merchant), {'pending': Decimal('175.50')})
+
+        # Each payout settles its own share of the hold.
+        transfer = PaymentTransfer.objects.get(trx_uuid=body['payouts'][0]['payoutID'])
+        transfer.trx_id = "TRX1"
+        transfer.save()
+        self.assertEqual(self._wallet(), (Decimal('821.50'), Decimal('77.50'), Decimal('101')))
+
+        report = self.client.get(reverse('payment-payout-batch-detail', kwargs={'batch_id': body['batchID']})).json()
+        self.assertEqual(report['statusCounts'], {'pending': 2, 'success': 1})
+
+    def test_batch_queries_do_not_grow_with_size(self):
+        self._post([self._item("1")])  # warms the credential and content type caches
+        counts = []
+        for size in (2, 20):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._post([self._item("1")] * size).status_code, 200)
+            counts.append(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]))
+        # A rollup counter shard is picked at random and may need inserting
+        # (inside its own savepoint, which is not counted).
+        self.assertLessEqual(counts[1], counts[0] + 1)
+
+    def test_batch_is_all_or_nothing(self):
+        invalid = self._post([self._item("10"), self._item("-5")])
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(invalid.json()['errors'][0]['index'], 1)
+
+        too_large = self._post([self._item("600"), self._item("400")])
+        self.assertEqual(too_large.status_code, 400)
+        self.assertFalse(PaymentTransfer.objects.filter(merchant=self.merchant).exists())
+        self.assertEqual(self._wallet(), (Decimal('1000'), Decimal('0'), Decimal('0')))
+
+# ========================================Payout Batch End===================================
+
+
+# ========================================Idempotency Key Start===================================
+@override_settings(ALLOWED_HOSTS=['*'])
+class IdempotencyKeyTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.create_merchant()
+        self.client = self.api_client(self.merchant)
+
+    def _create(self, key, amount="100.00"):
+        body = {'customer_name': "C", 'customer_number': "1", 'customer_amount': amount}
+        return self.client.post(
+            reverse('create-payment'), json.dumps(body), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_stored_response(self):
+        first = self._create("order-1")
+        with CaptureQueriesContext(connection) as ctx:
+            again = self._create("order-1")
+        self.assertEqual(first.json(), again.json())
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(Invoice.objects.filter(merchant=self.merchant).count(), 1)
+        # Credentials are cached, so the replay is the key lookup alone.
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_reused_key_with_another_body_is_rejected(self):
+        self._create("order-2")
+        response = self._create("order-2", amount="5.00")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Invoice.objects.filter(merchant=self.merchant).count(), 1)
+
+    def test_failed_request_is_not_stored(self):
+        self.assertFalse(self._create("order-3", amount="oops").json()['status'])
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertIn('paymentID', self._create("order-3").json())
+
+    def test_expired_keys_are_swept(self):
+        self._create("order-4")
+        self._create("order-5")
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(expire_idempotency_keys(chunk_size=1), 2)
+        self.assertIn('paymentID', self._create("order-4").json())
+        self.assertEqual(Invoice.objects.filter(merchant=self.merchant).count(), 3)
+
+# ========================================Idempotency Key End===================================
+
+
+# ========================================Checkout Session Start===================================
+@override_settings(ALLOWED_HOSTS=['*'])
+class CheckoutSessionTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.merchant = self.create_merchant(brand_name="Test Store")
+        self.client = self.api_client(self.merchant)
+        body = {'customer_name': "C", 'customer_number': "1", 'customer_amount': "100"}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment_id = self.client.post(
+                reverse('create-payment'), json.dumps(body), content_type='application/json',
+            ).json()['paymentID']
+
+    def _checkout(self):
+        return self.client.get(reverse('get-payment'), {'invoice_payment_id': self.payment_id})
+
+    def test_open_invoice_is_served_without_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            body = self._checkout().json()
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(body['invoice']['amount'], "100.00")
+        self.assertEqual(body['mechant_info']['brand_name'], "Test Store")
+        self.assertEqual(body['payment_methods'][0]['url'], f"http://testserver/api/v1/get-payment/bkash/?invoice_payment_id={self.payment_id}&redirect=1")
+
+    def test_paid_invoice_drops_its_session(self):
+        invoice = Invoice.objects.get(invoice_payment_id=self.payment_id)
+        invoice.pay_status = 'paid'
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        self.assertEqual(self._checkout().status_code, 406)
+
+    def test_unchanged_checkout_page_is_not_modified(self):
+        etag = self._checkout()['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('get-payment'), {'invoice_payment_id': self.payment_id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_verify_polling(self):
+        params = {'invoice_payment_id': self.payment_id, 'status': 'check'}
+        first = self.client.get('/api/v1/payment/verify/', params)
+        self.assertEqual((first.status_code, first['Cache-Control']), (200, "private, no-cache"))
+        with CaptureQueriesContext(connection) as ctx:
+            unchanged = self.client.get('/api/v1/payment/verify/', params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((unchanged.status_code, len(ctx.captured_queries)), (304, 0))
+
+        invoice = Invoice.objects.get(invoice_payment_id=self.payment_id)
+        invoice.pay_status, invoice.transaction_id = 'paid', 'TRX1'
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            paid = self.client.get('/api/v1/payment/verify/', params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(paid.status_code, 200)
+        self.assertNotEqual(paid['ETag'], first['ETag'])
+        self.assertIn("immutable", paid['Cache-Control'])
+        self.assertEqual(paid.json()['data']['transactionStatus'], "Complete")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._checkout().status_code, 406)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def _later(self, seconds):
+        """Moves the local-memory cache's clock seconds ahead."""
+        clock = mock.Mock(time=mock.Mock(return_value=time.time() + seconds))
+        return mock.patch('django.core.cache.backends.locmem.time', clock)
+
+    def test_created_invoice_version_expires(self):
+        key = checkout_version_key(self.payment_id)
+        self.assertIsNotNone(cache.get(key))
+        with self._later(checkout_version_ttl() - 1):
+            self.assertIsNotNone(cache.get(key))
+        with self._later(checkout_version_ttl() + 1):
+            self.assertIsNone(cache.get(key))
+
+    def test_unknown_invoice_writes_nothing_to_the_cache(self):
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('get-payment'), {'invoice_payment_id': "unknown"}).status_code, 404)
+        verify = self.client.get('/api/v1/payment/verify/', {'invoice_payment_id': "unknown", 'status': 'check'})
+        self.assertEqual(verify.status_code, 400)
+        keys = [checkout_version_key("unknown"), checkout_session_key("unknown"), invoice_status_key("unknown")]
+        self.assertEqual(cache.get_many(keys), {})
+
+    def test_missing_version_is_uncached(self):
+        cache.delete(checkout_version_key(self.payment_id))
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self._checkout().status_code, 200)
+        self.assertGreater(len(ctx.captured_queries), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._checkout().status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_version_and_terminal_entries_expire(self):
+        invoice = Invoice.objects.get(invoice_payment_id=self.payment_id)
+        invoice.pay_status, invoice.transaction_id = 'paid', 'TRX1'
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/api/v1/payment/verify/', {'invoice_payment_id': self.payment_id, 'status': 'check'})
+        keys = [checkout_version_key(self.payment_id), invoice_status_key(self.payment_id)]
+
+        with self._later(settings.CHECKOUT_SESSION_TTL + 1):
+            self.assertEqual(set(cache.get_many(keys)), set(keys))
+        with self._later(settings.CHECKOUT_TERMINAL_TTL + 1):
+            self.assertEqual(cache.get_many(keys), {})
+
+    def _pay_concurrently(self, store):
+        """store, with the invoice paid by another request between the view's read and its cache write."""
+        def racing(*args, **kwargs):
+            invoice = Invoice.objects.get(invoice_payment_id=self.payment_id)
+            invoice.pay_status, invoice.transaction_id = 'paid', 'TRX1'
+            invoice.save()  # its cache delete is queued before the view's write
+            return store(*args, **kwargs)
+        return racing
+
+    def test_status_read_before_a_concurrent_save_is_not_served(self):
+        params = {'invoice_payment_id': self.payment_id, 'status': 'check'}
+        cache.clear()
+        with mock.patch('core.views.store_invoice_status', self._pay_concurrently(store_invoice_status)):
+            with self.captureOnCommitCallbacks(execute=True):
+                stale = self.client.get('/api/v1/payment/verify/', params)
+        self.assertEqual(stale.json()['data']['transactionStatus'], "Incomplete")
+        with self.captureOnCommitCallbacks(execute=True):
+            polled = self.client.get('/api/v1/payment/verify/', params, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(polled.status_code, 200)
+        self.assertEqual(polled.json()['data']['transactionStatus'], "Complete")
+
+    def test_session_read_before_a_concurrent_save_is_not_served(self):
+        cache.clear()
+        with mock.patch('core.views.store_checkout_sessions', self._pay_concurrently(store_checkout_sessions)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self._checkout().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._checkout().status_code, 406)
+
+# ========================================Checkout Session End===================================
+
+
+# ========================================Outbox Start===================================
+@override_settings(OUTBOX_SIDE_EFFECTS=True)
+class OutboxTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.create_merchant()
+        self.invoice = Invoice.objects.create(
+            merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'),
+        )
+
+    def _pay(self):
+        self.invoice.pay_status = 'paid'
+        self.invoice.transaction_id = 'TRX1'
+        self.invoice.save()
+
+    def test_paid_invoice_only_writes_an_event(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._pay()
+        queries = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(queries), 3, "\n".join(queries))
+        self.assertFalse(WalletTransaction.objects.filter(merchant=self.merchant).exists())
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by('id').values_list('event_type', flat=True)),
+            ['invoice.saved', 'invoice.paid'],
+        )
+
+    def test_drain_credits_and_books_rollups(self):
+        self._pay()
+        self.assertEqual(drain_outbox(batch_size=10), 2)
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+        trx = WalletTransaction.objects.get(merchant=self.merchant)
+        self.assertEqual((trx.amount, trx.fee), (Decimal('100'), Decimal('2')))
+        rollup = WalletRollup.objects.filter(merchant=self.merchant, status='active:paid').aggregate(amount=Sum('amount'), fee=Sum('fee'), count=Sum('count'))
+        self.assertEqual(rollup, {'amount': Decimal('100'), 'fee': Decimal('2'), 'count': 1})
+        self.assertEqual(rollup_totals('invoice', self.merchant), {'active:pending': Decimal('0'), 'active:paid': Decimal('100')})
+
+    def test_failed_consumer_is_retried_alone(self):
+        calls = []
+
+        @consumer('invoice.paid', name='test-flaky')
+        def flaky(event):
+            calls.append(event.pk)
+            if len(calls) == 1:
+                raise RuntimeError("down")
+
+        try:
+            self._pay()
+            with self.assertLogs('core.outbox', level='ERROR'):
+                drain_outbox(batch_size=10)
+            event = OutboxEvent.objects.get(event_type='invoice.paid')
+            self.assertIsNone(event.processed_at)
+            self.assertEqual(event.attempts, 1)
+            self.assertIn('ledger-credit', event.done)
+
+            OutboxEvent.objects.filter(pk=event.pk).update(available_at=timezone.now())
+            drain_outbox(batch_size=10)
+            event.refresh_from_db()
+            self.assertIsNotNone(event.processed_at)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(WalletTransaction.objects.filter(merchant=self.merchant).count(), 1)
+        finally:
+            for registered in _consumers.values():
+                registered.pop('test-flaky', None)
+
+# ========================================Outbox End===================================
+
+
+# ========================================Async Checkout Start===================================
+class AsyncCheckoutTests(MerchantFixtureMixin, TestCase):
+    """The ASYNC_CHECKOUT views answer exactly as the sync views they replace."""
+    def setUp(self):
+        cache.clear()
+        self.merchant = self.create_merchant(brand_name="Test Store")
+        self.gateway = BasePaymentGateWay.objects.create(
+            method='bkash', base_url="https://bkash.invalid/", callback_base_url="https://pay.invalid",
+            details_json={'app_key': 'k', 'app_secret': 's', 'username': 'u', 'password': 'p'},
+        )
+        self.invoice = Invoice.objects.create(
+            merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'),
+            payment_gateway=self.gateway, method_payment_id="TR0001",
+        )
+
+    def _both(self, sync_view, async_view, method, path, data=None, **kwargs):
+        request_args = (path, data) if method == 'get' else (path, json.dumps(data))
+        extra = {} if method == 'get' else {'content_type': 'application/json'}
+        sync_response = sync_view.as_view()(getattr(RequestFactory(), method)(*request_args, **extra), **kwargs)
+        if hasattr(sync_response, 'render'):
+            sync_response.render()
+        async_response = async_to_sync(async_view.as_view())(getattr(AsyncRequestFactory(), method)(*request_args, **extra), **kwargs)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.get('Location'), sync_response.get('Location'))
+        self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'))
+        self.assertEqual(async_response.content, sync_response.content)
+        return async_response
+
+    def test_checkout_page(self):
+        path = reverse('get-payment')
+        self._both(GetOnlinePayment, AsyncGetOnlinePayment, 'get', path, {'invoice_payment_id': self.invoice.invoice_payment_id})
+        self._both(GetOnlinePayment, AsyncGetOnlinePayment, 'get', path, {'invoice_payment_id': self.invoice.invoice_payment_id, 'method': 'nagad-agent'})
+        self._both(GetOnlinePayment, AsyncGetOnlinePayment, 'get', path, {})
+        self.assertEqual(self._both(GetOnlinePayment, AsyncGetOnlinePayment, 'get', path, {'invoice_payment_id': 'missing'}).status_code, 404)
+        Invoice.objects.filter(pk=self.invoice.pk).update(pay_status='paid')
+        cache.clear()
+        self.assertEqual(self._both(GetOnlinePayment, AsyncGetOnlinePayment, 'get', path, {'invoice_payment_id': self.invoice.invoice_payment_id}).status_code, 406)
+
+    def test_verify_payment(self):
+        path = '/api/v1/payment/verify/'
+        self._both(VerifyPayment, AsyncVerifyPayment, 'post', path, {'status': 'x', 'invoice_payment_id': self.invoice.invoice_payment_id})
+        self._both(VerifyPayment, AsyncVerifyPayment, 'post', path, {'status': 'x', 'invoice_payment_id': 'missing'})
+        self._both(VerifyPayment, AsyncVerifyPayment, 'post', path, {'invoice_payment_id': self.invoice.invoice_payment_id})
+        response = self._both(VerifyPayment, AsyncVerifyPayment, 'get', path, {'status': 'x', 'invoice_payment_id': self.invoice.invoice_payment_id})
+        self.assertTrue(response['ETag'])
+
+    def test_bkash_callback(self):
+        executed = {"paymentID": "TR0001", "trxID": "TRX1", "transactionStatus": "Completed"}
+
+        async def async_execute(client, payment_id):
+            return executed
+
+        path = reverse('bkash_callback', kwargs={'invoice_payment_id': self.invoice.invoice_payment_id})
+        kwargs = {'invoice_payment_id': self.invoice.invoice_payment_id}
+        with mock.patch.object(BKashClient, 'execute_payment', lambda client, payment_id: executed), \
+                mock.patch.object(AsyncBKashClient, 'execute_payment', async_execute), \
+                mock.patch.dict(os.environ, {'PAYMENT_REDIRECT_PAGE_BASE_URL': 'https://pay.invalid/result'}):
+            response = self._both(BKashCallbackView, AsyncBKashCallbackView, 'get', path, {'paymentID': 'TR0001', 'status': 'success'}, **kwargs)
+            self._both(BKashCallbackView, AsyncBKashCallbackView, 'get', path, {'paymentID': 'TR0001', 'status': 'other'}, **kwargs)
+        self.assertIn('status=success', response['Location'])
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.pay_status, self.invoice.transaction_id), ('paid', 'TRX1'))
+
+# ========================================Async Checkout End===================================
+
+
+# ========================================Compiled Serializer Start===================================
+@override_settings(ALLOWED_HOSTS=['*'])
+class CompiledSerializerTests(MerchantFixtureMixin, TestCase):
+    def setUp(self):
+        self.merchant = self.fund_wallet(self.create_merchant())
+        invoice = Invoice.objects.create(merchant=self.merchant, customer_name="C", customer_number="1", customer_amount=Decimal('100'))
+        invoice.pay_status = 'paid'
+        invoice.save()
+        PaymentTransfer.objects.create(
+            merchant=self.merchant, receiver_name="R", receiver_number="017", amount=Decimal('12.5'),
+            payment_method='bkash', payment_details={'number': "017"},
+        )
+        WithdrawRequest.objects.create(merchant=self.merchant, amount=Decimal('50'))
+
+    def test_compiled_rows_match_serializer(self):
+        for serializer_class in (InvoiceSerializer, PaymentTransferSerializer, WithdrawRequestSerializer, WalletTransactionSerializer):
+            queryset = serializer_class.Meta.model.objects.order_by('id')
+            with self.subTest(serializer=serializer_class.__name__):
+                self.assertTrue(queryset.exists())
+                self.assertEqual(compiled_plan(serializer_class).data(queryset), serializer_class(queryset, many=True).data)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'amount': Decimal('10.50'), 'created_at': timezone.now(), 'label': gettext_lazy("Paid"),
+            1: [None, True, 1.5, "line\u2028break"], 'nested': {'id': uuid.uuid4()},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_endpoints_match_serializer_path(self):
+        client = APIClient()
+        client.force_authenticate(self.merchant.user)
+        for name in ('wallet-transaction-list', 'withdraw-request-list', 'pay-outs-list', 'invoices-list'):
+            for params in ({}, {'all': 'true'}):
+                with self.subTest(name=name, params=params):
+                    compiled = client.get(reverse(name), params)
+                    with override_settings(COMPILED_LIST_SERIALIZERS=False):
+                        plain = client.get(reverse(name), params)
+                    self.assertEqual(compiled.status_code, 200)
+                    self.assertTrue(compiled.json()['data'])
+                    self.assertEqual(compiled.content, plain.content)
+
+# ========================================Compiled Serializer End===================================
+
+
+# ========================================bKash Client Start===================================
+class BKashClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateway = BasePaymentGateWay.objects.create(
+            method='bkash', base_url="https://bkash.invalid/", callback_base_url="https://pay.invalid",
+            details_json={'app_key': 'k', 'app_secret': 's', 'username': 'u', 'password': 'p'},
+        )
+        self.calls = []
+        self.failures = 0
+
+    def _bkash(self, url, json=None, headers=None, timeout=None):
+        self.calls.append(url.rsplit('/checkout/', 1)[1])
+        self.assertEqual(timeout, (settings.BKASH_CONNECT_TIMEOUT, settings.BKASH_READ_TIMEOUT))
+        time.sleep(0.05)
+        if url.endswith('token/refresh') and json['refresh_token'] == 'revoked':
+            return mock.Mock(status_code=401, text="revoked")
+        if self.failures and not url.endswith(('token/grant', 'token/refresh')):
+            self.failures -= 1
+            return mock.Mock(status_code=503, text="unavailable")
+        if url.endswith(('execute', 'payment/status')):
+            return mock.Mock(status_code=200, json=lambda: {'paymentID': json['paymentID'], 'transactionStatus': 'Completed'})
+        body = {'id_token': f"id{len(self.calls)}", 'refresh_token': f"refresh{len(self.calls)}", 'token_type': 'Bearer', 'expires_in': 3600}
+        return mock.Mock(status_code=200, json=lambda: body)
+
+    def _expire(self, refresh_token=None):
+        tokens = cache.get(bkash_token_key(self.gateway.method_uuid))
+        tokens['expires_at'] = 0
+        if refresh_token:
+            tokens['refresh_token'] = refresh_token
+        cache.set(bkash_token_key(self.gateway.method_uuid), tokens)
+
+    def test_token_is_granted_once_and_refreshed(self):
+        with mock.patch.object(requests.Session, 'post', self._bkash):
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id1")
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id1")
+            self._expire()
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id2")
+            self._expire(refresh_token='revoked')
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id4")
+        self.assertEqual(self.calls, ['token/grant', 'token/refresh', 'token/refresh', 'token/grant'])
+
+    def test_gateways_do_not_share_tokens(self):
+        other = BasePaymentGateWay.objects.create(
+            method='bkash', base_url="https://bkash.invalid/", callback_base_url="https://pay.invalid",
+            details_json={'app_key': 'k2', 'app_secret': 's', 'username': 'u2', 'password': 'p'},
+        )
+        with mock.patch.object(requests.Session, 'post', self._bkash):
+            BKashClient(self.gateway)._authorization()
+            BKashClient(other)._authorization()
+            # Edited credentials do not reuse the tokens of the old ones.
+            self.gateway.details_json['app_key'] = 'k3'
+            BKashClient(self.gateway)._authorization()
+        self.assertEqual(self.calls, ['token/grant'] * 3)
+
+    def test_concurrent_callers_share_one_grant(self):
+        results = []
+        with mock.patch.object(requests.Session, 'post', self._bkash):
+            threads = [threading.Thread(target=lambda: results.append(BKashClient(self.gateway)._authorization())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.calls, ['token/grant'])
+        self.assertEqual(results, ["Bearer id1"] * 8)
+        self.assertIsNone(cache.get(bkash_token_lock_key(self.gateway.method_uuid)))
+
+    def test_expired_lock_taken_by_another_caller_is_kept(self):
+        lock_key = bkash_token_lock_key(self.gateway.method_uuid)
+
+        def slow_grant(url, json=None, headers=None, timeout=None):
+            # Our lock expires mid-grant and another worker takes it.
+            cache.set(lock_key, 'other-worker')
+            return self._bkash(url, json, headers, timeout)
+
+        with mock.patch.object(requests.Session, 'post', mock.Mock(side_effect=slow_grant)):
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id1")
+        self.assertEqual(cache.get(lock_key), 'other-worker')
+
+        async def post(client, url, payload, headers):
+            return slow_grant(url, payload, headers, client.timeout)
+
+        cache.delete(lock_key)
+        self._expire()
+        with mock.patch.object(AsyncBKashClient, '_post', post):
+            async_to_sync(AsyncBKashClient(self.gateway)._authorization)()
+        self.assertEqual(cache.get(lock_key), 'other-worker')
+
+    def test_async_client_uses_the_same_tokens(self):
+        async def post(client, url, payload, headers):
+            return self._bkash(url, payload, headers, client.timeout)
+
+        with mock.patch.object(AsyncBKashClient, '_post', post), mock.patch.object(requests.Session, 'post', self._bkash):
+            self.assertEqual(async_to_sync(AsyncBKashClient(self.gateway)._authorization)(), "Bearer id1")
+            self.assertEqual(BKashClient(self.gateway)._authorization(), "Bearer id1")
+        self.assertEqual(self.calls, ['token/grant'])
+
+    def test_clients_share_a_pooled_session_per_gateway(self):
+        other = BasePaymentGateWay.objects.create(method='bkash', base_url="https://other.invalid/", details_json=self.gateway.details_json)
+        self.assertIs(BKashClient(self.gateway).session, BKashClient(BasePaymentGateWay.objects.get(pk=self.gateway.pk)).session)
+        self.assertIsNot(BKashClient(self.gateway).session, BKashClient(other).session)
+
+    @override_settings(BKASH_RETRY_BACKOFF=0)
+    def test_only_status_queries_are_retried(self):
+        with mock.patch.object(requests.Session, 'post', self._bkash):
+            client = BKashClient(self.gateway)
+            self.failures = 2
+            self.assertEqual(client.query_payment("TR1")['transactionStatus'], 'Completed')
+            self.failures = 1
+            with self.assertRaises(BKashError):
+                client.execute_payment("TR1")
+        self.assertEqual(self.calls, ['token/grant', 'payment/status', 'payment/status', 'payment/status', 'execute'])
+
+    def test_failing_gateway_is_skipped_until_a_probe_succeeds(self):
+        other = BasePaymentGateWay.objects.create(method='bkash', base_url="https://other.invalid/", details_json=self.gateway.details_json)
+        self.failures = settings.GATEWAY_BREAKER_MIN_CALLS
+        with mock.patch.object(requests.Session, 'post', self._bkash):
+            client = BKashClient(self.gateway)
+            for n in range(settings.GATEWAY_BREAKER_MIN_CALLS):
+                with self.assertRaises(BKashError):
+                    client.execute_payment(f"TR{n}")
+        self.assertEqual(BasePaymentGateWaySerializer(self.gateway).data['circuit']['state'], 'open')
+        self.assertEqual([get_next_gateway('bkash') for _ in range(3)], [other] * 3)
+
+        # After the cooldown one caller gets the gateway as the half-open probe.
+        entry = cache.get(breaker_key(self.gateway.method_uuid))
+        cache.set(breaker_key(self.gateway.method_uuid), {**entry, 'opened_at': entry['opened_at'] - settings.GATEWAY_BREAKER_COOLDOWN}, None)
+        self.assertEqual(circuit_status(self.gateway.method_uuid)['state'], 'half-open')
+        self.assertEqual([get_next_gateway('bkash') for _ in range(4)].count(self.gateway), 1)
+        record_call(self.gateway.method_uuid, 200, 0.1)
+        self.assertEqual(circuit_status(self.gateway.method_uuid), {'state': 'closed', 'opened_at': None, 'calls': 0, 'failure_rate': 0, 'slow_rate': 0})
+        self.assertEqual({get_next_gateway('bkash') for _ in range(2)}, {self.gateway, other})
+
+# ========================================bKash Client End===================================
+
+
+# ========================================Gateway Rotation Start===================================
+class GatewayRotationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gateways = [
+            BasePaymentGateWay.objects.create(
+                method='bkash', base_url=f"https://{n}.invalid/", weight=weight,
+                details_json={'app_key': 'k', 'app_secret': 's', 'username': 'u', 'password': 'p'},
+            )
+            for n, weight in enumerate((1, 1, 2))
+        ]
+
+    def test_weighted_slots_are_spread_out(self):
+        self.assertEqual(weighted_slots({'a': 1, 'b': 1, 'c': 2}), ['c', 'a', 'b', 'c'])
+        self.assertEqual(sorted(weighted_slots({'a': 3, 'b': 1})), ['a', 'a', 'a', 'b'])
+
+    def test_parallel_workers_split_by_weight(self):
+        get_next_gateway('bkash')  # the slot list is cached; the workers only touch the cache
+        picks = []
+
+        def worker():
+            picks.extend(get_next_gateway('bkash').id for _ in range(100))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 800 consecutive counter values cover the 4 slots exactly 200 times.
+        self.assertEqual([picks.count(gateway.id) for gateway in self.gateways], [200, 200, 400])
+
+    def test_selection_runs_no_queries(self):
+        get_next_gateway('bkash')
+        with self.assertNumQueries(0):
+            picked = [get_next_gateway('bkash') for _ in range(4)]
+            # One client per gateway, also for a copy loaded elsewhere (e.g. invoice.payment_gateway).
+            self.assertIs(bkash_client(picked[0]), bkash_client(picked[0]))
+            self.assertIs(bkash_client(BasePaymentGateWay(pk=picked[0].pk, method_uuid=picked[0].method_uuid)), bkash_client(picked[0]))
+
+    def test_other_workers_reload_on_a_new_version(self):
+        snapshot = gateway_registry()
+        self.assertIs(gateway_registry(), snapshot)
+        # A save in another worker only reaches this one through the version token.
+        BasePaymentGateWay.objects.filter(pk=self.gateways[0].pk).update(is_active=False)
+        self.assertIs(gateway_registry(), snapshot)
+        cache.set(REGISTRY_VERSION_KEY, uuid.uuid4().hex, None)
+        self.assertNotIn(self.gateways[0].method_uuid, gateway_registry().gateways)
+        # Gateways outside the snapshot still get a (fresh) client.
+        self.assertIsNot(bkash_client(self.gateways[0]), bkash_client(self.gateways[0]))
+
+    def test_rotation_follows_gateway_changes(self):
+        self.gateways[2].weight = 0
+        self.gateways[2].save()
+        self.gateways[1].is_active = False
+        self.gateways[1].save()
+        self.assertEqual({get_next_gateway('bkash') for _ in range(4)}, {self.gateways[0]})
+        self.assertIsNone(get_next_gateway('nagad-personal'))
+
+# ========================================Gateway Rotation End===================================
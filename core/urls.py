@@ -1,13 +1,23 @@
-from .views import InvoiceViewSet, GetOnlinePayment, CreatePayment, WalletOverView, WalletTransactionViewSet, WithdrawRequestViewSet, PaymentPayOutView, UserPaymentMethodView, PayOutViewSet, VerifyPayment
+from .views import InvoiceViewSet, GetOnlinePayment, CreatePayment, BulkCreatePayment, WalletOverView, WalletTransactionViewSet, WithdrawRequestViewSet, PaymentPayOutView, PaymentPayOutBatchView, UserPaymentMethodView, PayOutViewSet, VerifyPayment, AsyncGetOnlinePayment, AsyncVerifyPayment
 from .payment.personal_payment import BkashPersonalAgentPaymentView, NagadPersonalAgentPaymentView, RocketPersonalAgentPaymentView
-from .payment.bkash import BKashCreatePaymentView, BKashCallbackView, BKashQueryPaymentView
+from .payment.bkash import BKashCreatePaymentView, BKashCallbackView, BKashQueryPaymentView, AsyncBKashCreatePaymentView, AsyncBKashCallbackView
 from .payment.nagad import NagadCreatePaymentView
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
+from django.conf import settings
 
 
 
 
+# Checkout views, native async under ASYNC_CHECKOUT (see settings).
+if settings.ASYNC_CHECKOUT:
+    GetPaymentView, VerifyPaymentView = AsyncGetOnlinePayment, AsyncVerifyPayment
+    BKashCreateView, BKashCallback = AsyncBKashCreatePaymentView, AsyncBKashCallbackView
+else:
+    GetPaymentView, VerifyPaymentView = GetOnlinePayment, VerifyPayment
+    BKashCreateView, BKashCallback = BKashCreatePaymentView, BKashCallbackView
+
+
 invoice_router = DefaultRouter()
 invoice_router.register(r'invoices', InvoiceViewSet, basename='invoices')
 
@@ -34,17 +44,20 @@ urlpatterns = [
     
     #API For Payment m2m=================/API key & Secret Key Verify/===========
     path('payment/create/', CreatePayment.as_view(), name='create-payment'),
+    path('payment/create/bulk/', BulkCreatePayment.as_view(), name='create-payment-bulk'),
     path('payment/payout/', PaymentPayOutView.as_view(), name='payment-payout'),
-    path('payment/verify/', VerifyPayment.as_view(), name='payment-payout'),
+    path('payment/payout/batch/', PaymentPayOutBatchView.as_view(), name='payment-payout-batch'),
+    path('payment/payout/batch/<str:batch_id>/', PaymentPayOutBatchView.as_view(), name='payment-payout-batch-detail'),
+    path('payment/verify/', VerifyPaymentView.as_view(), name='payment-verify'),
     # ---------------------------SendBox-------------------------------------
     
     #API For Payment m2m=================/Not Authentication Needed/===========
-    path('get-payment/', GetOnlinePayment.as_view(), name='get-payment'),
+    path('get-payment/', GetPaymentView.as_view(), name='get-payment'),
     
     #Bkash Payment Gate URL list==============
-    path('get-payment/bkash/', BKashCreatePaymentView.as_view(), name='get-payment-bkash'),
+    path('get-payment/bkash/', BKashCreateView.as_view(), name='get-payment-bkash'),
     path('bkash/payment/verify/', BKashQueryPaymentView.as_view(), name='bkash-payment-verify'),
-    path('payment/<str:invoice_payment_id>/bkash/callback/', BKashCallbackView.as_view(), name='bkash_callback'),
+    path('payment/<str:invoice_payment_id>/bkash/callback/', BKashCallback.as_view(), name='bkash_callback'),
     
     path('get-payment/nagad/', NagadCreatePaymentView.as_view(), name='get-payment-nagad'),
     
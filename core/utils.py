@@ -2,6 +2,7 @@ from authentication.permissions import IsOwnerByUser
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from django.http import HttpResponse
 from authentication.models import Merchant
 from cryptography.fernet import Fernet
 from rest_framework import viewsets
@@ -10,6 +11,10 @@ import json
 import base64
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.conf import settings
+from .rollups import rollup_totals, whole_day_range
+from .compiled import CompiledListMixin
+from .renderers import FastJSONRenderer
 
 class DataEncryptDecrypt:
     def __init__(self, key=None):
@@ -62,7 +67,7 @@ class CustomPagenumberpagination(PageNumberPagination):
             }, status=status.HTTP_200_OK
         )
 
-class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
+class CustomPaymentSectionViewsets(CompiledListMixin, viewsets.ModelViewSet):
     permission_classes = [IsOwnerByUser]
     pagination_class = CustomPagenumberpagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -76,6 +81,10 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
     create_permission_denied_message = "Only Merchant user can Create!"
     ordering_by = "-id"
     
+    rollup_kind = None
+    rollup_status_fields = ('status',)
+    rollup_safe_params = frozenset(('page', 'page_size', 'all', 'ordering', 'created_at_after', 'created_at_before'))
+    
     #----------User-----------------------------------
     def get_user(self):
         return self.request.user
@@ -100,6 +109,36 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
                 return self.queryset
     
     
+    #-------------Rollup Totals-------------------------
+    def get_rollup_totals(self, group_by):
+        """
+        Amounts per value of group_by read from WalletRollup, or None when the
+        request can not be answered from whole-day buckets (search, other
+        filters, staff scoping) and the rows have to be summed instead.
+        """
+        if not (self.rollup_kind and settings.WALLET_ROLLUPS_READ):
+            return None
+        params = {name: value for name, value in self.request.query_params.items() if value != ''}
+        status_filters = {name: params[name] for name in self.rollup_status_fields if name in params}
+        if set(params) - self.rollup_safe_params - set(status_filters):
+            return None
+        
+        merchant = self.get_merchant()
+        role = (getattr(getattr(self.get_user(), 'role', None), 'name', '') or '').lower()
+        if merchant is None and role != 'admin':
+            return None
+        days = whole_day_range(params.get('created_at_after'), params.get('created_at_before'))
+        if days is None:
+            return None
+        
+        result = {}
+        for key, amount in rollup_totals(self.rollup_kind, merchant, *days).items():
+            values = dict(zip(self.rollup_status_fields, key.split(':')))
+            if any(values.get(name) != value for name, value in status_filters.items()):
+                continue
+            result[values[group_by]] = result.get(values[group_by], 0) + amount
+        return result
+    
     #-------------Created-------------------------------
     def create(self, request, *args, **kwargs):
         if not self.get_merchant():
@@ -152,6 +191,7 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
         
         queryset = self.filter_queryset(queryset)
         total_amount = self.get_total_amount(queryset)
+        rows = self.list_rows(queryset)
                 
         all_items = request.query_params.get('all', 'false').lower() == 'true'
         # page_size = request.query_params.get(self.pagination_class.page_size_query_param)
@@ -160,13 +200,13 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
         # if all_items or (page_size and page_size.isdigit() and int(page_size)==0):
         if all_items:
             try:
-                response = self.get_serializer(queryset, many=True)
+                data = self.list_data(rows)
                 return Response(
                     {
                         'status': True,
-                        'count': len(response.data),
+                        'count': len(data),
                         'total_amount': total_amount,
-                        'data': response.data
+                        'data': data
                     },
                     status=status.HTTP_200_OK
                 )
@@ -179,9 +219,8 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
         
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(rows)
         if page is not None:
-            response = self.get_serializer(page, many=True)
             return Response(
                 {
                     'status': True,
@@ -189,19 +228,19 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
                     'next': self.paginator.get_next_link(),
                     'previous': self.paginator.get_previous_link(),
                     'total_amount': total_amount,
-                    'data': response.data
+                    'data': self.list_data(page)
                 },
                 status=status.HTTP_200_OK
             )
         else:
             try:
-                response = self.get_serializer(queryset, many=True)
+                data = self.list_data(rows)
                 return Response(
                     {
                         'status': True,
-                        'count': len(response.data),
+                        'count': len(data),
                         'total_amount': total_amount,
-                        'data': response.data
+                        'data': data
                     },
                     status=status.HTTP_200_OK
                 )
@@ -311,20 +350,50 @@ class CustomPaymentSectionViewsets(viewsets.ModelViewSet):
 
 
 
-def build_logo_url(request, brand_logo):
+def logo_path(brand_logo):
+    """Site-relative (or storage-absolute) URL of a logo, without the request's host."""
     if not brand_logo:
         return None
 
     url_attr = getattr(brand_logo, 'url', None)
     try:
         if url_attr:
-            return request.build_absolute_uri(brand_logo.url)
+            return brand_logo.url
     except Exception:
         pass
 
     from django.conf import settings
     path_str = str(brand_logo).lstrip('/')
     media_url = getattr(settings, 'MEDIA_URL', '/media/')
-    return request.build_absolute_uri(f"{media_url.rstrip('/')}/{path_str}")
+    return f"{media_url.rstrip('/')}/{path_str}"
+
+
+def build_logo_url(request, brand_logo):
+    path = logo_path(brand_logo)
+    return request.build_absolute_uri(path) if path else None
+
 
+def render_api_response(response):
+    """
+    Renders a DRF Response returned outside a DRF view (the async checkout
+    views are plain Django views) exactly as the API's renderer would.
+    Other responses, e.g. redirects, pass through.
+    """
+    if not isinstance(response, Response):
+        return response
+    rendered = HttpResponse(FastJSONRenderer().render(response.data), status=response.status_code, content_type='application/json')
+    for name, value in response.items():
+        if name.lower() != 'content-type':
+            rendered[name] = value
+    return rendered
 
+
+def parse_request_data(request):
+    """request.data for a plain Django view: the JSON body, or the form fields."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
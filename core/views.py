@@ -1,16 +1,32 @@
-from .serializers import InvoiceSerializer, PaymentTransferSerializer, WithdrawRequestSerializer, WalletTransactionSerializer, UserPaymentMethodSerializer
-from .utils import CustomPaymentSectionViewsets, DataEncryptDecrypt, CustomPagenumberpagination, build_logo_url
+from .serializers import InvoiceSerializer, BulkInvoiceSerializer, PaymentTransferSerializer, BulkPayoutSerializer, WithdrawRequestSerializer, WalletTransactionSerializer, UserPaymentMethodSerializer
+from .utils import CustomPaymentSectionViewsets, DataEncryptDecrypt, CustomPagenumberpagination, render_api_response, parse_request_data
 from rest_framework.exceptions import NotFound, ValidationError, AuthenticationFailed
-from authentication.models import Merchant, APIKey, UserPaymentMethod, StorePaymentMessage
-from .models import Invoice, PaymentTransfer, WithdrawRequest, WalletTransaction
+from authentication.models import Merchant, UserPaymentMethod, StorePaymentMessage
+from .models import Invoice, PaymentTransfer, PayoutBatch, WithdrawRequest, WalletTransaction
+from .revenue import platform_revenue
+from .idempotency import idempotent
+from .checkout import (
+    checkout_methods, store_checkout_sessions, get_checkout_state, aget_checkout_state, checkout_session_key,
+    is_terminal, invoice_status, get_invoice_status, aget_invoice_status, store_invoice_status,
+    etag_matches, with_status_headers, not_modified,
+)
+from .rollups import rollup_totals
+from .compiled import CompiledListMixin
+from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
 from authentication.permissions import MerchantCreatePermission, StaffUpdatePermission, AdminUpdatePermission
 from authentication.serializers import MerchantWalletSerializer
+from authentication.credentials import resolve_merchant
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import views, status
 from django.shortcuts import redirect
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets
 from django.urls import reverse
 from dotenv import load_dotenv
@@ -37,17 +53,16 @@ class CreatePayment(views.APIView):
         if not api_key or not secret_key:
             raise AuthenticationFailed("Missing API-KEY, SECRET-KEY, or BRAND-KEY.")
 
-        try:
-            api_key = APIKey.objects.get(api_key=api_key, secret_key=secret_key, is_active=True)
-        except APIKey.DoesNotExist:
+        merchant = resolve_merchant(api_key, secret_key)
+        if merchant is None:
             raise AuthenticationFailed("Invalid API-KEY.")
 
         # if not merchant.check_secret(secret_key):
         #     raise AuthenticationFailed("Invalid SECRET-KEY.")
         
-        # self._check_domain(request, api_key.merchant)
+        # self._check_domain(request, merchant)
 
-        return api_key.merchant
+        return merchant
         
     def json_encrypted(self, post_data):
         url_json = {
@@ -71,42 +86,19 @@ class CreatePayment(views.APIView):
         return ["bkash", "nagad", "rocket", "bkash-personal", "bkash-agent", "nagad-personal", "nagad-agent", "rocket-personal", "rocket-agent"]
     
     
+    def payment_url(self, request, invoice, bkash_base=None):
+        if invoice.method and invoice.method.lower() in self.get_accepted_method():
+            if invoice.method.lower() == "bkash":
+                base = bkash_base or request.build_absolute_uri(reverse('get-payment'))
+                return f"{base}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
+            elif invoice.method.lower() in ("nagad", "rocket"):
+                return f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
+        return f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}"
+    
     def post(self, request, *args, **kwargs):
         try:
             merchant = self.authenticate_using_api_key_and_secret(request)
-            serializer = InvoiceSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(merchant=merchant)
-            invoice = serializer.instance
-            if invoice.method and invoice.method.lower() in self.get_accepted_method():
-                if invoice.method.lower() == "bkash":
-                    base = reverse('get-payment')
-                    paymentURL = f"{request.build_absolute_uri(base)}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
-                    # url = f"{reverse('get-payment')}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
-                    # paymentURL = url
-                elif invoice.method.lower() == "nagad":
-                    paymentURL = f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
-                elif invoice.method.lower() == "rocket":
-                    paymentURL = f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}&method={invoice.method}"
-                else:
-                    paymentURL = f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}"
-            else:
-                paymentURL = f"{os.getenv('PAYMENT_SITE_BASE_URL')}?invoice_payment_id={invoice.invoice_payment_id}"
-            return Response(
-                {
-                    "statusMessage": "Successful",
-                    "paymentID": f"{invoice.invoice_payment_id}",
-                    "paymentURL": paymentURL,
-                    "callbackURL": f"{invoice.callback_url}",
-                    "successCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=success",
-                    "failureCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=failure",
-                    "cancelledCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=cancel",
-                    "amount": f"{invoice.customer_amount}",
-                    "paymentCreateTime": f"{invoice.created_at}",
-                    "transactionStatus": "Initiated",
-                    "merchantInvoiceNumber": f"{invoice.merchant.merchant_id}"
-                }, status=status.HTTP_200_OK
-            )
+            return idempotent(request, merchant, lambda: self.create_payment(request, merchant))
         except Exception as e:
             return Response(
                 {
@@ -114,6 +106,66 @@ class CreatePayment(views.APIView):
                     'message': str(e)
                 }
             )
+    
+    def create_payment(self, request, merchant):
+        serializer = InvoiceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(merchant=merchant)
+        invoice = serializer.instance
+        store_checkout_sessions([invoice], merchant, created=True)
+        paymentURL = self.payment_url(request, invoice)
+        return Response(
+            {
+                "statusMessage": "Successful",
+                "paymentID": f"{invoice.invoice_payment_id}",
+                "paymentURL": paymentURL,
+                "callbackURL": f"{invoice.callback_url}",
+                "successCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=success",
+                "failureCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=failure",
+                "cancelledCallbackURL": f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&paymentStatus=cancel",
+                "amount": f"{invoice.customer_amount}",
+                "paymentCreateTime": f"{invoice.created_at}",
+                "transactionStatus": "Initiated",
+                "merchantInvoiceNumber": f"{invoice.merchant.merchant_id}"
+            }, status=status.HTTP_200_OK
+        )
+
+class BulkCreatePayment(CreatePayment):
+    """
+    Creates up to BULK_INVOICE_MAX_ITEMS invoices in one call. Body is
+    {"invoices": [...]} (or the bare list); every item is validated on its
+    own and the valid ones are inserted together, so each result carries
+    either a paymentURL or the item's errors.
+    """
+    def create_payment(self, request, merchant):
+        items = request.data.get('invoices') if isinstance(request.data, dict) else request.data
+        serializer = BulkInvoiceSerializer(data=items, many=True, max_length=settings.BULK_INVOICE_MAX_ITEMS)
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save(merchant=merchant)
+        store_checkout_sessions([invoice for _, invoice in created], merchant, created=True)
+        
+        bkash_base = request.build_absolute_uri(reverse('get-payment'))
+        results = [{"index": index, "errors": errors} for index, errors in serializer.item_errors.items()]
+        for index, invoice in created:
+            results.append({
+                "index": index,
+                "paymentID": f"{invoice.invoice_payment_id}",
+                "paymentURL": self.payment_url(request, invoice, bkash_base=bkash_base),
+                "amount": f"{invoice.customer_amount}",
+                "customerOrderId": invoice.customer_order_id,
+                "paymentCreateTime": f"{invoice.created_at}",
+                "transactionStatus": "Initiated",
+            })
+        results.sort(key=lambda item: item["index"])
+        return Response(
+            {
+                "statusMessage": "Successful" if not serializer.item_errors else "Partially Successful",
+                "created": len(created),
+                "failed": len(serializer.item_errors),
+                "merchantInvoiceNumber": f"{merchant.merchant_id}",
+                "results": results,
+            }, status=status.HTTP_200_OK
+        )
 
 class PaymentPayOutView(views.APIView):
     def authenticate_using_api_key_and_secret(self, request):
@@ -123,30 +175,16 @@ class PaymentPayOutView(views.APIView):
         if not api_key or not secret_key:
             raise AuthenticationFailed("Missing API-KEY, SECRET-KEY, or BRAND-KEY.")
 
-        try:
-            api_key = APIKey.objects.get(api_key=api_key, secret_key=secret_key, is_active=True)
-        except APIKey.DoesNotExist:
+        merchant = resolve_merchant(api_key, secret_key)
+        if merchant is None:
             raise AuthenticationFailed("Invalid API-KEY.")
         
-        return api_key.merchant
+        return merchant
     
     def post(self, request, *args, **kwargs):
         try:
             merchant = self.authenticate_using_api_key_and_secret(request)
-            serializer = PaymentTransferSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(merchant=merchant)
-            return Response(
-                {
-                    "status": True,
-                    "payoutID": f"{serializer.instance.trx_uuid}",
-                    "method": f"{serializer.instance.payment_method}",
-                    "amount": f"{serializer.instance.amount}",
-                    "payoutCreateTime": f"{serializer.instance.created_at}",
-                    "transactionStatus": f"{serializer.instance.status}",
-                    "merchantId": f"{serializer.instance.merchant.merchant_id}"
-                }, status=status.HTTP_200_OK
-            )
+            return idempotent(request, merchant, lambda: self.create_payout(request, merchant))
         except Exception as e:
             return Response(
                 {
@@ -154,8 +192,89 @@ class PaymentPayOutView(views.APIView):
                     'message': str(e)
                 }
             )
+    
+    def create_payout(self, request, merchant):
+        serializer = PaymentTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(merchant=merchant)
+        return Response(
+            {
+                "status": True,
+                "payoutID": f"{serializer.instance.trx_uuid}",
+                "method": f"{serializer.instance.payment_method}",
+                "amount": f"{serializer.instance.amount}",
+                "payoutCreateTime": f"{serializer.instance.created_at}",
+                "transactionStatus": f"{serializer.instance.status}",
+                "merchantId": f"{serializer.instance.merchant.merchant_id}"
+            }, status=status.HTTP_200_OK
+        )
+
+class PaymentPayOutBatchView(PaymentPayOutView):
+    """
+    Submits up to BULK_PAYOUT_MAX_ITEMS payouts in one call. Body is
+    {"payouts": [...]} (or the bare list). The batch is all or nothing: any
+    invalid item, or a wallet that can't cover every payout plus its fee,
+    rejects the whole batch. GET payment/payout/batch/<batchID>/ reports it.
+    """
+    def create_payout(self, request, merchant):
+        items = request.data.get('payouts') if isinstance(request.data, dict) else request.data
+        serializer = BulkPayoutSerializer(data=items, many=True, max_length=settings.BULK_PAYOUT_MAX_ITEMS)
+        serializer.is_valid(raise_exception=True)
+        if serializer.item_errors:
+            return Response(
+                {
+                    'status': False,
+                    'message': "Invalid payouts, nothing was submitted.",
+                    'errors': [{"index": index, "errors": errors} for index, errors in serializer.item_errors.items()]
+                }, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            batch, created = serializer.save(merchant=merchant)
+        except DjangoValidationError as e:
+            return Response({'status': False, 'message': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                "status": True,
+                "batchID": f"{batch.batch_uuid}",
+                "count": batch.payout_count,
+                "amount": f"{batch.amount}",
+                "fee": f"{batch.fee}",
+                "payouts": [
+                    {"index": index, "payoutID": f"{transfer.trx_uuid}", "amount": f"{transfer.amount}", "transactionStatus": transfer.status}
+                    for index, transfer in created
+                ],
+                "batchCreateTime": f"{batch.created_at}",
+                "merchantId": f"{merchant.merchant_id}"
+            }, status=status.HTTP_200_OK
+        )
+    
+    def get(self, request, batch_id=None, *args, **kwargs):
+        try:
+            merchant = self.authenticate_using_api_key_and_secret(request)
+        except AuthenticationFailed as e:
+            return Response({'status': False, 'message': str(e)})
+        batch = PayoutBatch.objects.filter(merchant=merchant, batch_uuid=batch_id).first()
+        if batch is None:
+            return Response({'status': False, 'message': "Payout batch not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                "status": True,
+                "batchID": f"{batch.batch_uuid}",
+                "count": batch.payout_count,
+                "amount": f"{batch.amount}",
+                "fee": f"{batch.fee}",
+                "statusCounts": batch.status_counts(),
+                "payouts": [
+                    {"payoutID": trx_uuid, "amount": f"{amount}", "transactionStatus": payout_status, "trxID": trx_id}
+                    for trx_uuid, amount, payout_status, trx_id in
+                    batch.transfers.order_by('id').values_list('trx_uuid', 'amount', 'status', 'trx_id')
+                ],
+                "batchCreateTime": f"{batch.created_at}",
+            }, status=status.HTTP_200_OK
+        )
+
 
-class GetOnlinePayment(views.APIView):
+class CheckoutPageMixin:
     def use_method_for_auto_redirect(self, method, invoice_payment_id):
         if method == 'bkash':
             url = reverse('get-payment-bkash')
@@ -200,89 +319,120 @@ class GetOnlinePayment(views.APIView):
                 'payment_methods': self.get_all_payment_method(invoice_payment_id)
             }, status=status.HTTP_200_OK)
     
-    def _abs(self, name):
-        return self.request.build_absolute_uri(reverse(name))
-    
-    def get_all_payment_method(self, invoice_payment_id):
+    def get_all_payment_method(self, invoice_payment_id, methods=None):
+        base = self.request.build_absolute_uri('/')[:-1]
         return [
-            {
-                "method": "bkash",
-                "url": f"{self._abs('get-payment-bkash')}?invoice_payment_id={invoice_payment_id}&redirect=1"
-            },
-            {
-                "method": "bkash-personal",
-                "url": f"{self._abs('bkash-manual-payment')}?method=bkash-personal&invoice_payment_id={invoice_payment_id}"
-            },
-            {
-                "method": "bkash-agent",
-                "url": f"{self._abs('bkash-manual-payment')}?method=bkash-agent&invoice_payment_id={invoice_payment_id}"
-            },
-            {
-                "method": "nagad-personal",
-                "url": f"{self._abs('nagad-manual-payment')}?method=nagad-personal&invoice_payment_id={invoice_payment_id}"
-            },
-            {
-                "method": "nagad-agent",
-                "url": f"{self._abs('nagad-manual-payment')}?method=nagad-agent&invoice_payment_id={invoice_payment_id}"
-            },
-            {
-                "method": "rocket-personal",
-                "url": f"{self._abs('rocket-manual-payment')}?method=rocket-personal&invoice_payment_id={invoice_payment_id}"
-            },
-            {
-                "method": "rocket-agent",
-                "url": f"{self._abs('rocket-manual-payment')}?method=rocket-agent&invoice_payment_id={invoice_payment_id}"
-            },
-            {"method": "bank", "url": "Bank"}
+            {"method": item["method"], "url": base + item["url"] if item["url"].startswith('/') else item["url"]}
+            for item in (methods or checkout_methods(invoice_payment_id))
         ]
     
-    def get(self, request, *args, **kwargs):    
-        invoice_payment_id = request.GET.get('invoice_payment_id')
-        if not invoice_payment_id:
-            return Response({
-                'status': False,
-                'message': "Missing 'Invoice Payment ID' parameter"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            invoice = Invoice.objects.get(invoice_payment_id=invoice_payment_id)
-        except Invoice.DoesNotExist:
-            raise NotFound("Invoice with provided Invoice Payment ID not found.")
-        
-        
-        status_verify = self.status_verify(invoice)
-        if status_verify:
-            return status_verify
-        
-        method = request.query_params.get("method")
+    def checkout_response(self, request, invoice_payment_id, session):
+        method = request.GET.get("method")
         if method:
             return self.use_method_for_auto_redirect(method, invoice_payment_id)
                 
         return Response({
             'status': True,
             'invoice': {
-                "amount": invoice.customer_amount
+                "amount": session['amount']
             },
             'mechant_info': {
-                'brand_name': invoice.merchant.brand_name,
-                'brand_logo': build_logo_url(request, getattr(invoice.merchant, 'brand_logo', None))
+                'brand_name': session['brand_name'],
+                'brand_logo': request.build_absolute_uri(session['brand_logo']) if session['brand_logo'] else None
             },
-            'payment_methods': self.get_all_payment_method(invoice_payment_id)
+            'payment_methods': self.get_all_payment_method(invoice_payment_id, session['payment_methods'])
         }, status=status.HTTP_200_OK)
     
+    def missing_invoice_payment_id(self):
+        return Response({
+            'status': False,
+            'message': "Missing 'Invoice Payment ID' parameter"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    def terminal_response(self, pay_status):
+        return Response(
+            {
+                'status': False,
+                'message': f"This invoice is already {pay_status} and cannot be edited."
+            }, status=status.HTTP_406_NOT_ACCEPTABLE
+        )
+    
     def status_verify(self, invoice):
-        if invoice.pay_status.lower() in ['paid', 'failed', 'cancelled']:
-            return Response(
-                {
-                    'status': False,
-                    'message': f"This invoice is already {invoice.pay_status} and cannot be edited."
-                }, status=status.HTTP_406_NOT_ACCEPTABLE
-            )
+        if is_terminal(invoice.pay_status):
+            return self.terminal_response(invoice.pay_status)
         return False
+    
+    def cached_checkout_response(self, request, entry):
+        # Polls are answered from the status entry alone: a terminal invoice
+        # is refused and an unchanged one gets a 304.
+        if entry is None:
+            return None
+        if is_terminal(entry['pay_status']):
+            return self.terminal_response(entry['pay_status'])
+        if etag_matches(request, entry):
+            return not_modified(entry)
+        return None
 
-class VerifyPayment(views.APIView):
-    def post(self, request, *args, **kwargs):
-        status_params = request.data.get("status")
-        invoice_payment_id = request.data.get("invoice_payment_id")
+
+class GetOnlinePayment(CheckoutPageMixin, views.APIView):
+    def get(self, request, *args, **kwargs):    
+        invoice_payment_id = request.GET.get('invoice_payment_id')
+        if not invoice_payment_id:
+            return self.missing_invoice_payment_id()
+        
+        # Open invoices are served from the checkout session cached at creation;
+        # it is dropped when the invoice changes, so a miss re-checks the invoice.
+        session, entry, version = get_checkout_state(invoice_payment_id)
+        cached = self.cached_checkout_response(request, entry)
+        if cached:
+            return cached
+        if session is None:
+            try:
+                invoice = Invoice.objects.select_related('merchant').get(invoice_payment_id=invoice_payment_id)
+            except Invoice.DoesNotExist:
+                raise NotFound("Invoice with provided Invoice Payment ID not found.")
+            
+            status_verify = self.status_verify(invoice)
+            if status_verify:
+                store_invoice_status(invoice, version)
+                return status_verify
+            # Stamped with the version read before the invoice, so a save that
+            # committed meanwhile leaves this session unserved.
+            session = store_checkout_sessions([invoice], version=version)[checkout_session_key(invoice_payment_id)]
+            entry = invoice_status(invoice)
+        return with_status_headers(self.checkout_response(request, invoice_payment_id, session), entry)
+
+
+class AsyncGetOnlinePayment(CheckoutPageMixin, View):
+    """GetOnlinePayment for ASYNC_CHECKOUT: same responses, no worker thread held while waiting."""
+    async def get(self, request, *args, **kwargs):
+        invoice_payment_id = request.GET.get('invoice_payment_id')
+        if not invoice_payment_id:
+            return render_api_response(self.missing_invoice_payment_id())
+        
+        session, entry, version = await aget_checkout_state(invoice_payment_id)
+        cached = self.cached_checkout_response(request, entry)
+        if cached:
+            return render_api_response(cached)
+        if session is None:
+            invoice = await Invoice.objects.select_related('merchant').filter(invoice_payment_id=invoice_payment_id).afirst()
+            if invoice is None:
+                return render_api_response(Response(
+                    {"detail": "Invoice with provided Invoice Payment ID not found."}, status=status.HTTP_404_NOT_FOUND
+                ))
+            
+            status_verify = self.status_verify(invoice)
+            if status_verify:
+                await sync_to_async(store_invoice_status)(invoice, version)
+                return render_api_response(status_verify)
+            sessions = await sync_to_async(store_checkout_sessions)([invoice], version=version)
+            session = sessions[checkout_session_key(invoice_payment_id)]
+            entry = invoice_status(invoice)
+        return render_api_response(with_status_headers(self.checkout_response(request, invoice_payment_id, session), entry))
+
+
+class VerifyPaymentMixin:
+    def verify_params_error(self, status_params, invoice_payment_id):
         if not invoice_payment_id:
             return Response(
                 {
@@ -297,36 +447,75 @@ class VerifyPayment(views.APIView):
                     "message": "Status must be given!"
                 }, status=status.HTTP_400_BAD_REQUEST
             )
-        elif invoice_payment_id and status:
-            if not Invoice.objects.filter(invoice_payment_id=invoice_payment_id).exists():
-                return Response(
-                    {
-                        "status": False,
-                        "message": "Invalid Invoice Payment ID!"
-                    }, status=status.HTTP_400_BAD_REQUEST
-                )
-            else:
-                invoice = Invoice.objects.get(invoice_payment_id=invoice_payment_id)
-                callback_url = f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&trxID={invoice.transaction_id}&amount={invoice.customer_amount}&paymentStatus={invoice.pay_status}&created_at={invoice.created_at}"
-                return Response(
-                    {
-                        "status": True if invoice.pay_status == "Paid" else False,
-                        "data": {
-                            "invoice_payment_id": invoice.invoice_payment_id,
-                            "trxID": invoice.transaction_id,
-                            "amount": invoice.customer_amount,
-                            "transactionStatus": "Complete" if invoice.pay_status == "paid" else "Incomplete",
-                            "client_callback_url": callback_url if invoice.callback_url else None
-                        }
-                    }, status=status.HTTP_200_OK
-                )
-        else:
+        return None
+    
+    def verify_response(self, invoice):
+        if invoice is None:
             return Response(
                 {
                     "status": False,
-                    "message": "Something wrong!"
+                    "message": "Invalid Invoice Payment ID!"
                 }, status=status.HTTP_400_BAD_REQUEST
             )
+        callback_url = f"{invoice.callback_url}?invoice_payment_id={invoice.invoice_payment_id}&trxID={invoice.transaction_id}&amount={invoice.customer_amount}&paymentStatus={invoice.pay_status}&created_at={invoice.created_at}"
+        return Response(
+            {
+                "status": True if invoice.pay_status == "Paid" else False,
+                "data": {
+                    "invoice_payment_id": invoice.invoice_payment_id,
+                    "trxID": invoice.transaction_id,
+                    "amount": invoice.customer_amount,
+                    "transactionStatus": "Complete" if invoice.pay_status == "paid" else "Incomplete",
+                    "client_callback_url": callback_url if invoice.callback_url else None
+                }
+            }, status=status.HTTP_200_OK
+        )
+
+
+class VerifyPayment(VerifyPaymentMixin, views.APIView):
+    def verify(self, request, data):
+        status_params = data.get("status")
+        invoice_payment_id = data.get("invoice_payment_id")
+        error = self.verify_params_error(status_params, invoice_payment_id)
+        if error:
+            return error
+        # The version is read before the invoice, so a save committing in between voids the entry stored here.
+        entry, version = get_invoice_status(invoice_payment_id)
+        if request.method == 'GET' and etag_matches(request, entry):
+            return not_modified(entry)
+        invoice = Invoice.objects.filter(invoice_payment_id=invoice_payment_id).first()
+        entry = store_invoice_status(invoice, version) if invoice else None
+        return with_status_headers(self.verify_response(invoice), entry)
+    
+    def get(self, request, *args, **kwargs):
+        # Polling form of the POST: answers If-None-Match with 304 from the status cache.
+        return self.verify(request, request.query_params)
+    
+    def post(self, request, *args, **kwargs):
+        return self.verify(request, request.data)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncVerifyPayment(VerifyPaymentMixin, View):
+    """VerifyPayment for ASYNC_CHECKOUT."""
+    async def verify(self, request, data):
+        status_params = data.get("status")
+        invoice_payment_id = data.get("invoice_payment_id")
+        error = self.verify_params_error(status_params, invoice_payment_id)
+        if error:
+            return render_api_response(error)
+        entry, version = await aget_invoice_status(invoice_payment_id)
+        if request.method == 'GET' and etag_matches(request, entry):
+            return not_modified(entry)
+        invoice = await Invoice.objects.filter(invoice_payment_id=invoice_payment_id).afirst()
+        entry = await sync_to_async(store_invoice_status)(invoice, version) if invoice else None
+        return render_api_response(with_status_headers(self.verify_response(invoice), entry))
+    
+    async def get(self, request, *args, **kwargs):
+        return await self.verify(request, request.GET)
+    
+    async def post(self, request, *args, **kwargs):
+        return await self.verify(request, parse_request_data(request))
 
 # ===============================================================================================
 # ====================Merchant Payment Gate API View Start==================================
@@ -351,6 +540,8 @@ class InvoiceViewSet(CustomPaymentSectionViewsets):
     pagination_class = CustomPagenumberpagination
     model = Invoice
     lookup_field = 'invoice_payment_id'
+    rollup_kind = 'invoice'
+    rollup_status_fields = ('status', 'pay_status')
     
     search_fields = [
         'invoice_payment_id', 'customer_name', 'customer_number',
@@ -367,12 +558,17 @@ class InvoiceViewSet(CustomPaymentSectionViewsets):
     # ordering_by = "-id"
     
     def get_total_amount(self, queryset):
-        total_amount = queryset.aggregate(total=Sum("customer_amount"))["total"] or 0
-        status_sums = (
-            queryset.values("pay_status")
-            .annotate(total=Sum("customer_amount"))
-            .order_by()
-        )
+        rollup = self.get_rollup_totals('pay_status')
+        if rollup is not None:
+            total_amount = sum(rollup.values()) or 0
+            status_sums = [{'pay_status': key, 'total': value} for key, value in rollup.items()]
+        else:
+            total_amount = queryset.aggregate(total=Sum("customer_amount"))["total"] or 0
+            status_sums = (
+                queryset.values("pay_status")
+                .annotate(total=Sum("customer_amount"))
+                .order_by()
+            )
         reseult = {
             "total_amount": total_amount,
             "paid_amount": 0,
@@ -482,6 +678,7 @@ class WithdrawRequestViewSet(CustomPaymentSectionViewsets):
     filterset_class = WithdrawRequestFilter
     
     model = WithdrawRequest
+    rollup_kind = 'withdraw'
     create_success_message = "Withdraw Request Submit!"
     update_success_message = "Withdraw Request status update!"
     delete_success_message = "Withdraw Request Deleted!"
@@ -497,12 +694,17 @@ class WithdrawRequestViewSet(CustomPaymentSectionViewsets):
         return [permission() for permission in self.permission_classes]
     
     def get_total_amount(self, queryset):
-        total_amount = queryset.aggregate(total=Sum("amount"))["total"] or 0
-        status_sums = (
-            queryset.values("status")
-            .annotate(total=Sum("amount"))
-            .order_by()
-        )
+        rollup = self.get_rollup_totals('status')
+        if rollup is not None:
+            total_amount = sum(rollup.values()) or 0
+            status_sums = [{'status': key, 'total': value} for key, value in rollup.items()]
+        else:
+            total_amount = queryset.aggregate(total=Sum("amount"))["total"] or 0
+            status_sums = (
+                queryset.values("status")
+                .annotate(total=Sum("amount"))
+                .order_by()
+            )
         reseult = {
             "total_amount": total_amount,
             "pending_amount": 0,
@@ -717,6 +919,7 @@ class PayOutViewSet(CustomPaymentSectionViewsets):
     filterset_class = PaymentTransferFilter
     
     model = PaymentTransfer
+    rollup_kind = 'payout'
     create_success_message = "Payout Created!"
     update_success_message = "Payout Updated!"
     delete_success_message = "Payout Deleted!"
@@ -726,12 +929,17 @@ class PayOutViewSet(CustomPaymentSectionViewsets):
     lookup_field = 'trx_uuid'
     
     def get_total_amount(self, queryset):
-        total_amount = queryset.aggregate(total=Sum("amount"))["total"] or 0
-        status_sums = (
-            queryset.values("status")
-            .annotate(total=Sum("amount"))
-            .order_by()
-        )
+        rollup = self.get_rollup_totals('status')
+        if rollup is not None:
+            total_amount = sum(rollup.values()) or 0
+            status_sums = [{'status': key, 'total': value} for key, value in rollup.items()]
+        else:
+            total_amount = queryset.aggregate(total=Sum("amount"))["total"] or 0
+            status_sums = (
+                queryset.values("status")
+                .annotate(total=Sum("amount"))
+                .order_by()
+            )
         reseult = {
             "total_amount": total_amount,
             "pending_amount": 0,
@@ -802,7 +1010,7 @@ class PayOutViewSet(CustomPaymentSectionViewsets):
             )
         return f"This Payout Request is {object.status}. Can't Delete!", None
 
-class WalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
+class WalletTransactionViewSet(CompiledListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = WalletTransaction.objects.none()
     serializer_class = WalletTransactionSerializer
     pagination_class = CustomPagenumberpagination
@@ -857,6 +1065,7 @@ class WalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
                 }
             )
         
+        rows = self.list_rows(queryset)
         all_items = request.query_params.get('all', 'false').lower() == 'true'
         page_size = request.query_params.get(self.pagination_class.page_size_query_param)
         
@@ -864,12 +1073,12 @@ class WalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
         if all_items or (page_size and page_size.isdigit() and int(page_size)==0):
         # if all_items:
             try:
-                response = self.get_serializer(queryset, many=True)
+                data = self.list_data(rows)
                 return Response(
                     {
                         'status': True,
-                        'count': len(response.data),
-                        'data': response.data
+                        'count': len(data),
+                        'data': data
                     },
                     status=status.HTTP_200_OK
                 )
@@ -882,27 +1091,26 @@ class WalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
         
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(rows)
         if page is not None:
-            response = self.get_serializer(page, many=True)
             return Response(
                 {
                     'status': True,
                     'count': self.paginator.page.paginator.count,
                     'next': self.paginator.get_next_link(),
                     'previous': self.paginator.get_previous_link(),
-                    'data': response.data
+                    'data': self.list_data(page)
                 },
                 status=status.HTTP_200_OK
             )
         else:
             try:
-                response = self.get_serializer(queryset, many=True)
+                data = self.list_data(rows)
                 return Response(
                     {
                         'status': True,
-                        'count': len(response.data),
-                        'data': response.data
+                        'count': len(data),
+                        'data': data
                     },
                     status=status.HTTP_200_OK
                 )
@@ -966,23 +1174,34 @@ def WalletOverView(request):
         
         if getattr(merchant, 'merchant_wallet', None):
             wallet_data = MerchantWalletSerializer(merchant.merchant_wallet).data
-                
-        invoice_total = Invoice.objects.filter(merchant=merchant)\
-            .exclude(status__iexact='delete')\
-            .aggregate(total=Coalesce(Sum('customer_amount'), zero))['total']
         
-        pending_invoice_total = Invoice.objects.filter(merchant=merchant)\
-            .exclude(status__iexact='delete')\
-            .filter(pay_status__in=['pending', 'unpaid'])\
-            .aggregate(total=Coalesce(Sum('customer_amount'), zero))['total']
-        
-        withdraw_total = WithdrawRequest.objects.filter(merchant=merchant)\
-            .exclude(status__iexact='delete')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
-        
-        payout_total = PaymentTransfer.objects.filter(merchant=merchant)\
-            .exclude(status__iexact='delete')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+        if settings.WALLET_ROLLUPS_READ:
+            invoices = rollup_totals('invoice', merchant)
+            invoice_total = sum((v for k, v in invoices.items() if not k.lower().startswith('delete:')), Decimal('0.00'))
+            pending_invoice_total = sum(
+                (v for k, v in invoices.items()
+                 if not k.lower().startswith('delete:') and k.split(':')[1] in ('pending', 'unpaid')),
+                Decimal('0.00'),
+            )
+            withdraw_total = sum((v for k, v in rollup_totals('withdraw', merchant).items() if k.lower() != 'delete'), Decimal('0.00'))
+            payout_total = sum((v for k, v in rollup_totals('payout', merchant).items() if k.lower() != 'delete'), Decimal('0.00'))
+        else:
+            invoice_total = Invoice.objects.filter(merchant=merchant)\
+                .exclude(status__iexact='delete')\
+                .aggregate(total=Coalesce(Sum('customer_amount'), zero))['total']
+            
+            pending_invoice_total = Invoice.objects.filter(merchant=merchant)\
+                .exclude(status__iexact='delete')\
+                .filter(pay_status__in=['pending', 'unpaid'])\
+                .aggregate(total=Coalesce(Sum('customer_amount'), zero))['total']
+            
+            withdraw_total = WithdrawRequest.objects.filter(merchant=merchant)\
+                .exclude(status__iexact='delete')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+            
+            payout_total = PaymentTransfer.objects.filter(merchant=merchant)\
+                .exclude(status__iexact='delete')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
         
         dashboard = {
             "invoice_amount": invoice_total,
@@ -1020,19 +1239,27 @@ def WalletOverView(request):
         }
         return Response({'status': True, 'wallet': None, 'dashboard_accountant_card': dashboard})
     elif role == "admin":        
-        withdraw_total = WithdrawRequest.objects.exclude(status__iexact='delete')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+        if settings.WALLET_ROLLUPS_READ:
+            withdraws = rollup_totals('withdraw')
+            payouts = rollup_totals('payout')
+            withdraw_total = sum((v for k, v in withdraws.items() if k.lower() != 'delete'), Decimal('0.00'))
+            payout_total = sum((v for k, v in payouts.items() if k.lower() != 'delete'), Decimal('0.00'))
+            pending_withdraw_total = sum((v for k, v in withdraws.items() if k.lower() == 'pending'), Decimal('0.00'))
+            pending_payout_total = sum((v for k, v in payouts.items() if k.lower() == 'pending'), Decimal('0.00'))
+        else:
+            withdraw_total = WithdrawRequest.objects.exclude(status__iexact='delete')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
 
-        payout_total = PaymentTransfer.objects.exclude(status__iexact='delete')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+            payout_total = PaymentTransfer.objects.exclude(status__iexact='delete')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
 
-        pending_withdraw_total = WithdrawRequest.objects.filter(status__iexact='pending')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+            pending_withdraw_total = WithdrawRequest.objects.filter(status__iexact='pending')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
 
-        pending_payout_total = PaymentTransfer.objects.filter(status__iexact='pending')\
-            .aggregate(total=Coalesce(Sum('amount'), zero))['total']
+            pending_payout_total = PaymentTransfer.objects.filter(status__iexact='pending')\
+                .aggregate(total=Coalesce(Sum('amount'), zero))['total']
 
-        wallet_fee_total = WalletTransaction.objects.aggregate(total=Coalesce(Sum('fee'), zero))['total']
+        wallet_fee_total, wallet_fee_by_bucket = platform_revenue()
 
         dashboard = {
             "withdrawrequest_amount": withdraw_total,
@@ -1040,6 +1267,7 @@ def WalletOverView(request):
             "pending_withdrawrequest_amount": pending_withdraw_total,
             "pending_paymenttransfer_amount": pending_payout_total,
             "wallettransaction_fee_amount": wallet_fee_total,
+            "wallettransaction_fee_by_bucket": wallet_fee_by_bucket,
         }
 
         return Response({
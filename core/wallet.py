@@ -0,0 +1,483 @@
+from authentication.models import MerchantWallet
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db.models import F, Q, Sum, OuterRef, Subquery, DecimalField
+from django.db.models.functions import Coalesce
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from collections import namedtuple
+from decimal import Decimal
+import random, uuid
+
+
+WALLET_FIELDS = ('balance', 'withdraw_processing', 'total_withdraw')
+
+
+# ========================================Wallet Totals Start===================================
+class WalletTotals(namedtuple('WalletTotals', WALLET_FIELDS)):
+    __slots__ = ()
+
+    @property
+    def available_balance(self):
+        return (self.balance or 0) - (self.withdraw_processing or 0)
+
+
+def _side_rows_sum(model, field, **filters):
+    rows = (model.objects
+            .filter(wallet=OuterRef('pk'), **filters)
+            .values('wallet')
+            .annotate(total=Sum(field))
+            .values('total'))
+    return Coalesce(Subquery(rows), Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _side_rows(wallet):
+    from .models import WalletLedgerEntry, MerchantWalletShard
+    if wallet.storage_mode == 'ledger':
+        return WalletLedgerEntry, {'compacted': False}
+    if wallet.storage_mode == 'sharded':
+        return MerchantWalletShard, {}
+    return None, None
+
+
+def wallet_totals(wallet, lock=False):
+    """
+    Row wallets are read straight from the instance. Ledger and sharded
+    wallets add the uncompacted entries / shard counters to the wallet row in
+    a single statement, so a compaction committing in between can not be
+    counted twice or missed.
+    """
+    model, filters = _side_rows(wallet)
+    if model is None:
+        return WalletTotals(*(getattr(wallet, name) for name in WALLET_FIELDS))
+
+    qs = MerchantWallet.objects.filter(pk=wallet.pk)
+    if lock:
+        qs = qs.select_for_update()
+    row = qs.annotate(**{
+        f"side_{name}": _side_rows_sum(model, name, **filters) for name in WALLET_FIELDS
+    }).values(*WALLET_FIELDS, *(f"side_{name}" for name in WALLET_FIELDS)).get()
+    return WalletTotals(*(row[name] + row[f"side_{name}"] for name in WALLET_FIELDS))
+
+# ========================================Wallet Totals End===================================
+
+
+# ========================================Wallet Mutation Start===================================
+def wallet_mutation(wallet):
+    if wallet is None:
+        raise ValidationError("Wallet is required for a transaction.")
+    if wallet.storage_mode == 'ledger':
+        return LedgerWalletMutation(wallet)
+    if wallet.storage_mode == 'sharded':
+        return ShardedWalletMutation(wallet)
+    return WalletMutation(wallet.pk)
+
+
+class WalletMutation:
+    """
+    Applies balance changes for one WalletTransaction write.
+
+    The wallet row is locked once with select_for_update and every change is
+    issued as a single F() UPDATE, guarded in the WHERE clause where the old code
+    compared the in-memory balance, so concurrent writers can no longer lose updates.
+    """
+    def __init__(self, wallet_id):
+        try:
+            self.wallet = MerchantWallet.objects.select_for_update().get(pk=wallet_id)
+        except MerchantWallet.DoesNotExist:
+            raise ValidationError("Wallet is required for a transaction.")
+        self.balance_before = self.wallet.balance
+
+    @property
+    def balance_after(self):
+        return self.wallet.balance
+
+    def _guard_q(self, guard):
+        field, minimum = guard
+        if field == 'available_balance':
+            return Q(balance__gte=F('withdraw_processing') + minimum)
+        return Q(**{f"{field}__gte": minimum})
+
+    def _update_row(self, guard=None, message=None, **deltas):
+        qs = MerchantWallet.objects.filter(pk=self.wallet.pk)
+        if guard is not None:
+            qs = qs.filter(self._guard_q(guard))
+        updated = qs.update(**{name: F(name) + delta for name, delta in deltas.items()})
+        if not updated:
+            raise ValidationError(message or "Wallet update failed.")
+
+    def _apply(self, guard=None, message=None, **deltas):
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self._update_row(guard, message, **deltas)
+        for name, delta in deltas.items():
+            setattr(self.wallet, name, getattr(self.wallet, name) + delta)
+
+    def finish(self, trx_uuid):
+        pass
+
+    # ------- debit -------
+    def hold(self, amount):
+        self._apply(
+            guard=('balance', amount),
+            message="Insufficient available balance to place a pending hold.",
+            balance=-amount, withdraw_processing=amount,
+        )
+
+    def debit(self, amount):
+        self._apply(
+            guard=('balance', amount),
+            message="Insufficient balance for successful debit.",
+            balance=-amount, total_withdraw=amount,
+        )
+
+    def adjust_hold(self, diff):
+        self._apply(
+            guard=('available_balance', diff) if diff > 0 else None,
+            message="Insufficient available balance to increase pending hold.",
+            balance=-diff, withdraw_processing=diff,
+        )
+
+    def settle_hold(self, amount):
+        self._apply(withdraw_processing=-amount, total_withdraw=amount)
+
+    def release_hold(self, amount):
+        self._apply(withdraw_processing=-amount, balance=amount)
+
+    # ------- credit -------
+    def credit(self, amount):
+        self._apply(balance=amount)
+
+
+class SnapshotWalletMutation(WalletMutation):
+    """
+    Base for wallets whose totals are the wallet row plus side rows. Guarded
+    changes lock the wallet row and check the combined totals in Python; the
+    row lock keeps two debits from both passing the check, and credits only
+    ever add to the side rows so they can not invalidate it.
+    """
+    def __init__(self, wallet):
+        self.wallet = wallet
+        self.totals = None
+        self.balance_before = None
+
+    @property
+    def balance_after(self):
+        return self.totals.balance if self.totals else None
+
+    def _lock_totals(self):
+        if self.totals is None:
+            self.totals = wallet_totals(self.wallet, lock=True)
+            self.balance_before = self.totals.balance
+
+    def _check(self, guard, message):
+        self._lock_totals()
+        field, minimum = guard
+        if getattr(self.totals, field) < minimum:
+            raise ValidationError(message or "Wallet update failed.")
+
+    def _track(self, deltas):
+        if self.totals is not None:
+            self.totals = self.totals._replace(**{
+                name: getattr(self.totals, name) + delta for name, delta in deltas.items()
+            })
+
+
+class LedgerWalletMutation(SnapshotWalletMutation):
+    """
+    Ledger mode: each change is appended as a WalletLedgerEntry instead of
+    rewriting the wallet row, so credits are plain inserts.
+    """
+    def __init__(self, wallet):
+        super().__init__(wallet)
+        self.entries = []
+
+    def _apply(self, guard=None, message=None, **deltas):
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if guard is not None:
+            self._check(guard, message)
+        self._track(deltas)
+        self.entries.append(deltas)
+
+    def finish(self, trx_uuid):
+        from .models import WalletLedgerEntry
+        WalletLedgerEntry.objects.bulk_create([
+            WalletLedgerEntry(wallet_id=self.wallet.pk, trx_uuid=trx_uuid, **{
+                name: delta.get(name, Decimal('0')) for name in WALLET_FIELDS
+            })
+            for delta in self.entries
+        ])
+        self.entries = []
+
+
+class ShardedWalletMutation(SnapshotWalletMutation):
+    """
+    Sharded mode: credits go to a random MerchantWalletShard row, everything
+    else is applied to the locked wallet row after checking row + shards.
+    """
+    def _apply(self, guard=None, message=None, **deltas):
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if guard is not None:
+            self._check(guard, message)
+        else:
+            self._lock_totals()
+        self._update_row(**deltas)
+        self._track(deltas)
+
+    def credit(self, amount):
+        if not amount:
+            return
+        credit_shard(self.wallet, amount)
+        self._track({'balance': amount})
+
+
+def credit_shard(wallet, amount, shard_no=None):
+    from .models import MerchantWalletShard
+    if shard_no is None:
+        shard_no = random.randrange(max(wallet.shard_count, 1))
+    shard = MerchantWalletShard.objects.filter(wallet_id=wallet.pk, shard_no=shard_no)
+    if shard.update(balance=F('balance') + amount):
+        return
+    try:
+        with transaction.atomic():
+            MerchantWalletShard.objects.create(wallet_id=wallet.pk, shard_no=shard_no, balance=amount)
+    except IntegrityError:
+        shard.update(balance=F('balance') + amount)
+
+
+def compact_wallet_ledger(wallet_id, batch_size=5000):
+    """
+    Folds up to batch_size uncompacted ledger entries into the wallet row
+    (the snapshot) and returns how many were folded.
+    """
+    from .models import WalletLedgerEntry
+    with transaction.atomic():
+        MerchantWallet.objects.select_for_update().filter(pk=wallet_id).values_list('pk').get()
+        entry_ids = list(
+            WalletLedgerEntry.objects.select_for_update()
+            .filter(wallet_id=wallet_id, compacted=False)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not entry_ids:
+            return 0
+        entries = WalletLedgerEntry.objects.filter(id__in=entry_ids)
+        sums = entries.aggregate(**{name: Coalesce(Sum(name), Decimal('0')) for name in WALLET_FIELDS})
+        MerchantWallet.objects.filter(pk=wallet_id).update(**{name: F(name) + sums[name] for name in WALLET_FIELDS})
+        entries.update(compacted=True)
+        return len(entry_ids)
+
+
+def fold_wallet_shards(wallet_id):
+    """
+    Moves shard counters back into the wallet row. Needed after a wallet is
+    switched from sharded back to another storage mode.
+    """
+    from .models import MerchantWalletShard
+    with transaction.atomic():
+        MerchantWallet.objects.select_for_update().filter(pk=wallet_id).values_list('pk').get()
+        shards = MerchantWalletShard.objects.select_for_update().filter(wallet_id=wallet_id)
+        sums = shards.aggregate(**{name: Coalesce(Sum(name), Decimal('0')) for name in WALLET_FIELDS})
+        folded = shards.count()
+        if folded:
+            MerchantWallet.objects.filter(pk=wallet_id).update(**{name: F(name) + sums[name] for name in WALLET_FIELDS})
+            shards.delete()
+        return folded
+
+# ========================================Wallet Mutation End===================================
+
+
+# ========================================Batched Credits Start===================================
+def apply_pending_credits(merchant_id, batch_size=500):
+    """
+    Applies up to batch_size queued invoice credits of one merchant with a
+    single wallet update and one bulk_create of WalletTransactions. Returns
+    the number of credits applied.
+    """
+    from .models import PendingWalletCredit, WalletTransaction, Invoice
+    from .fees import fee_policy
+    from .revenue import record_platform_fee
+    from .rollups import shift_rollup
+    from django.contrib.contenttypes.models import ContentType
+    invoice_type = ContentType.objects.get_for_model(Invoice)
+
+    with transaction.atomic():
+        pending = list(
+            PendingWalletCredit.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('merchant', 'invoice')
+            .filter(merchant_id=merchant_id, applied_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not pending:
+            return 0
+
+        already_credited = set(
+            WalletTransaction.objects.filter(
+                content_type=invoice_type,
+                object_id__in=[credit.invoice_id for credit in pending],
+            ).values_list('object_id', flat=True)
+        )
+        merchant = pending[0].merchant
+        wallet = MerchantWallet.objects.get(merchant_id=merchant_id)
+
+        credits = [credit for credit in pending if credit.invoice_id not in already_credited]
+        fees = fee_policy(merchant).fees('deposit', [credit.amount for credit in credits])
+        transactions = [
+            WalletTransaction(
+                wallet=wallet, merchant=merchant,
+                content_type=invoice_type, object_id=credit.invoice_id,
+                amount=credit.amount, fee=fee, net_amount=credit.amount - fee,
+                method=credit.method, trx_id=credit.trx_id,
+                status='success', tran_type='credit', trx_uuid=uuid.uuid4().hex,
+            )
+            for credit, fee in zip(credits, fees)
+        ]
+
+        if transactions:
+            mutation = wallet_mutation(wallet)
+            mutation.credit(sum((trx.net_amount for trx in transactions), Decimal('0')))
+            mutation.finish(uuid.uuid4().hex)
+
+            # Running balances are only known for row wallets; ledger and
+            # sharded wallets leave them empty like their single credits do.
+            running = mutation.balance_before
+            for trx in transactions:
+                if running is None:
+                    break
+                trx.previous_balance = running
+                running += trx.net_amount
+                trx.current_balance = running
+            WalletTransaction.objects.bulk_create(transactions)
+            record_platform_fee('deposit', sum(fees, Decimal('0')), count=len(transactions))
+
+            # The invoices were rolled up as paid when saved; only their fees were left to book.
+            booked = {}
+            for credit, fee in zip(credits, fees):
+                key = (timezone.localdate(credit.invoice.created_at), credit.invoice.rollup_status())
+                booked[key] = booked.get(key, Decimal('0')) + fee
+            for (day, status), fee in booked.items():
+                state = (status, Decimal('0'))
+                shift_rollup(merchant_id, day, 'invoice', state, state, fee=fee)
+
+        PendingWalletCredit.objects.filter(pk__in=[credit.pk for credit in pending]).update(applied_at=timezone.now())
+        return len(pending)
+
+# ========================================Batched Credits End===================================
+
+
+# ========================================Wallet Replay Start===================================
+ZERO = Decimal('0')
+
+
+def transaction_effect(tran_type, status, amount, net_amount):
+    """
+    Net (balance, withdraw_processing, total_withdraw) change a transaction
+    in its current state has left on the wallet, following the transitions
+    in WalletTransaction.save: a pending debit is a hold, a successful one
+    is withdrawn (directly or by settling the hold), a failed one released
+    its hold, and only successful credits add their net amount.
+    """
+    tran_type = (tran_type or '').lower()
+    status = (status or '').lower()
+    if tran_type == 'debit':
+        if status == 'pending':
+            return -amount, amount, ZERO
+        if status == 'success':
+            return -amount, ZERO, amount
+    elif tran_type == 'credit' and status == 'success':
+        return net_amount or ZERO, ZERO, ZERO
+    return ZERO, ZERO, ZERO
+
+
+def replay_wallet(wallet_id, chunk_size=5000):
+    """
+    Streams the wallet's transactions and returns (rows, WalletTotals) for
+    the state they imply.
+    """
+    from .models import WalletTransaction
+    rows = 0
+    balance = withdraw_processing = total_withdraw = ZERO
+    transactions = (WalletTransaction.objects
+                    .filter(wallet_id=wallet_id)
+                    .values_list('tran_type', 'status', 'amount', 'net_amount')
+                    .iterator(chunk_size=chunk_size))
+    for tran_type, status, amount, net_amount in transactions:
+        b, wp, tw = transaction_effect(tran_type, status, amount, net_amount)
+        balance += b
+        withdraw_processing += wp
+        total_withdraw += tw
+        rows += 1
+    return rows, WalletTotals(balance, withdraw_processing, total_withdraw)
+
+
+def repair_wallet(wallet_id, chunk_size=5000):
+    """
+    Re-replays the wallet under its row lock and moves the wallet row by the
+    drift, so ledger entries and shard counters stay as they are. Returns
+    the drift that was applied.
+    """
+    with transaction.atomic():
+        wallet = MerchantWallet.objects.select_for_update().get(pk=wallet_id)
+        rows, expected = replay_wallet(wallet_id, chunk_size)
+        actual = wallet_totals(wallet)
+        drift = {name: getattr(expected, name) - getattr(actual, name) for name in WALLET_FIELDS}
+        if any(drift.values()):
+            MerchantWallet.objects.filter(pk=wallet_id).update(**{
+                name: F(name) + delta for name, delta in drift.items() if delta
+            })
+        return WalletTotals(**drift)
+
+# ========================================Wallet Replay End===================================
+
+
+# ========================================Invoice Credit Start===================================
+def credit_invoice(invoice):
+    """
+    Credits a paid invoice to its merchant's wallet at most once, keyed by
+    (content_type, object_id) like uniq_wallet_txn_per_service. A repeated
+    call costs one indexed lookup and returns the existing transaction; an
+    insert that loses a race is rolled back to a savepoint instead of
+    breaking the caller's transaction. Returns None when the credit is
+    queued for apply_wallet_credits instead.
+    """
+    from .models import WalletTransaction, PendingWalletCredit
+    from django.contrib.contenttypes.models import ContentType
+    content_type = ContentType.objects.get_for_model(invoice)
+    existing = WalletTransaction.objects.filter(content_type=content_type, object_id=invoice.pk).first()
+    if existing is not None:
+        return existing
+
+    if settings.WALLET_CREDIT_BATCHING:
+        PendingWalletCredit.objects.get_or_create(
+            invoice=invoice,
+            defaults={
+                'merchant': invoice.merchant,
+                'amount': invoice.customer_amount,
+                'method': invoice.method,
+                'trx_id': invoice.transaction_id,
+            }
+        )
+        return None
+
+    try:
+        with transaction.atomic():
+            return WalletTransaction.objects.create(
+                wallet=invoice.merchant.merchant_wallet,
+                merchant=invoice.merchant,
+                content_type=content_type,
+                object_id=invoice.pk,
+                amount=invoice.customer_amount,
+                method=invoice.method,
+                status='success',
+                trx_id=invoice.transaction_id,
+                tran_type='credit',
+            )
+    except IntegrityError:
+        return WalletTransaction.objects.get(content_type=content_type, object_id=invoice.pk)
+
+# ========================================Invoice Credit End===================================
@@ -42,6 +42,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "authentication.throttling.RateLimitMiddleware",
 ]
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
@@ -52,12 +53,12 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 ENABLE_BROWSABLE_API = os.getenv('ENABLE_BROWSABLE_API', 'False') == 'True'
 if ENABLE_BROWSABLE_API:
     DEFAULT_RENDERER_CLASSES_ = [
-        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ]
 else:
     DEFAULT_RENDERER_CLASSES_ = [
-        'rest_framework.renderers.JSONRenderer'
+        'core.renderers.FastJSONRenderer'
     ]
 
 REST_FRAMEWORK = {
@@ -84,6 +85,114 @@ REST_FRAMEWORK = {
 }
 
 
+# Shared cache: Redis when REDIS_URL is set, otherwise per-process memory.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Payment API credentials: seconds in the shared cache, and seconds / entries
+# in each process's LRU in front of it.
+API_CREDENTIAL_CACHE_TTL = int(os.getenv('API_CREDENTIAL_CACHE_TTL', '300'))
+API_CREDENTIAL_LOCAL_TTL = int(os.getenv('API_CREDENTIAL_LOCAL_TTL', '30'))
+API_CREDENTIAL_LOCAL_SIZE = int(os.getenv('API_CREDENTIAL_LOCAL_SIZE', '1024'))
+
+# Seconds an open invoice's checkout page (get-payment/) and status entry stay
+# cached. Any change to the invoice voids them at once (see core.checkout);
+# this bounds merchant branding changes and anything that slips past that.
+CHECKOUT_SESSION_TTL = int(os.getenv('CHECKOUT_SESSION_TTL', '60'))
+# Seconds a paid / failed / cancelled invoice's status entry stays cached; it
+# never changes, and clients keep it themselves (Cache-Control: immutable).
+CHECKOUT_TERMINAL_TTL = int(os.getenv('CHECKOUT_TERMINAL_TTL', str(24 * 60 * 60)))
+
+# Seconds a payment API Idempotency-Key (and its stored response) is kept.
+# `manage.py expire_idempotency_keys` deletes the expired ones.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+
+# Most invoices accepted by one payment/create/bulk/ call.
+BULK_INVOICE_MAX_ITEMS = int(os.getenv('BULK_INVOICE_MAX_ITEMS', '500'))
+
+# Most payouts accepted by one payment/payout/batch/ call.
+BULK_PAYOUT_MAX_ITEMS = int(os.getenv('BULK_PAYOUT_MAX_ITEMS', '1000'))
+
+# Route the checkout pages (get-payment/, get-payment/bkash/, the bKash
+# callback and payment/verify/) to native async views. Only useful when
+# served by an ASGI server (zeonixpay.asgi); bKash calls then share one
+# httpx pool of up to BKASH_ASYNC_MAX_CONNECTIONS per process.
+ASYNC_CHECKOUT = os.getenv('ASYNC_CHECKOUT', 'False').strip().lower() in ('true', '1', 'yes')
+BKASH_ASYNC_MAX_CONNECTIONS = int(os.getenv('BKASH_ASYNC_MAX_CONNECTIONS', '500'))
+
+# BKashClient keeps one pooled keep-alive session per gateway in each worker.
+# Status queries are retried (with jittered backoff) up to BKASH_QUERY_RETRIES
+# times; create, execute and refund are never retried.
+BKASH_POOLED_SESSIONS = os.getenv('BKASH_POOLED_SESSIONS', 'True').strip().lower() in ('true', '1', 'yes')
+BKASH_POOL_SIZE = int(os.getenv('BKASH_POOL_SIZE', '20'))
+BKASH_CONNECT_TIMEOUT = float(os.getenv('BKASH_CONNECT_TIMEOUT', '5'))
+BKASH_READ_TIMEOUT = float(os.getenv('BKASH_READ_TIMEOUT', '30'))
+BKASH_QUERY_RETRIES = int(os.getenv('BKASH_QUERY_RETRIES', '2'))
+BKASH_RETRY_BACKOFF = float(os.getenv('BKASH_RETRY_BACKOFF', '0.2'))
+
+# Per-gateway circuit breaker (core.payment.breaker). A gateway whose calls in
+# the last GATEWAY_BREAKER_WINDOW seconds fail (5xx, 401/403/429, no answer)
+# or are slow at these rates is skipped by rotation for the cooldown, then
+# probed with a single checkout.
+GATEWAY_BREAKER_WINDOW = int(os.getenv('GATEWAY_BREAKER_WINDOW', '60'))
+GATEWAY_BREAKER_BUCKET = int(os.getenv('GATEWAY_BREAKER_BUCKET', '10'))
+GATEWAY_BREAKER_MIN_CALLS = int(os.getenv('GATEWAY_BREAKER_MIN_CALLS', '10'))
+GATEWAY_BREAKER_FAILURE_RATE = float(os.getenv('GATEWAY_BREAKER_FAILURE_RATE', '0.5'))
+GATEWAY_BREAKER_SLOW_MS = int(os.getenv('GATEWAY_BREAKER_SLOW_MS', '5000'))
+GATEWAY_BREAKER_SLOW_RATE = float(os.getenv('GATEWAY_BREAKER_SLOW_RATE', '0.8'))
+GATEWAY_BREAKER_COOLDOWN = int(os.getenv('GATEWAY_BREAKER_COOLDOWN', '30'))
+
+# Seconds a worker keeps its in-process gateway snapshot (core.payment.registry)
+# at most; saving or deleting a gateway swaps it in every worker right away.
+GATEWAY_REGISTRY_TTL = int(os.getenv('GATEWAY_REGISTRY_TTL', '300'))
+
+# Token-bucket limits for the payment API (per API-KEY; Merchant.rate_limit_*
+# override the defaults; unknown or not yet cached keys share a bucket per
+# client IP) and for SMS device uploads (per X-Device-Key).
+API_RATE_LIMIT_ENABLED = os.getenv('API_RATE_LIMIT_ENABLED', 'True').strip().lower() in ('true', '1', 'yes')
+API_RATE_LIMIT_PER_MINUTE = int(os.getenv('API_RATE_LIMIT_PER_MINUTE', '600'))
+API_RATE_LIMIT_BURST = int(os.getenv('API_RATE_LIMIT_BURST', '100'))
+API_RATE_LIMITED_VIEWS = ('create-payment', 'create-payment-bulk', 'payment-payout', 'payment-payout-batch', 'payment-payout-batch-detail')
+DEVICE_RATE_LIMIT_PER_MINUTE = int(os.getenv('DEVICE_RATE_LIMIT_PER_MINUTE', '120'))
+DEVICE_RATE_LIMIT_BURST = int(os.getenv('DEVICE_RATE_LIMIT_BURST', '30'))
+DEVICE_RATE_LIMITED_VIEWS = ('store-payment-message-create',)
+
+# Queue paid-invoice credits in PendingWalletCredit and apply them in batches
+# with `manage.py apply_wallet_credits` instead of inside the payment callback.
+WALLET_CREDIT_BATCHING = os.getenv('WALLET_CREDIT_BATCHING', 'False').strip().lower() in ('true', '1', 'yes')
+
+# Write invoice / payout / withdraw side effects (invoice credit, rollups) to
+# OutboxEvent and run them with `manage.py drain_outbox` instead of inline.
+OUTBOX_SIDE_EFFECTS = os.getenv('OUTBOX_SIDE_EFFECTS', 'False').strip().lower() in ('true', '1', 'yes')
+
+# Serve list totals and dashboard cards from the WalletRollup table when the
+# filter covers whole days. A database with rows from before the table
+# existed runs `manage.py rebuild_wallet_rollups` once, or sets this to False
+# until then.
+WALLET_ROLLUPS_READ = os.getenv('WALLET_ROLLUPS_READ', 'True').strip().lower() in ('true', '1', 'yes')
+
+# Serve the admin dashboard's fee revenue from PlatformRevenueAccount. A
+# database with fees from before the account existed runs
+# `manage.py rebuild_platform_revenue` once, or sets this to False until then.
+PLATFORM_REVENUE_READ = os.getenv('PLATFORM_REVENUE_READ', 'True').strip().lower() in ('true', '1', 'yes')
+
+# Build list responses from values_list() rows with a per-serializer plan
+# (core.compiled) instead of instantiating and serializing every model.
+COMPILED_LIST_SERIALIZERS = os.getenv('COMPILED_LIST_SERIALIZERS', 'True').strip().lower() in ('true', '1', 'yes')
+
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'BLACKLIST_AFTER_ROTATION': True,
@@ -157,6 +266,14 @@ DATABASES = {
         "PORT": os.getenv("DB_PORT", ""),
     }
 }
+if DB_ENGINE == "sqlite":
+    DATABASES["default"]["OPTIONS"] = {"timeout": 20}
+    if ASYNC_CHECKOUT:
+        # The ASGI checkout runs many saves at once. Taking SQLite's write lock
+        # when a transaction begins makes them wait for it instead of failing
+        # with "database is locked" when a read turns into a write; it also
+        # makes read-only transactions take the lock, so it is only used here.
+        DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
 
 
 # Password validation